@@ -29,3 +29,66 @@ const.JSONFILENAME = 'qazwsxedcrfvtgbyhnujmiopkl' + '.json'
 
 # 算子运行产生的中间数据
 const.MIDDATA = '/home/zk/midData/'
+
+# 算子中间数据的存储格式（parquet：列式存储，保留schema，由executor并行写出；csv：仅用于导出）
+const.MIDDATA_FORMAT = 'parquet'
+
+# 执行 model 时并行执行算子的线程数
+const.EXECUTE_WORKERS = 3
+
+# spark
+const.SPARK_APP_NAME = 'Easy_Data'
+const.SPARK_MASTER = 'local[*]'
+# const.SPARK_MASTER = 'spark://10.108.211.130:7077'
+
+# 算子结果缓存：算子类型、参数、父算子结果、输入文件都没有变化时，直接复用上次的结果
+const.OPERATOR_CACHE = True
+
+# 数据分页预览：csv 每隔多少行记录一次字节偏移；最多缓存多少个文件的索引
+const.PREVIEW_INDEX_STEP = 1000
+const.PREVIEW_INDEX_CACHE_SIZE = 64
+
+# 数据文件元数据：推断列类型时读取的行数；最多缓存多少个文件的元数据
+const.METADATA_SAMPLE_ROWS = 10000
+const.METADATA_CACHE_SIZE = 256
+
+# 探索算子：数据超过该大小（字节）时用 spark 计算，否则在 driver 上用 pandas 计算
+const.EXPLORATION_SPARK_THRESHOLD = 1024 * 1024 * 1024
+# spark 计算分位数（approxQuantile）的相对误差
+const.EXPLORATION_QUANTILE_ERROR = 0.001
+
+# pandas 分块读取数据时每块的行数
+const.PANDAS_CHUNK_ROWS = 200000
+
+# 频次统计：返回频率最高的多少个值；不同值不超过 EXACT_LIMIT 个时精确计数，超过后改用 SKETCH_SIZE 个计数器的 Misra-Gries 摘要
+const.FREQUENCY_TOP_K = 1000
+const.FREQUENCY_EXACT_LIMIT = 100000
+const.FREQUENCY_SKETCH_SIZE = 10000
+# 估计不同值个数（HyperLogLog）的寄存器个数为 2^PRECISION，相对误差约 1.04/sqrt(2^PRECISION)
+const.FREQUENCY_HLL_PRECISION = 14
+
+# 散点图默认抽样点数
+const.SCATTER_SAMPLE_SIZE = 50
+# 数据超过 EXPLORATION_SPARK_THRESHOLD 时，肯德尔相关系数（spark 不支持）由随机抽样的多少行计算
+const.CORRELATION_KENDALL_SAMPLE_ROWS = 10000
+
+# 算子执行状态批量写入数据库的间隔（秒）
+const.OPERATOR_STATUS_FLUSH_INTERVAL = 1
+
+# 同时执行的 model 个数（其余排队）；每个用户同时执行的 model 个数
+const.EXECUTE_MAX_JOBS = 2
+const.EXECUTE_MAX_JOBS_PER_USER = 1
+
+# 执行状态推送（/model/runStatusStream）没有事件时发送心跳的间隔（秒）
+const.EVENT_STREAM_HEARTBEAT = 15
+
+# 机器学习组装特征向量、标签转索引时对无效值（空值、非数值）的处理：'keep' 保留为 NaN / 额外的索引，'skip' 丢弃该行，'error' 报错
+# 训练、评估时报错（保留 NaN 会训练出 NaN 模型，GBDT 的空标签会多出一个类别）；预测时保留该行，预测结果与输入行一一对应
+const.ML_TRAIN_HANDLE_INVALID = 'error'
+const.ML_PREDICT_HANDLE_INVALID = 'keep'
+
+# 已加载模型的缓存（预测、评估复用），按模型目录的总大小（字节）淘汰最久未使用的模型
+const.MODEL_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# 支持向量机批量打分时每批的行数（每个分区按批做一次矩阵乘法）
+const.SVM_SCORE_BATCH_ROWS = 10000
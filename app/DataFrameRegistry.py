@@ -0,0 +1,226 @@
+# -*- coding: UTF-8 -*-
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from pyspark import StorageLevel
+
+"""
+一次 model（执行流程）运行内的 DataFrame 注册表
+
+父算子的输出 DataFrame 按 (operator_id, 输出序号) 登记，子算子直接拿到父算子的 DataFrame，
+不必再从磁盘读取；输出数据的落盘在后台线程中异步进行，执行结束时统一等待。
+"""
+
+# 当前线程正在执行的算子（save_data / read_data 通过它找到注册表）
+_local = threading.local()
+
+
+class DataFrameRegistry(object):
+    """
+    DataFrame 注册表，每次执行 model 时新建一个
+    """
+
+    def __init__(self, max_writers=2, fuse=False, preview_ids=None):
+        """
+        :param max_writers: 后台落盘线程数
+        :param fuse: 是否融合执行：线性链路中间的算子不落盘，整条链路由 spark 作为一个执行计划优化
+        :param preview_ids: 融合执行时仍需保存结果（用户要查看）的算子
+        """
+        self.fuse = fuse
+        self.preview_ids = set(preview_ids or [])
+        # 融合执行、未落盘的算子
+        self.fused_ids = set()
+        self.lock = threading.Lock()
+        # (operator_id, index) -> {'df', 'file_url', 'remaining', 'persisted', 'future'}
+        self.entries = {}
+        # file_url -> (operator_id, index)
+        self.url_keys = {}
+        # 落盘失败的算子 operator_id -> 错误信息
+        self.errors = {}
+        # 算子内容哈希 operator_id -> OperatorCache.id，子算子的哈希由父算子的哈希计算
+        self.operator_hashes = {}
+        # 算子的落盘任务 operator_id -> [Future]
+        self.write_futures = {}
+        self.writer = ThreadPoolExecutor(max_writers)
+
+    def register(self, operator_id, index, file_url, df, consumers, write_func=None):
+        """
+        登记算子的一个输出
+        :param operator_id:
+        :param index: 第几个输出（从0开始）
+        :param file_url: 输出数据的保存地址
+        :param df: 输出数据
+        :param consumers: 使用者个数（子算子个数 + 落盘）,多于一个时 persist，避免重复计算
+        :param write_func: 落盘函数，None 表示不落盘
+        :return:
+        """
+        key = (operator_id, index)
+        entry = {'df': df, 'file_url': file_url, 'remaining': consumers, 'persisted': False, 'future': None}
+        if consumers > 1:
+            df.persist(StorageLevel.MEMORY_AND_DISK)
+            entry['persisted'] = True
+        with self.lock:
+            self.entries[key] = entry
+            if file_url:
+                self.url_keys[file_url] = key
+        if write_func is not None:
+            entry['future'] = self.writer.submit(self._materialize, key, write_func)
+            with self.lock:
+                self.write_futures.setdefault(operator_id, []).append(entry['future'])
+        else:
+            with self.lock:
+                self.fused_ids.add(operator_id)
+
+    def _materialize(self, key, write_func):
+        """
+        后台落盘
+        """
+        try:
+            write_func()
+        except Exception as e:
+            traceback.print_exc()
+            with self.lock:
+                self.errors[key[0]] = '数据保存失败：' + str(e)
+        finally:
+            self.release(key)
+
+    def get(self, operator_id, index):
+        """
+        获取算子的第 index 个输出，没有则返回 None
+        :param operator_id:
+        :param index:
+        :return:
+        """
+        key = (operator_id, index)
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.release(key)
+        return entry['df']
+
+    def get_by_url(self, file_url):
+        """
+        通过输出地址获取 DataFrame，没有则返回 None
+        :param file_url:
+        :return:
+        """
+        with self.lock:
+            key = self.url_keys.get(file_url)
+        if key is None:
+            return None
+        return self.get(key[0], key[1])
+
+    def wait_url(self, file_url):
+        """
+        等待某个输出落盘完成（需要直接读文件的算子，如 pandas 读取）
+        :param file_url:
+        :return:
+        """
+        with self.lock:
+            key = self.url_keys.get(file_url)
+            entry = self.entries.get(key) if key is not None else None
+        if entry is not None and entry['future'] is not None:
+            entry['future'].result()
+
+    def when_written(self, operator_id, callback):
+        """
+        算子的所有输出落盘完成后调用 callback（在落盘线程中调用；落盘失败时不调用，由执行结束时统一标记错误）
+        :param operator_id:
+        :param callback:
+        :return: 是否有未完成的落盘，没有时不调用 callback
+        """
+        with self.lock:
+            futures = [x for x in self.write_futures.get(operator_id, []) if not x.done()]
+        if not futures:
+            return False
+        remaining = [len(futures)]
+
+        def done(future):
+            with self.lock:
+                remaining[0] -= 1
+                call = remaining[0] == 0 and operator_id not in self.errors
+            if call:
+                callback()
+
+        for future in futures:
+            future.add_done_callback(done)
+        return True
+
+    def release(self, key):
+        """
+        使用者减一，全部使用完毕后 unpersist
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return
+            entry['remaining'] -= 1
+            unpersist = entry['persisted'] and entry['remaining'] <= 0
+            if unpersist:
+                entry['persisted'] = False
+        if unpersist:
+            entry['df'].unpersist()
+
+    def close(self):
+        """
+        执行结束：等待所有落盘完成，释放缓存
+        :return: 落盘失败的算子 {operator_id: 错误信息}
+        """
+        self.writer.shutdown(wait=True)
+        with self.lock:
+            entries = list(self.entries.values())
+            self.entries.clear()
+            self.url_keys.clear()
+        for entry in entries:
+            if entry['persisted']:
+                entry['df'].unpersist()
+        return self.errors
+
+
+def bind(registry, operator_id, consumers, materialize=True):
+    """
+    当前线程开始执行某个算子
+    :param registry:
+    :param operator_id:
+    :param consumers: 该算子每个输出的使用者个数
+    :param materialize: 输出是否落盘，False 时输出只交给子算子（融合执行）
+    :return:
+    """
+    _local.registry = registry
+    _local.operator_id = operator_id
+    _local.consumers = consumers
+    _local.materialize = materialize
+    _local.output_index = 0
+
+
+def unbind():
+    """
+    当前线程的算子执行结束
+    :return:
+    """
+    _local.registry = None
+    _local.operator_id = None
+
+
+def current():
+    """
+    当前线程绑定的注册表，不在 model 执行中时返回 None
+    :return:
+    """
+    return getattr(_local, 'registry', None)
+
+
+def register_output(file_url, df, write_func):
+    """
+    登记当前算子的下一个输出
+    :param file_url:
+    :param df:
+    :param write_func:
+    :return:
+    """
+    index = _local.output_index
+    _local.output_index += 1
+    if not _local.materialize:
+        write_func = None
+    _local.registry.register(_local.operator_id, index, file_url, df, _local.consumers, write_func)
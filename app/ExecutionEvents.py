@@ -0,0 +1,106 @@
+# -*- coding: UTF-8 -*-
+import threading
+import queue
+
+"""
+model 执行事件
+
+算子状态变化时（OperatorDao.update_operator_by_id）发布事件，
+订阅了该次执行（model_execute_id）的连接（/model/runStatusStream）立即收到，无需轮询数据库。
+事件：
+    {'type': 'operator', 'operatorId': ..., 'status': ..., 'log': ...}
+    {'type': 'progress', 'finished': 已结束的算子数, 'total': 参与运行的算子数}
+    {'type': 'execute', 'status': 执行结束的状态}
+"""
+
+_lock = threading.Lock()
+# model_execute_id -> [queue.Queue]
+_subscribers = {}
+# 执行中的 model_execute_id -> {'total': 参与运行的算子数, 'finished': 已结束的算子}
+_executions = {}
+# 执行中的 operator_id -> model_execute_id
+_operator_execution = {}
+
+# 算子的结束状态
+END_STATUS = ('success', 'error', 'cancelled')
+
+
+def start(model_execute_id, operator_ids):
+    """
+    执行开始，登记参与运行的算子
+    :param model_execute_id:
+    :param operator_ids:
+    :return:
+    """
+    with _lock:
+        _executions[model_execute_id] = {'total': len(operator_ids), 'finished': set()}
+        for operator_id in operator_ids:
+            _operator_execution[operator_id] = model_execute_id
+
+
+def publish_operator(operator_id, status, run_info):
+    """
+    发布算子状态变化
+    :param operator_id:
+    :param status:
+    :param run_info:
+    :return:
+    """
+    with _lock:
+        model_execute_id = _operator_execution.get(operator_id)
+        if model_execute_id is None:
+            return
+        execution = _executions[model_execute_id]
+        if status in END_STATUS:
+            execution['finished'].add(operator_id)
+        else:
+            execution['finished'].discard(operator_id)
+        events = [{'type': 'operator', 'operatorId': operator_id, 'status': status, 'log': run_info},
+                  {'type': 'progress', 'finished': len(execution['finished']), 'total': execution['total']}]
+        subscribers = list(_subscribers.get(model_execute_id, []))
+    for subscriber in subscribers:
+        for event in events:
+            subscriber.put(event)
+
+
+def finish(model_execute_id, status):
+    """
+    执行结束
+    :param model_execute_id:
+    :param status:
+    :return:
+    """
+    with _lock:
+        _executions.pop(model_execute_id, None)
+        for operator_id in [x for x in _operator_execution.keys() if _operator_execution[x] == model_execute_id]:
+            _operator_execution.pop(operator_id)
+        subscribers = list(_subscribers.get(model_execute_id, []))
+    for subscriber in subscribers:
+        subscriber.put({'type': 'execute', 'status': status})
+
+
+def subscribe(model_execute_id):
+    """
+    订阅某次执行的事件
+    :param model_execute_id:
+    :return: 事件队列
+    """
+    subscriber = queue.Queue()
+    with _lock:
+        _subscribers.setdefault(model_execute_id, []).append(subscriber)
+    return subscriber
+
+
+def unsubscribe(model_execute_id, subscriber):
+    """
+    取消订阅
+    :param model_execute_id:
+    :param subscriber:
+    :return:
+    """
+    with _lock:
+        subscribers = _subscribers.get(model_execute_id, [])
+        if subscriber in subscribers:
+            subscribers.remove(subscriber)
+        if not subscribers:
+            _subscribers.pop(model_execute_id, None)
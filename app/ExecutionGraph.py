@@ -0,0 +1,218 @@
+# -*- coding: UTF-8 -*-
+import threading
+from collections import deque
+import app.dao.OperatorDao as OperatorDao
+import app.dao.OperatorEdgeDao as OperatorEdgeDao
+
+"""
+一次 model（执行流程）运行内的算子图
+
+执行开始时用一次查询加载 model 的所有算子，执行中查找算子、父子算子都在内存中完成；
+算子的状态、结果地址由 OperatorDao 的内存状态覆盖，保证是最新的，并由 OperatorDao 批量写入数据库。
+"""
+
+# 当前线程所在的执行（算子函数通过它查找父算子）
+_local = threading.local()
+
+# 每个 model 的邻接表 model_id -> {'children': {operator_id: [child_id]}, 'fathers': {operator_id: [father_id]}}
+_adjacency_cache = {}
+_adjacency_lock = threading.Lock()
+
+
+class ExecutionGraph(object):
+    """
+    算子图，每次执行 model 时新建一个
+    """
+
+    def __init__(self, operators, adjacency=None):
+        """
+        :param operators: model 的所有算子 [Operator]
+        :param adjacency: model 的邻接表，为 None 时由算子的 father_operator_ids/child_operator_ids 生成
+        """
+        self.lock = threading.Lock()
+        self.operators = dict((operator.id, operator) for operator in operators)
+        if adjacency is None:
+            adjacency = build_adjacency(operators, string_edges(operators))
+        self.adjacency = adjacency
+
+    def get(self, operator_id):
+        """
+        查找算子，不在图中时查询数据库
+        :param operator_id:
+        :return:
+        """
+        with self.lock:
+            operator = self.operators.get(operator_id)
+        if operator is None:
+            return OperatorDao.get_operator_by_id(operator_id)
+        return OperatorDao.overlay_status([operator])[0]
+
+    def children(self, operator_id):
+        """
+        子算子 id
+        :param operator_id:
+        :return:
+        """
+        children = self.adjacency['children'].get(operator_id)
+        if children is None:
+            return [x for x in self.get(operator_id).child_operator_ids.split(',') if x != '']
+        return children
+
+    def fathers(self, operator_id):
+        """
+        父算子 id
+        :param operator_id:
+        :return:
+        """
+        fathers = self.adjacency['fathers'].get(operator_id)
+        if fathers is None:
+            return [x for x in self.get(operator_id).father_operator_ids.split(',') if x != '']
+        return fathers
+
+    def reachable(self, start_nodes):
+        """
+        从起始节点开始参与运行的所有算子（广度优先）
+        :param start_nodes:
+        :return: [operator_id]
+        """
+        result = []
+        visited = set()
+        queue = deque(x for x in start_nodes if not (x is None or x == ''))
+        while queue:
+            operator_id = queue.popleft()
+            if operator_id in visited:
+                continue
+            visited.add(operator_id)
+            result.append(operator_id)
+            queue.extend(self.children(operator_id))
+        return result
+
+    def operator_ids(self):
+        """
+        图中所有算子 id
+        :return:
+        """
+        with self.lock:
+            return list(self.operators.keys())
+
+
+def load(model_id):
+    """
+    一次查询加载 model 的所有算子
+    :param model_id:
+    :return:
+    """
+    operators = OperatorDao.get_operator_by_model_id(model_id)
+    if operators is False:
+        operators = []
+    return ExecutionGraph(operators, get_adjacency(model_id, operators))
+
+
+def get_adjacency(model_id, operators):
+    """
+    model 的邻接表（缓存），由 operator_edge 表生成；
+    连线表不可用、model 还没有连线记录、或连线与算子不一致（保存时连线写入失败）时由算子的 id 字符串生成
+    :param model_id:
+    :param operators: model 的所有算子
+    :return:
+    """
+    with _adjacency_lock:
+        adjacency = _adjacency_cache.get(model_id)
+    if adjacency is not None:
+        return adjacency
+    edges = OperatorEdgeDao.get_edges_by_model_id(model_id)
+    fallback_edges = string_edges(operators)
+    if not edges or set((x[0], x[1]) for x in edges) != set(fallback_edges):
+        edges = fallback_edges
+    adjacency = build_adjacency(operators, edges)
+    with _adjacency_lock:
+        _adjacency_cache[model_id] = adjacency
+    return adjacency
+
+
+def invalidate_adjacency(model_id):
+    """
+    model 的连线修改后，清除邻接表缓存
+    :param model_id:
+    :return:
+    """
+    with _adjacency_lock:
+        _adjacency_cache.pop(model_id, None)
+
+
+def string_edges(operators):
+    """
+    由算子的 child_operator_ids 得到连线
+    :param operators:
+    :return: [(father_operator_id, child_operator_id)]
+    """
+    edges = []
+    for operator in operators:
+        for child_id in operator.child_operator_ids.split(','):
+            if child_id != '':
+                edges.append((operator.id, child_id))
+    return edges
+
+
+def build_adjacency(operators, edges):
+    """
+    由连线生成邻接表
+    :param operators:
+    :param edges: [(father_operator_id, child_operator_id)]
+    :return:
+    """
+    children = dict((operator.id, []) for operator in operators)
+    fathers = dict((operator.id, []) for operator in operators)
+    for father_id, child_id in edges:
+        children.setdefault(father_id, []).append(child_id)
+        fathers.setdefault(child_id, []).append(father_id)
+    return {'children': children, 'fathers': fathers}
+
+
+def load_by_operator_id(operator_id):
+    """
+    加载某个算子所在 model 的所有算子
+    :param operator_id:
+    :return:
+    """
+    operator = OperatorDao.get_operator_by_id(operator_id)
+    if not operator:
+        return ExecutionGraph([])
+    return load(operator.model_id)
+
+
+def bind(graph):
+    """
+    当前线程开始参与某次执行
+    :param graph:
+    :return:
+    """
+    _local.graph = graph
+
+
+def unbind():
+    """
+    当前线程的执行结束
+    :return:
+    """
+    _local.graph = None
+
+
+def current():
+    """
+    当前线程所在执行的算子图，不在 model 执行中时返回 None
+    :return:
+    """
+    return getattr(_local, 'graph', None)
+
+
+def get_operator(operator_id):
+    """
+    查找算子：在 model 执行中时从算子图中查找，否则查询数据库
+    :param operator_id:
+    :return:
+    """
+    graph = current()
+    if graph is None:
+        return OperatorDao.get_operator_by_id(operator_id)
+    return graph.get(operator_id)
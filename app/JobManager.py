@@ -0,0 +1,155 @@
+# -*- coding: UTF-8 -*-
+import threading
+import itertools
+import traceback
+from app.ConstFile import const
+
+"""
+model 执行任务队列
+
+执行请求先进入队列，由固定个数（const.EXECUTE_MAX_JOBS）的工作线程按优先级取出执行，
+每个用户同时执行的任务不超过 const.EXECUTE_MAX_JOBS_PER_USER 个；排队中或执行中的任务可以取消。
+"""
+
+
+class Job(object):
+    """
+    一次 model 执行任务
+    """
+
+    def __init__(self, job_id, user_id, priority, func, args):
+        """
+        :param job_id: model_execute_id
+        :param user_id:
+        :param priority: 优先级，越大越先执行
+        :param func: 执行函数
+        :param args: 执行函数的参数
+        """
+        self.id = job_id
+        self.user_id = user_id
+        self.priority = priority
+        self.func = func
+        self.args = args
+        # queued / running / cancelled / finished
+        self.status = 'queued'
+        # 取消标志，执行中的任务在调度下一个算子前检查
+        self.cancel_event = threading.Event()
+
+
+class JobManager(object):
+    """
+    任务队列和工作线程
+    """
+
+    def __init__(self, max_workers, max_per_user):
+        self.max_workers = max_workers
+        self.max_per_user = max_per_user
+        self.condition = threading.Condition()
+        # 排队中的任务（按优先级从高到低、提交顺序从先到后）
+        self.queue = []
+        # job_id -> Job（排队中和执行中）
+        self.jobs = {}
+        # user_id -> 执行中的任务数
+        self.running_per_user = {}
+        self.sequence = itertools.count()
+        self.workers = []
+        for i in range(max_workers):
+            worker = threading.Thread(target=self.work, name='model-execute-' + str(i))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, job_id, user_id, func, args, priority=0):
+        """
+        提交任务
+        :param job_id:
+        :param user_id:
+        :param func:
+        :param args:
+        :param priority:
+        :return: Job
+        """
+        job = Job(job_id, user_id, priority, func, args)
+        with self.condition:
+            self.jobs[job_id] = job
+            self.queue.append((-priority, next(self.sequence), job))
+            self.queue.sort(key=lambda x: (x[0], x[1]))
+            self.condition.notify_all()
+        return job
+
+    def cancel(self, job_id):
+        """
+        取消任务：排队中的任务直接移出队列；执行中的任务不再调度剩余的算子
+        :param job_id:
+        :return: 取消前的任务状态，任务不存在时返回 None
+        """
+        with self.condition:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            status = job.status
+            job.cancel_event.set()
+            if status == 'queued':
+                self.queue = [x for x in self.queue if x[2] is not job]
+                job.status = 'cancelled'
+                self.jobs.pop(job_id, None)
+            return status
+
+    def get(self, job_id):
+        """
+        查询排队中或执行中的任务
+        :param job_id:
+        :return:
+        """
+        with self.condition:
+            return self.jobs.get(job_id)
+
+    def next_job(self):
+        """
+        取出优先级最高、且用户执行中的任务数未达上限的任务，没有时等待
+        :return:
+        """
+        with self.condition:
+            while True:
+                for i in range(len(self.queue)):
+                    job = self.queue[i][2]
+                    if self.running_per_user.get(job.user_id, 0) < self.max_per_user:
+                        del self.queue[i]
+                        job.status = 'running'
+                        self.running_per_user[job.user_id] = self.running_per_user.get(job.user_id, 0) + 1
+                        return job
+                self.condition.wait()
+
+    def work(self):
+        """
+        工作线程
+        :return:
+        """
+        while True:
+            job = self.next_job()
+            try:
+                job.func(*job.args)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                with self.condition:
+                    job.status = 'finished'
+                    self.jobs.pop(job.id, None)
+                    self.running_per_user[job.user_id] -= 1
+                    self.condition.notify_all()
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """
+    进程内唯一的任务队列
+    :return:
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager(const.EXECUTE_MAX_JOBS, const.EXECUTE_MAX_JOBS_PER_USER)
+        return _manager
@@ -0,0 +1,204 @@
+# -*- coding: UTF-8 -*-
+import os
+import time
+import threading
+import traceback
+from app.models.MSEntity import OperatorMetric
+import app.dao.OperatorMetricDao as OperatorMetricDao
+
+"""
+一次 model（执行流程）运行内的算子运行指标
+
+operator_execute 在算子函数前后计时（总耗时），read_data / write_data 累加读、写数据的耗时，
+其余为计算耗时；算子线程和落盘线程都设置 spark job group（model_execute_id_operator_id），执行结束后按 group 统计 job、stage、task 个数。
+输入输出的行数、字节数取自文件元数据，执行结束时统一计算并写入 operator_metric 表。
+注意：spark 是惰性执行的，读数据耗时只包含建立执行计划（csv 推断 schema）的时间，扫描数据的时间计入计算或写数据。
+spark 2.4 的 python 线程与 JVM 线程不是一一对应的（没有 pinned thread 模式，spark 3.0 起可设置 PYSPARK_PIN_THREAD=true），
+多个算子线程并发时 setJobGroup 可能作用到其他线程提交的作业上，job、stage、task 个数只能作为参考。
+"""
+
+# 当前线程正在执行的算子的指标（read_data / write_data 通过它累加耗时）
+_local = threading.local()
+
+
+class MetricsCollector(object):
+    """
+    算子指标收集器，每次执行 model 时新建一个
+    """
+
+    def __init__(self, model_execute_id):
+        """
+        :param model_execute_id:
+        """
+        self.model_execute_id = model_execute_id
+        self.lock = threading.Lock()
+        # operator_id -> 指标
+        self.metrics = {}
+
+    def begin(self, operator_id, operator_type_id, input_urls):
+        """
+        算子开始执行，当前线程绑定该算子的指标
+        :param operator_id:
+        :param operator_type_id:
+        :param input_urls: 输入数据地址
+        :return:
+        """
+        # job group 包含 model_execute_id，不与同一算子之前的执行混在一起
+        metric = {'operator_id': operator_id, 'operator_type_id': operator_type_id, 'input_urls': list(input_urls),
+                  'job_group': str(self.model_execute_id) + '_' + operator_id,
+                  'start': time.time(), 'wall_time': 0.0, 'read_time': 0.0, 'write_time': 0.0,
+                  'lock': self.lock}
+        with self.lock:
+            self.metrics[operator_id] = metric
+        _local.metric = metric
+        return metric
+
+    def end(self, metric):
+        """
+        算子执行结束
+        :param metric:
+        :return:
+        """
+        with self.lock:
+            metric['wall_time'] = time.time() - metric['start']
+        _local.metric = None
+
+    def save(self, spark_session, graph):
+        """
+        执行结束（所有落盘完成后）计算行数、字节数和 spark 统计，写入数据库
+        :param spark_session:
+        :param graph: 本次执行的 ExecutionGraph
+        :return:
+        """
+        create_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        operator_metrics = []
+        for operator_id, metric in self.metrics.items():
+            try:
+                operator = graph.get(operator_id)
+                output_urls = [x for x in operator.operator_output_url.split('*,') if x != ''] \
+                    if operator.operator_output_url else []
+                rows_in, bytes_read = data_statistics(metric['input_urls'])
+                rows_out, bytes_written = data_statistics(output_urls)
+                spark_jobs, spark_stages, spark_tasks = spark_statistics(spark_session, metric['job_group'])
+                operator_metrics.append(OperatorMetric(
+                    model_execute_id=self.model_execute_id, operator_id=operator_id,
+                    operator_type_id=metric['operator_type_id'], status=operator.status,
+                    wall_time=metric['wall_time'], read_time=metric['read_time'],
+                    # 落盘在后台线程中进行，写数据耗时不一定包含在总耗时内
+                    compute_time=max(metric['wall_time'] - metric['read_time'], 0.0),
+                    write_time=metric['write_time'], rows_in=rows_in, rows_out=rows_out,
+                    bytes_read=bytes_read, bytes_written=bytes_written, spark_jobs=spark_jobs,
+                    spark_stages=spark_stages, spark_tasks=spark_tasks, create_time=create_time))
+            except Exception:
+                traceback.print_exc()
+        return OperatorMetricDao.create_operator_metrics(operator_metrics)
+
+
+def data_statistics(file_urls):
+    """
+    数据文件的总行数和总字节数（模型目录只统计字节数）
+    :param file_urls:
+    :return: (行数, 字节数)，无法统计时为 None
+    """
+    # app.Utils 导入了本模块，在函数内导入
+    from app.Utils import file_size, is_data_file
+    import app.service.MetadataService as MetadataService
+    rows = None
+    size = None
+    for file_url in file_urls:
+        if not os.path.exists(file_url):
+            continue
+        try:
+            if is_data_file(file_url):
+                metadata = MetadataService.get_metadata(file_url)
+                rows = (rows or 0) + metadata['rows']
+                size = (size or 0) + metadata['size']
+            else:
+                size = (size or 0) + file_size(file_url)
+        except Exception:
+            traceback.print_exc()
+    return rows, size
+
+
+def spark_statistics(spark_session, job_group):
+    """
+    算子（job group 为 model_execute_id_operator_id）触发的 spark job、stage、task 个数
+    只能统计 spark 仍保留的作业（spark.ui.retainedJobs、spark.ui.retainedStages）
+    :param spark_session:
+    :param job_group:
+    :return: (job 个数, stage 个数, task 个数)
+    """
+    tracker = spark_session.sparkContext.statusTracker()
+    job_ids = tracker.getJobIdsForGroup(job_group)
+    stage_ids = set()
+    for job_id in job_ids:
+        job_info = tracker.getJobInfo(job_id)
+        if job_info is not None:
+            stage_ids.update(job_info.stageIds)
+    tasks = 0
+    for stage_id in stage_ids:
+        stage_info = tracker.getStageInfo(stage_id)
+        if stage_info is not None:
+            tasks += stage_info.numTasks
+    return len(job_ids), len(stage_ids), tasks
+
+
+def bind(collector):
+    """
+    当前线程开始执行某次 model
+    :param collector:
+    :return:
+    """
+    _local.collector = collector
+
+
+def unbind():
+    """
+    当前线程的执行结束
+    :return:
+    """
+    _local.collector = None
+    _local.metric = None
+
+
+def current():
+    """
+    当前线程绑定的收集器，不在 model 执行中时返回 None
+    :return:
+    """
+    return getattr(_local, 'collector', None)
+
+
+def current_metric():
+    """
+    当前线程正在执行的算子的指标，没有时返回 None
+    :return:
+    """
+    return getattr(_local, 'metric', None)
+
+
+def add_time(kind, seconds, metric=None):
+    """
+    累加读、写数据的耗时
+    :param kind: 'read' 或 'write'
+    :param seconds:
+    :param metric: 为 None 时使用当前线程的算子
+    :return:
+    """
+    if metric is None:
+        metric = current_metric()
+    if metric is None:
+        return
+    with metric['lock']:
+        metric[kind + '_time'] += seconds
+
+
+def set_job_group(spark_context, metric):
+    """
+    当前线程提交的 spark 作业归入算子的 job group
+    :param spark_context:
+    :param metric:
+    :return:
+    """
+    if metric is not None:
+        spark_context.setJobGroup(metric['job_group'], 'operator ' + metric['operator_id'])
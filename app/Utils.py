@@ -1,12 +1,14 @@
 # -*- coding: UTF-8 -*-
 from app.models.MSEntity import Project, ProcessFlow
-import os, json, time
+import os, json, time, threading
 from app import db
 import pandas as pd
 from pyspark.sql import SparkSession
 import uuid, shutil, traceback
 from flask.json import jsonify
 from app.ConstFile import const
+import app.DataFrameRegistry as DataFrameRegistry
+import app.OperatorMetrics as OperatorMetrics
 
 
 def list_str_to_list(str):
@@ -35,24 +37,58 @@ def funTime():
     return str(int(round(t * 1000)))  # 毫秒级时间戳
 
 
+# 进程内共享的 SparkSession（启动时创建，所有执行共用一个 SparkContext）
+_spark_session = None
+_spark_session_lock = threading.Lock()
+
+
+def init_spark_session():
+    """
+    创建（或获取）共享的 SparkSession，使用 FAIR 调度，多个执行之间按调度池公平分配资源
+    :return:
+    """
+    global _spark_session
+    with _spark_session_lock:
+        if _spark_session is None:
+            # .master("spark://10.108.211.130:7077")
+            _spark_session = SparkSession \
+                .builder \
+                .appName(const.SPARK_APP_NAME) \
+                .master(const.SPARK_MASTER) \
+                .config("spark.scheduler.mode", "FAIR") \
+                .getOrCreate()
+    return _spark_session
+
+
 # 获取一个新的SparkSession
 def getSparkSession(userId, computationName):
+    """
+    从共享的 SparkSession 派生一个会话：SQL配置、临时视图相互隔离，共用 SparkContext，不再重复启动
+    该会话的作业提交到用户的调度池，避免并发执行相互抢占
+    :param userId:
+    :param computationName:
+    :return:
+    """
     appName = str(userId) + "_" + computationName + '_' + str(funTime())
     print('Spark Session Name: ', appName)
-    # ss = SparkSession \
-    #     .builder \
-    #     .appName(appName) \
-    #     .master("spark://10.108.211.130:7077") \
-    #     .getOrCreate()
-
-    ss = SparkSession \
-        .builder \
-        .appName(appName) \
-        .master("local[*]") \
-        .getOrCreate()
+    ss = init_spark_session().newSession()
+    ss.scheduler_pool = 'user_' + str(userId)
+    use_scheduler_pool(ss)
     return ss
 
 
+def use_scheduler_pool(ss):
+    """
+    当前线程提交的作业使用会话对应的调度池（spark 的 local property 是线程级别的，每个执行线程都需要设置）
+    spark 2.4 没有 pinned thread 模式，python 线程与 JVM 线程不一一对应，多线程并发时调度池只能尽力生效
+    :param ss:
+    :return:
+    """
+    pool = getattr(ss, 'scheduler_pool', None)
+    if pool is not None:
+        ss.sparkContext.setLocalProperty("spark.scheduler.pool", pool)
+
+
 # 返回前nums条数据（json格式）
 def dfToJson(df, nums):
     data_1 = df.limit(nums).toJSON().collect()
@@ -183,19 +219,63 @@ def getProjectCurrentData(ss, projectName):
     return df
 
 
-def read_data_pandas(file_url):
+def read_data_pandas(file_url, column_names=None):
     """
     pandas 读取数据
     :param file_url:
+    :param column_names: 只读取的列（列裁剪），None 表示读取全部列
     :return:
     """
-    if file_url[-4:] == ".csv":
-        df = pd.read_csv(file_url, encoding="utf-8")
+    start = time.time()
+    # model 执行中，父算子的输出可能还在后台落盘
+    registry = DataFrameRegistry.current()
+    if registry is not None:
+        registry.wait_url(file_url)
+    if is_parquet(file_url):
+        df = pd.read_parquet(file_url, columns=column_names)
+    elif file_url[-4:] == ".csv":
+        df = pd.read_csv(file_url, encoding="utf-8", usecols=column_names)
     else:
-        df = pd.read_excel(file_url, encoding="utf-8")
+        df = pd.read_excel(file_url, encoding="utf-8", usecols=column_names)
+    OperatorMetrics.add_time('read', time.time() - start)
     return df
 
 
+def read_data_pandas_chunks(file_url, column_names=None):
+    """
+    pandas 分块读取数据，每块约 const.PANDAS_CHUNK_ROWS 行（parquet 按 row group 分块），用于流式计算
+    :param file_url:
+    :param column_names: 只读取的列（列裁剪），None 表示读取全部列
+    :return: 生成器，每次返回一块 pandas DataFrame
+    """
+    registry = DataFrameRegistry.current()
+    if registry is not None:
+        registry.wait_url(file_url)
+    if is_parquet(file_url):
+        import pyarrow.parquet as pq
+        for part_url in parquet_part_urls(file_url):
+            part = pq.ParquetFile(part_url)
+            for i in range(part.num_row_groups):
+                yield part.read_row_group(i, columns=column_names).to_pandas()
+    elif file_url[-4:] == ".csv":
+        for chunk in pd.read_csv(file_url, encoding="utf-8", usecols=column_names, chunksize=const.PANDAS_CHUNK_ROWS):
+            yield chunk
+    else:
+        yield pd.read_excel(file_url, encoding="utf-8", usecols=column_names)
+
+
+def parquet_part_urls(file_url):
+    """
+    parquet 数据的各个文件（spark 写出的 parquet 是一个目录）
+    :param file_url:
+    :return:
+    """
+    if not os.path.isdir(file_url):
+        return [file_url]
+    return sorted(os.path.join(file_url, x) for x in os.listdir(file_url)
+                  if x.endswith('.parquet') and not x.startswith(('.', '_')))
+
+
 def save_data_pandas(data, file_type="", file_url="", index=0):
     """
     pandas 写数据
@@ -218,31 +298,190 @@ def save_data_pandas(data, file_type="", file_url="", index=0):
     return file_url
 
 
-def read_data(ss, file_url):
+def is_parquet(file_url):
+    """
+    是否为 parquet 格式的中间数据（spark 写出的 parquet 是一个目录）
+    :param file_url:
+    :return:
+    """
+    return file_url[-8:] == '.parquet'
+
+
+def is_data_file(file_url):
+    """
+    是否为数据文件（区别于模型算子输出的模型目录）
+    :param file_url:
+    :return:
+    """
+    return is_parquet(file_url) or file_url[-4:] == '.csv'
+
+
+def file_fingerprint(file_url):
+    """
+    文件指纹：路径、大小、修改时间，文件内容变化后指纹随之变化
+    parquet 是目录，统计目录下所有文件
+    :param file_url:
+    :return: 文件不存在时返回 None
+    """
+    if not os.path.exists(file_url):
+        return None
+    if os.path.isdir(file_url):
+        size = 0
+        mtime = os.path.getmtime(file_url)
+        for root, dirs, files in os.walk(file_url):
+            for name in files:
+                stat = os.stat(os.path.join(root, name))
+                size += stat.st_size
+                mtime = max(mtime, stat.st_mtime)
+    else:
+        stat = os.stat(file_url)
+        size = stat.st_size
+        mtime = stat.st_mtime
+    return '%s|%d|%f' % (file_url, size, mtime)
+
+
+def file_size(file_url):
+    """
+    文件大小（字节），parquet 目录统计目录下所有文件
+    :param file_url:
+    :return:
+    """
+    if os.path.isdir(file_url):
+        return sum(os.path.getsize(os.path.join(root, name))
+                   for root, dirs, files in os.walk(file_url) for name in files)
+    return os.path.getsize(file_url)
+
+
+def read_data(ss, file_url, column_names=None):
     """
     spark 读取数据
+    parquet 自带schema，无需 inferSchema 再扫描一遍数据
+    model 执行中，若父算子的输出已在 DataFrameRegistry 中，直接使用内存中的 DataFrame
     :param ss:spark session
     :param file_url:
+    :param column_names: 只读取的列（列裁剪），None 表示读取全部列
     :return:
     """
-
-    df = ss.read.csv(file_url, header=True, inferSchema=True)
+    start = time.time()
+    df = None
+    registry = DataFrameRegistry.current()
+    if registry is not None:
+        df = registry.get_by_url(file_url)
+    if df is None:
+        if is_parquet(file_url):
+            df = ss.read.parquet(file_url)
+        else:
+            df = ss.read.csv(file_url, header=True, inferSchema=True)
+    if column_names:
+        df = df.select(*column_names)
+    OperatorMetrics.add_time('read', time.time() - start)
     return df
 
 
-def save_data(df, file_url=""):
+# parquet（spark 2.x）不支持列名中出现的字符
+PARQUET_INVALID_CHARS = ' ,;{}()\n\t='
+
+
+def parquet_compatible(df):
+    """
+    判断 df 的列名是否都能写入 parquet
+    :param df:
+    :return:
+    """
+    for column_name in df.columns:
+        for char in PARQUET_INVALID_CHARS:
+            if char in column_name:
+                return False
+    return True
+
+
+def save_data(df, file_url="", file_type=""):
     """
     保存数据
+    parquet：由各 executor 并行写出，保留schema；csv：经 driver 汇总成单个文件，用于导出
+    列名不能写入 parquet 时退回 csv
+    model 执行中，输出登记到 DataFrameRegistry 交给子算子，落盘在后台异步进行
     :param df:
     :param file_url:
+    :param file_type: 'parquet' 或 'csv'，默认为 const.MIDDATA_FORMAT
     :return:
     """
+    if file_type == "":
+        file_type = const.MIDDATA_FORMAT
+    if file_type == 'parquet' and not parquet_compatible(df):
+        print('列名中含有 parquet 不支持的字符，以csv格式保存：', df.columns)
+        file_type = 'csv'
     if file_url == "":
-        file_url = const.MIDDATA + str(uuid.uuid1()) + '.csv'
-    df.toPandas().to_csv(file_url, header=True, index=0)
+        file_url = const.MIDDATA + str(uuid.uuid1()) + '.' + file_type
+
+    # 落盘可能在后台线程中进行，耗时记到当前算子
+    metric = OperatorMetrics.current_metric()
+    if DataFrameRegistry.current() is not None:
+        DataFrameRegistry.register_output(file_url, df, lambda: write_data(df, file_url, file_type, metric))
+    else:
+        write_data(df, file_url, file_type, metric)
     return file_url
 
 
+def format_cell(value):
+    """
+    向量、数组单元格 -> 与 csv 中间数据相同的字符串（如 "[0.5, 0.25]"），其他值原样返回
+    parquet 经 pyarrow 读出的向量为 {'type', 'size', 'indices', 'values'}（type 0 稀疏，1 稠密），数组为 numpy 数组；
+    spark toPandas 得到的向量为 DenseVector/SparseVector，数组为 list
+    :param value:
+    :return:
+    """
+    if isinstance(value, dict) and set(value.keys()) == {'type', 'size', 'indices', 'values'}:
+        if value['type'] == 1:
+            values = [float(x) for x in value['values']]
+        else:
+            values = [0.0] * value['size']
+            for i, x in zip(value['indices'], value['values']):
+                values[i] = float(x)
+        return str(values)
+    if hasattr(value, 'toArray'):
+        return str(value.toArray().tolist())
+    if isinstance(value, (list, tuple)):
+        return str(list(value))
+    if hasattr(value, 'tolist') and getattr(value, 'ndim', 0) == 1:
+        return str(value.tolist())
+    return value
+
+
+def format_vector_columns(data):
+    """
+    把 pandas DataFrame 中的向量、数组列转换成与 csv 中间数据相同的字符串（预览、以 csv 保存时使用）
+    :param data: pandas DataFrame
+    :return:
+    """
+    for column_name in data.columns:
+        if data[column_name].dtype == object:
+            data[column_name] = data[column_name].map(format_cell)
+    return data
+
+
+def write_data(df, file_url, file_type, metric=None):
+    """
+    数据落盘，并生成文件元数据
+    :param df:
+    :param file_url:
+    :param file_type: 'parquet' 或 'csv'
+    :param metric: 所属算子的运行指标（OperatorMetrics），累加写数据耗时
+    :return:
+    """
+    start = time.time()
+    OperatorMetrics.set_job_group(df.sql_ctx.sparkSession.sparkContext, metric)
+    if file_type == 'parquet':
+        df.write.mode('overwrite').parquet(file_url)
+    else:
+        # 向量、数组列与 parquet 数据的预览格式一致
+        format_vector_columns(df.toPandas()).to_csv(file_url, header=True, index=0)
+    OperatorMetrics.add_time('write', time.time() - start, metric)
+    # 写入完成后生成元数据，查询列名时不必再读取数据
+    import app.service.MetadataService as MetadataService
+    MetadataService.refresh_metadata(file_url)
+
+
 def mkdir(path):
     """
     根据指定路径创建文件夹
@@ -23,6 +23,6 @@ app.config.from_object('config')
 db = SQLAlchemy(app)
 #
 from app.views.datasource import DataSource
-from app.views import Project, OperateType, OperateFlow, ProjectModel, Report, Operator
+from app.views import Project, OperateType, OperateFlow, ProjectModel, Report, Operator, Predict
 
 # from app import test
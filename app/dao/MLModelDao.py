@@ -36,3 +36,20 @@ def get_ml_model(ml_model_id):
     filters = {MLModel.id == ml_model_id}
     ml_model = MLModel.query.filter(*filters).first()
     return ml_model
+
+
+def delete_ml_model(ml_model_id):
+    """
+    删除记录（filter 需为表达式 MLModel.id == ml_model_id；写成字典 {MLModel.id: ml_model_id} 时会删除所有记录）
+    :param ml_model_id:
+    :return:
+    """
+    try:
+        filters = {MLModel.id == ml_model_id}
+        MLModel.query.filter(*filters).delete()
+        db.session.commit()
+        return True
+    except Exception:
+        print(traceback.print_exc())
+        db.session.rollback()
+        return False
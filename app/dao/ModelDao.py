@@ -43,9 +43,10 @@ def get_model_by_project_id(project_id):
         return False
 
 
-def update_with_project_id(project_id, start_nodes, relationship, config_order):
+def update_with_project_id(project_id, start_nodes, relationship, config_order, commit=True):
     """
     通过项目ID 更新 项目对应的model
+    :param commit: 是否提交，False 时与后续操作在同一事务中提交
     :return:
     """
 
@@ -61,10 +62,12 @@ def update_with_project_id(project_id, start_nodes, relationship, config_order):
         query.filter(Model.project_id == project_id).update(
             {Model.start_nodes: ','.join(start_nodes),
              Model.config: config})
-        db.session.commit()
+        if commit:
+            db.session.commit()
         print('更新完成')
         return True
 
     except Exception:
         print(traceback.print_exc())
+        db.session.rollback()
         return False
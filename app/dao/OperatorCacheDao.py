@@ -0,0 +1,56 @@
+# encoding=utf8
+from app.models.MSEntity import OperatorCache
+from app import db
+import traceback
+
+"""
+operator_cache（算子结果缓存）表 增删改查
+"""
+
+
+def get_operator_cache(cache_id):
+    """
+    通过 id（算子内容哈希）查询缓存
+    :param cache_id:
+    :return:
+    """
+    try:
+        query = db.session.query(OperatorCache).filter(OperatorCache.id == cache_id).first()
+        db.session.commit()
+        return query
+    except Exception:
+        print(traceback.print_exc())
+        return False
+
+
+def get_operator_cache_by_output_url(operator_output_url):
+    """
+    通过结果地址查询缓存
+    :param operator_output_url:
+    :return:
+    """
+    try:
+        query = db.session.query(OperatorCache).filter(
+            OperatorCache.operator_output_url == operator_output_url).first()
+        db.session.commit()
+        return query
+    except Exception:
+        print(traceback.print_exc())
+        return False
+
+
+def save_operator_cache(operator_cache):
+    """
+    新建或更新缓存
+    :param operator_cache: 类型 OperatorCache
+    :return:
+    """
+    try:
+        session = db.session
+        session.merge(operator_cache)
+        session.commit()
+        return True
+    except Exception:
+        print(traceback.print_exc())
+        return False
+
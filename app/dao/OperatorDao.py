@@ -1,35 +1,158 @@
 # encoding=utf8
 from app.models.MSEntity import Operator
 from app import db
+from app.ConstFile import const
+import app.ExecutionEvents as ExecutionEvents
+from sqlalchemy.orm.attributes import set_committed_value
+import threading
+import time
 import traceback
 
 """
 operator（算子）表 增删改查
+
+算子的执行状态（status、operator_output_url、run_info）先写入内存，由后台线程每隔
+const.OPERATOR_STATUS_FLUSH_INTERVAL 秒批量写入数据库（model 执行结束时也会立即写入）；
+同一算子的多次状态变化只写最后一次，值相同的算子合并为一条 UPDATE ... WHERE id IN (...)。
+查询 operator 时用内存中的状态覆盖数据库中的状态；执行中的状态一直保留在内存中，执行结束后由 release_status 释放。
 """
 
+# 内存中的最新状态 operator_id -> {'status', 'operator_output_url', 'run_info'}
+_status_view = {}
+# 尚未写入数据库的状态
+_pending_status = {}
+# 正在写入数据库的状态
+_flushing_status = {}
+# 执行已结束、写入数据库后即可释放的算子
+_release_after_flush = set()
+_status_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_flush_thread = None
+
 
 def update_operator_by_id(operator_id, status, operator_output_url="", run_info=""):
     """
     通过 operator_id 更新 operator的执行状态、结果保存路径、运行信息
+    状态先写入内存，由后台线程批量写入数据库
     :param operator_id:
     :param status:
     :param operator_output_url:
     :param run_info:
     :return:
     """
-    try:
-        filters = {
-            Operator.id == operator_id,
-        }
-        result = Operator.query.filter(*filters).first()
-        result.status = status
-        result.operator_output_url = operator_output_url
-        result.run_info = run_info
-        db.session.commit()
-        return True
-    except Exception as e:
-        print(traceback.print_exc())
-        return False
+    value = {'status': status, 'operator_output_url': operator_output_url, 'run_info': run_info}
+    with _status_lock:
+        _pending_status[operator_id] = value
+        _status_view[operator_id] = value
+        # 算子开始新的执行，不再释放
+        _release_after_flush.discard(operator_id)
+    start_flush_thread()
+    # 推送给订阅了该次执行的连接
+    ExecutionEvents.publish_operator(operator_id, status, run_info)
+    return True
+
+
+def start_flush_thread():
+    """
+    启动后台写入线程（只启动一次）
+    :return:
+    """
+    global _flush_thread
+    with _status_lock:
+        if _flush_thread is not None:
+            return
+        _flush_thread = threading.Thread(target=flush_loop, name='operator-status-writer')
+        _flush_thread.daemon = True
+    _flush_thread.start()
+
+
+def flush_loop():
+    """
+    后台写入线程
+    :return:
+    """
+    while True:
+        time.sleep(const.OPERATOR_STATUS_FLUSH_INTERVAL)
+        flush_operator_status()
+
+
+def flush_operator_status():
+    """
+    把内存中的状态批量写入数据库
+    值相同的算子（如执行前全部重置为 initial）合并为一条 UPDATE ... WHERE id IN (...)，其余一次 bulk update，一次提交
+    :return:
+    """
+    global _pending_status, _flushing_status
+    with _flush_lock:
+        with _status_lock:
+            if not _pending_status:
+                return True
+            _flushing_status = _pending_status
+            _pending_status = {}
+        try:
+            groups = {}
+            for operator_id in _flushing_status.keys():
+                value = _flushing_status[operator_id]
+                key = (value['status'], value['operator_output_url'], value['run_info'])
+                groups.setdefault(key, []).append(operator_id)
+            mappings = []
+            for key in groups.keys():
+                operator_ids = groups[key]
+                if len(operator_ids) == 1:
+                    mappings.append(dict(_flushing_status[operator_ids[0]], id=operator_ids[0]))
+                else:
+                    db.session.query(Operator).filter(Operator.id.in_(operator_ids)).update(
+                        _flushing_status[operator_ids[0]], synchronize_session=False)
+            if mappings:
+                db.session.bulk_update_mappings(Operator, mappings)
+            db.session.commit()
+            with _status_lock:
+                for operator_id in _flushing_status.keys():
+                    if operator_id in _release_after_flush:
+                        _release_after_flush.discard(operator_id)
+                        _status_view.pop(operator_id, None)
+                _flushing_status = {}
+            return True
+        except Exception:
+            print(traceback.print_exc())
+            db.session.rollback()
+            # 写入失败，未被更新的状态放回，下次重试
+            with _status_lock:
+                for operator_id in _flushing_status.keys():
+                    _pending_status.setdefault(operator_id, _flushing_status[operator_id])
+                _flushing_status = {}
+            return False
+
+
+def overlay_status(operators):
+    """
+    用内存中的状态覆盖查询结果（不标记为修改，不会被再次提交）
+    :param operators: [Operator]
+    :return:
+    """
+    operator_ids = [operator.id for operator in operators]
+    with _status_lock:
+        values = [_status_view.get(operator_id) for operator_id in operator_ids]
+    for operator, value in zip(operators, values):
+        if value is None:
+            continue
+        for key in value.keys():
+            set_committed_value(operator, key, value[key])
+    return operators
+
+
+def release_status(operator_ids):
+    """
+    执行结束：释放内存中的状态，还没有写入数据库的在写入后释放
+    :param operator_ids:
+    :return:
+    """
+    with _status_lock:
+        for operator_id in operator_ids:
+            if operator_id in _pending_status or operator_id in _flushing_status:
+                _release_after_flush.add(operator_id)
+            else:
+                _status_view.pop(operator_id, None)
 
 
 def update_operator_input_url(operator_id, operator_input_url):
@@ -61,6 +184,8 @@ def get_operator_by_id(operator_id):
     try:
         query = db.session.query(Operator).filter(Operator.id == operator_id).first()
         db.session.commit()
+        if query is not None:
+            overlay_status([query])
         return query
     except Exception:
         print(traceback.print_exc())
@@ -90,9 +215,12 @@ def get_operator_by_model_id(model_id):
     :return:
     """
     try:
-        query = db.session.query(Operator).filter(Operator.model_id == model_id)
+        query = db.session.query(Operator).filter(Operator.model_id == model_id).all()
+        # 与会话分离，提交后无需逐个重新加载
+        for operator in query:
+            db.session.expunge(operator)
         db.session.commit()
-        return query
+        return overlay_status(query)
     except Exception:
         print(traceback.print_exc())
         return False
@@ -143,3 +271,27 @@ def create_operator(operators):
     except Exception:
         print(traceback.print_exc())
         return False
+
+
+def update_model_operators(delete_ids, update_mappings, add_operators):
+    """
+    保存 model 的算子：一次批量删除、一次批量更新、一次批量新增，在同一事务中提交（包括之前未提交的 model 更新）
+    :param delete_ids: 删除的算子 id
+    :param update_mappings: 更新的算子 [{'id':..., 字段: 值}]
+    :param add_operators: 新增的算子 [Operator]
+    :return:
+    """
+    try:
+        session = db.session
+        if delete_ids:
+            session.query(Operator).filter(Operator.id.in_(delete_ids)).delete(synchronize_session=False)
+        if update_mappings:
+            session.bulk_update_mappings(Operator, update_mappings)
+        if add_operators:
+            session.add_all(add_operators)
+        session.commit()
+        return True
+    except Exception:
+        print(traceback.print_exc())
+        db.session.rollback()
+        return False
@@ -0,0 +1,48 @@
+# encoding=utf8
+from app.models.MSEntity import OperatorEdge
+from app import db
+import traceback
+
+"""
+operator_edge（算子连线）表 增删改查
+"""
+
+
+def get_edges_by_model_id(model_id):
+    """
+    通过 model_id 查询 model 的所有连线
+    :param model_id:
+    :return:
+    """
+    try:
+        query = db.session.query(OperatorEdge.father_operator_id, OperatorEdge.child_operator_id).filter(
+            OperatorEdge.model_id == model_id).all()
+        db.session.commit()
+        return query
+    except Exception:
+        print(traceback.print_exc())
+        return False
+
+
+def replace_model_edges(model_id, edges):
+    """
+    替换 model 的所有连线（不提交，与算子的修改在同一事务中提交）
+    在保存点中执行，失败时只回滚连线的修改，不影响同一事务中 model 和算子的修改
+    :param model_id:
+    :param edges: [(father_operator_id, child_operator_id)]
+    :return:
+    """
+    savepoint = None
+    try:
+        session = db.session
+        savepoint = session.begin_nested()
+        session.query(OperatorEdge).filter(OperatorEdge.model_id == model_id).delete(synchronize_session=False)
+        session.bulk_insert_mappings(OperatorEdge, [{'model_id': model_id, 'father_operator_id': father_id,
+                                                     'child_operator_id': child_id} for father_id, child_id in edges])
+        savepoint.commit()
+        return True
+    except Exception:
+        print(traceback.print_exc())
+        if savepoint is not None and savepoint.is_active:
+            savepoint.rollback()
+        return False
@@ -0,0 +1,40 @@
+# encoding=utf8
+from app.models.MSEntity import OperatorMetric
+from app import db
+import traceback
+
+"""
+operator_metric（算子运行指标）表 增删改查
+"""
+
+
+def create_operator_metrics(operator_metrics):
+    """
+    批量创建算子运行指标
+    :param operator_metrics: 类型 [OperatorMetric]
+    :return:
+    """
+    try:
+        session = db.session
+        session.add_all(operator_metrics)
+        session.commit()
+        return True
+    except Exception:
+        print(traceback.print_exc())
+        db.session.rollback()
+        return False
+
+
+def get_operator_metrics_by_model_execute_id(model_execute_id):
+    """
+    查询某次执行的所有算子运行指标
+    :param model_execute_id:
+    :return:
+    """
+    try:
+        query = db.session.query(OperatorMetric).filter(OperatorMetric.model_execute_id == model_execute_id).all()
+        db.session.commit()
+        return query
+    except Exception:
+        print(traceback.print_exc())
+        return False
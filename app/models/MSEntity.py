@@ -101,8 +101,9 @@ class Operator(db.Model):
     __tablename__ = 'operator'
     id = db.Column(db.String(128), primary_key=True)
     operator_name = db.Column(db.String(64))
-    father_operator_ids = db.Column(db.String(128))
-    child_operator_ids = db.Column(db.String(128))
+    # 父、子算子 id（逗号分隔，供前端使用；执行时的父子关系见 OperatorEdge）
+    father_operator_ids = db.Column(db.Text)
+    child_operator_ids = db.Column(db.Text)
     model_id = db.Column(db.Integer)
     status = db.Column(db.String(32))
     operator_output_url = db.Column(db.String(512))
@@ -113,6 +114,17 @@ class Operator(db.Model):
     run_info = db.Column(db.String(8192))
 
 
+class OperatorEdge(db.Model):
+    """
+    算子之间的连线（父算子 -> 子算子）
+    """
+    __tablename__ = 'operator_edge'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    model_id = db.Column(db.Integer, index=True)
+    father_operator_id = db.Column(db.String(128), index=True)
+    child_operator_id = db.Column(db.String(128), index=True)
+
+
 class ModelExecute(db.Model):
     """
     模型执行记录表
@@ -128,6 +140,32 @@ class ModelExecute(db.Model):
     end_time = db.Column(db.String(32))
 
 
+class OperatorMetric(db.Model):
+    """
+    每次执行中每个算子的运行指标
+    """
+    __tablename__ = 'operator_metric'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    model_execute_id = db.Column(db.Integer, index=True)
+    operator_id = db.Column(db.String(128))
+    operator_type_id = db.Column(db.Integer)
+    status = db.Column(db.String(32))
+    # 耗时（秒）：总耗时、读数据、计算、写数据
+    wall_time = db.Column(db.Float)
+    read_time = db.Column(db.Float)
+    compute_time = db.Column(db.Float)
+    write_time = db.Column(db.Float)
+    rows_in = db.Column(db.BigInteger)
+    rows_out = db.Column(db.BigInteger)
+    bytes_read = db.Column(db.BigInteger)
+    bytes_written = db.Column(db.BigInteger)
+    # 该算子触发的 spark job、stage、task 个数
+    spark_jobs = db.Column(db.Integer)
+    spark_stages = db.Column(db.Integer)
+    spark_tasks = db.Column(db.Integer)
+    create_time = db.Column(db.String(32))
+
+
 class Report(db.Model):
     """
     报告表
@@ -152,3 +190,15 @@ class MLModel(db.Model):
     name = db.Column(db.String(32))
     operator_type_id = db.Column(db.Integer)
     model_url = db.Column(db.String(256))
+
+
+class OperatorCache(db.Model):
+    """
+    算子结果缓存表
+    id 为算子内容的哈希（算子类型、参数、父算子结果、输入文件），内容相同的算子直接复用已有结果
+    """
+    __tablename__ = 'operator_cache'
+    id = db.Column(db.String(64), primary_key=True)
+    operator_type_id = db.Column(db.Integer)
+    operator_output_url = db.Column(db.String(512), index=True)
+    create_time = db.Column(db.String(32))
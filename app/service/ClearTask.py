@@ -1,7 +1,7 @@
 # -*- coding: UTF-8 -*-
-from app.models.MSEntity import Operator, MLModel
+from app.models.MSEntity import Operator, MLModel, OperatorCache
 from app import db
-from app.Utils import deltree, deldir
+from app.Utils import deltree, deldir, is_parquet
 
 """
 该类的作用：清理无用的中间数据
@@ -29,6 +29,14 @@ for model in models:
     url = model.model_url
     if (url is not None) and (url is not ''):
         urls_arr.extend(url.split('*,'))
+
+# 查找 算子结果缓存（算子重新执行后，旧结果只被缓存引用，命中缓存时仍会使用）
+caches = db.session.query(OperatorCache).all()
+db.session.commit()
+for cache in caches:
+    url = cache.operator_output_url
+    if (url is not None) and (url is not ''):
+        urls_arr.extend(url.split('*,'))
 print(urls_arr)
 
 # 磁盘上所有中间数据
@@ -36,6 +44,10 @@ all_file = []
 for i, j, k in os.walk(filePath):
     for item in k:
         all_file.append(filePath + '/' + item)
+    # parquet 格式的中间数据是目录
+    for item in j:
+        if is_parquet(item):
+            all_file.append(filePath + '/' + item)
     break
 
 for modelPath in modelPaths:
@@ -55,3 +67,10 @@ for url in all_file:
             deltree(url)
         elif os.path.isfile(url):
             deldir(url)
+
+# 删除结果文件已不存在的算子结果缓存
+for cache in caches:
+    if any(not os.path.exists(x) for x in cache.operator_output_url.split('*,') if x != ''):
+        print("删除缓存：" + cache.id)
+        db.session.delete(cache)
+db.session.commit()
@@ -2,11 +2,29 @@
 from app.Utils import *
 import app.dao.OperatorDao as OperatorDao
 import pandas as pd
+import numpy as np
+import pyspark.sql.functions as F
+from pyspark import StorageLevel
+from pyspark.ml.feature import VectorAssembler
+from pyspark.ml.stat import Correlation
+
+# spark 的数值类型（DataFrame.dtypes 中的类型名）
+SPARK_NUMBER_TYPES = ('tinyint', 'smallint', 'int', 'bigint', 'float', 'double')
+
+
+def is_number_dtype(dtype):
+    """
+    pandas 列是否为数值型（parquet 中间数据读出的整数、浮点数可能是 int32、float32 等）
+    :param dtype:
+    :return:
+    """
+    return dtype.kind in 'if'
 
 
 def full_table_statistics(spark_session, operator_id, file_url, condition):
     """
     全表统计
+    数据超过 const.EXPLORATION_SPARK_THRESHOLD 时用 spark 计算，否则用 pandas/numpy
     :param spark_session:
     :param operator_id:
     :param file_url:
@@ -17,10 +35,16 @@ def full_table_statistics(spark_session, operator_id, file_url, condition):
     try:
         # 修改计算状态
         OperatorDao.update_operator_by_id(operator_id, 'running', '', '')
-        # 读取数据
-        df = read_data_pandas(file_url)
-        # 全表统计函数
-        result_df = full_table_statistics_core(df, condition)
+        if use_spark_engine(file_url):
+            # 读取数据
+            df = read_data(spark_session, file_url, condition['columnNames'])
+            # 全表统计函数
+            result_df = full_table_statistics_spark(df, condition)
+        else:
+            # 读取数据
+            df = read_data_pandas(file_url, condition['columnNames'])
+            # 全表统计函数
+            result_df = full_table_statistics_core(df, condition)
         if isinstance(result_df, str):
             OperatorDao.update_operator_by_id(operator_id, 'error', '', result_df)
         else:
@@ -38,55 +62,154 @@ def full_table_statistics(spark_session, operator_id, file_url, condition):
     return []
 
 
+def use_spark_engine(file_url):
+    """
+    数据是否超过 const.EXPLORATION_SPARK_THRESHOLD，需要用 spark 计算
+    :param file_url:
+    :return:
+    """
+    # model 执行中，父算子的输出可能还在后台落盘
+    registry = DataFrameRegistry.current()
+    if registry is not None:
+        registry.wait_url(file_url)
+    return file_size(file_url) > const.EXPLORATION_SPARK_THRESHOLD
+
+
+STATISTICS = ['类型', '总数', '最小值', '最小值位置', '25%分位数', '中位数', '75%分位数', '均值', '最大值', '最大值位置', '平均绝对偏差', '方差',
+              '标准差', '偏度', '峰度']
+
+
 def full_table_statistics_core(df, condition):
     """
     全表统计核心函数
+    所有数值列一起计算：一次求各阶中心矩，一次求三个分位数；结果与 pandas 的 mad/var/std/skew/kurt 一致
     :param df: 数据（pandas）
     :param condition: {"projectId": 32, "columnNames": ['利润']}
     :return:
     """
     column_names = condition['columnNames']
-    statistics = ['类型', '总数', '最小值', '最小值位置', '25%分位数', '中位数', '75%分位数', '均值', '最大值', '最大值位置', '平均绝对偏差', '方差',
-                  '标准差', '偏度', '峰度']
+    number_columns = [x for x in column_names if is_number_dtype(df[x].dtype)]
     data = {}
     for columnName in column_names:
-        info = []
-        column_type = df[columnName].dtype
-        if column_type == 'int64' or column_type == 'float64':
-            info.append('number')
-            info.append(str(df[columnName].count()))
-            info.append(str(df[columnName].min()))
-            info.append(str(df[columnName].idxmin()))
-            info.append(str(df[columnName].quantile(.25)))
-            info.append(str(df[columnName].median()))
-            info.append(str(df[columnName].quantile(.75)))
-            info.append(str(df[columnName].mean()))
-            info.append(str(df[columnName].max()))
-            info.append(str(df[columnName].idxmax()))
-            info.append(str(df[columnName].mad()))
-            info.append(str(df[columnName].var()))
-            info.append(str(df[columnName].std()))
-            info.append(str(df[columnName].skew()))
-            info.append(str(df[columnName].kurt()))
-        else:
-            info.append('text')
-            info.append(str(df[columnName].count()))
-            info.append('')
-            info.append('')
-            info.append('')
-            info.append('')
-            info.append('')
-            info.append('')
-            info.append('')
-            info.append('')
-            info.append('')
-            info.append('')
-            info.append('')
-            info.append('')
-            info.append('')
-        data[columnName] = info
-        print(pd.DataFrame(data, index=statistics))
-    return pd.DataFrame(data, index=statistics)
+        data[columnName] = ['text', str(df[columnName].count())] + [''] * (len(STATISTICS) - 2)
+    if len(number_columns) == 0:
+        return pd.DataFrame(data, index=STATISTICS)
+
+    values = df[number_columns].to_numpy(dtype='float64')
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.nansum(values, axis=0) / count
+        deviation = np.where(valid, values - mean, 0)
+        deviation2 = deviation * deviation
+        m2 = deviation2.sum(axis=0)
+        m3 = (deviation2 * deviation).sum(axis=0)
+        m4 = (deviation2 * deviation2).sum(axis=0)
+        mad = np.abs(deviation).sum(axis=0) / count
+        var = np.where(count > 1, m2 / (count - 1), np.nan)
+        std = np.sqrt(var)
+        skew = np.where(count < 3, np.nan,
+                        np.where(m2 == 0, 0, count * (count - 1) ** 0.5 / (count - 2) * m3 / m2 ** 1.5))
+        kurt = np.where(count < 4, np.nan,
+                        np.where(m2 == 0, 0, count * (count + 1) * (count - 1) * m4 / ((count - 2) * (count - 3) * m2 ** 2)
+                                 - 3 * (count - 1) ** 2 / ((count - 2) * (count - 3))))
+        filled = np.where(valid, values, np.inf)
+        argmin = filled.argmin(axis=0)
+        argmax = np.where(valid, values, -np.inf).argmax(axis=0)
+        quantiles = np.nanquantile(values, [.25, .5, .75], axis=0)
+
+    for i in range(len(number_columns)):
+        columnName = number_columns[i]
+        if count[i] == 0:
+            data[columnName] = ['number', '0'] + ['nan'] * (len(STATISTICS) - 2)
+            continue
+        data[columnName] = ['number', str(count[i]),
+                            str(df[columnName].iat[argmin[i]]), str(df.index[argmin[i]]),
+                            str(quantiles[0][i]), str(quantiles[1][i]), str(quantiles[2][i]), str(mean[i]),
+                            str(df[columnName].iat[argmax[i]]), str(df.index[argmax[i]]),
+                            str(mad[i]), str(var[i]), str(std[i]), str(skew[i]), str(kurt[i])]
+    return pd.DataFrame(data, index=STATISTICS)
+
+
+def full_table_statistics_spark(df, condition):
+    """
+    全表统计（spark），与 full_table_statistics_core 输出相同
+    一次聚合求 总数、最值及其位置、均值、方差、偏度、峰度，一次 approxQuantile 求分位数，一次聚合求平均绝对偏差；
+    偏度、峰度换算为 pandas 使用的无偏估计
+    :param df: 数据（spark）
+    :param condition: {"projectId": 32, "columnNames": ['利润']}
+    :return:
+    """
+    column_names = condition['columnNames']
+    types = dict(df.dtypes)
+    number_columns = [x for x in column_names if types[x] in SPARK_NUMBER_TYPES]
+    data = {}
+    if len(number_columns) == 0:
+        counts = df.agg(*[F.count(F.col(x)) for x in column_names]).first()
+        for i in range(len(column_names)):
+            data[column_names[i]] = ['text', str(counts[i])] + [''] * (len(STATISTICS) - 2)
+        return pd.DataFrame(data, index=STATISTICS)
+
+    # 行号：monotonically_increasing_id 高位为分区号、低33位为分区内序号，换算时需要各分区的行数
+    df = df.withColumn('_row_id', F.monotonically_increasing_id())
+    df = df.withColumn('_partition_id', F.spark_partition_id())
+    df.persist(StorageLevel.MEMORY_AND_DISK)
+    try:
+        partition_rows = dict((row[0], row[1]) for row in df.groupBy('_partition_id').count().collect())
+        partition_start = {}
+        total = 0
+        for partition_id in sorted(partition_rows.keys()):
+            partition_start[partition_id] = total
+            total += partition_rows[partition_id]
+
+        def number_col(x):
+            # NaN 与 pandas 一样视为缺失值
+            if types[x] in ('float', 'double'):
+                return F.when(~F.isnan(F.col(x)), F.col(x))
+            return F.col(x)
+
+        aggs = []
+        for x in column_names:
+            aggs.append(F.count(number_col(x) if x in number_columns else F.col(x)))
+        for x in number_columns:
+            c = number_col(x)
+            aggs.extend([F.min(F.when(c.isNotNull(), F.struct(c, F.col('_row_id')))),
+                         F.max(F.when(c.isNotNull(), F.struct(c, F.col('_row_id')))),
+                         F.avg(c), F.var_samp(c), F.stddev_samp(c), F.skewness(c), F.kurtosis(c)])
+        row = df.agg(*aggs).first()
+        means = {}
+        for j in range(len(number_columns)):
+            means[number_columns[j]] = row[len(column_names) + j * 7 + 2]
+        mads = df.agg(*[F.avg(F.abs(number_col(x) - F.lit(means[x]))) for x in number_columns]).first() \
+            if any(means[x] is not None for x in number_columns) else [None] * len(number_columns)
+        quantiles = df.approxQuantile(number_columns, [.25, .5, .75], const.EXPLORATION_QUANTILE_ERROR)
+    finally:
+        df.unpersist()
+
+    def row_number(row_id):
+        return partition_start[row_id >> 33] + (row_id & ((1 << 33) - 1))
+
+    for i in range(len(column_names)):
+        x = column_names[i]
+        if x not in number_columns:
+            data[x] = ['text', str(row[i])] + [''] * (len(STATISTICS) - 2)
+            continue
+        j = number_columns.index(x)
+        n = row[i]
+        if n == 0:
+            data[x] = ['number', '0'] + ['nan'] * (len(STATISTICS) - 2)
+            continue
+        min_value, max_value, mean, var, std, g1, g2 = row[len(column_names) + j * 7: len(column_names) + j * 7 + 7]
+        skew = float('nan') if n < 3 else (0.0 if not var else g1 * (n * (n - 1)) ** 0.5 / (n - 2))
+        kurt = float('nan') if n < 4 else (0.0 if not var else ((n + 1) * g2 + 6) * (n - 1) / ((n - 2) * (n - 3)))
+        var = float('nan') if var is None else var
+        std = float('nan') if std is None else std
+        data[x] = ['number', str(n),
+                   str(min_value[0]), str(row_number(min_value[1])),
+                   str(quantiles[j][0]), str(quantiles[j][1]), str(quantiles[j][2]), str(mean),
+                   str(max_value[0]), str(row_number(max_value[1])),
+                   str(mads[j]), str(var), str(std), str(skew), str(kurt)]
+    return pd.DataFrame(data, index=STATISTICS)
 
 
 def frequency_statistics(spark_session, operator_id, file_url, condition):
@@ -101,19 +224,23 @@ def frequency_statistics(spark_session, operator_id, file_url, condition):
     try:
         # 修改计算状态
         OperatorDao.update_operator_by_id(operator_id, 'running', '', '')
-        # 读取数据
-        df = read_data_pandas(file_url)
-        # 频次统计函数
-        result_df = frequency_statistics_core(df, condition)
-        if isinstance(result_df, str):
-            OperatorDao.update_operator_by_id(operator_id, 'error', '', result_df)
+        if use_spark_engine(file_url):
+            # 读取数据
+            df = read_data(spark_session, file_url, [condition['columnName']])
+            # 频次统计函数
+            result_df, distinct, error = frequency_statistics_spark(df, condition)
         else:
-            # 存储结果
-            result_file_url = save_data_pandas(result_df)
-            run_info = '频次统计算子执行成功'
-            # 修改计算状态
-            OperatorDao.update_operator_by_id(operator_id, 'success', result_file_url, run_info)
-            return [result_file_url]
+            # 分块读取数据，流式计算
+            chunks = read_data_pandas_chunks(file_url, [condition['columnName']])
+            result_df, distinct, error = frequency_statistics_stream(chunks, condition)
+        # 存储结果
+        result_file_url = save_data_pandas(result_df)
+        run_info = '频次统计算子执行成功，共约 ' + str(distinct) + ' 个不同的值'
+        if error > 0:
+            run_info += '；不同值较多，频率为近似值，最多偏小 ' + str(error)
+        # 修改计算状态
+        OperatorDao.update_operator_by_id(operator_id, 'success', result_file_url, run_info)
+        return [result_file_url]
 
     except Exception as e:
         run_info = str(e)
@@ -125,15 +252,99 @@ def frequency_statistics(spark_session, operator_id, file_url, condition):
 def frequency_statistics_core(df, condition):
     """
     :param df:
-    :param condition:{"projectId":32,"columnName":"Item"}
-    :return:
+    :param condition:{"projectId":32,"columnName":"Item","topK":100}
+    :return: (频率最高的 topK 个值, 不同值的个数, 频率的误差上限)
     """
-    column_name = condition['columnName']
+    return frequency_statistics_stream([df], condition)
+
 
-    s = df[column_name].value_counts()
+def frequency_statistics_stream(chunks, condition):
+    """
+    频次统计（流式）：逐块 value_counts 后合并
+    不同值不超过 const.FREQUENCY_EXACT_LIMIT 个时精确计数，error 为 0；
+    超过后改用 k = const.FREQUENCY_SKETCH_SIZE 个计数器的 Misra-Gries 摘要（可合并）：合并后计数器超过 k 个时，
+    所有计数减去第 k+1 大的计数，去掉不大于 0 的值，减去的总量累计为 error。
+    每个值的计数偏小不超过 error，且 error <= 总行数 / (k+1)，频率超过 error 的值一定保留在摘要中；
+    不同值个数由 HyperLogLog 估计
+    :param chunks: 分块的数据（pandas）
+    :param condition:{"projectId":32,"columnName":"Item","topK":100}
+    :return: (频率最高的 topK 个值, 不同值的个数, 频率的误差上限 error)
+    """
+    column_name = condition['columnName']
+    top_k = int(condition.get('topK', const.FREQUENCY_TOP_K))
+    counts = pd.Series([], dtype='float64')
+    registers = np.zeros(1 << const.FREQUENCY_HLL_PRECISION, dtype='int64')
+    exact = True
+    error = 0
+    for chunk in chunks:
+        column = chunk[column_name].dropna()
+        hll_add(registers, pd.util.hash_array(column.to_numpy()))
+        counts = counts.add(column.value_counts(), fill_value=0)
+        if len(counts) > const.FREQUENCY_EXACT_LIMIT:
+            exact = False
+        if not exact and len(counts) > const.FREQUENCY_SKETCH_SIZE:
+            decrement = counts.nlargest(const.FREQUENCY_SKETCH_SIZE + 1).iat[-1]
+            counts = counts[counts > decrement] - decrement
+            error += int(decrement)
+    distinct = len(counts) if exact else hll_estimate(registers)
+    s = counts.sort_values(ascending=False)[:top_k].astype('int64')
     data = {column_name: s.index, "频率": s.values}
-    print(pd.DataFrame(data))
-    return pd.DataFrame(data)
+    return pd.DataFrame(data), distinct, error
+
+
+def hll_add(registers, hashes):
+    """
+    HyperLogLog：把一批 64 位哈希值加入寄存器
+    高 p 位选寄存器，其余位的前导零个数 + 1 作为该寄存器的候选值
+    :param registers: 寄存器，长度 2^p
+    :param hashes: uint64 数组
+    :return:
+    """
+    p = const.FREQUENCY_HLL_PRECISION
+    index = (hashes >> np.uint64(64 - p)).astype('int64')
+    rest = hashes << np.uint64(p)
+    # 二分求 rest 的有效位数
+    bit_length = np.zeros(len(rest), dtype='int64')
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = rest >= (np.uint64(1) << np.uint64(shift))
+        bit_length[high] += shift
+        rest = np.where(high, rest >> np.uint64(shift), rest)
+    bit_length += (rest > 0)
+    rank = np.minimum(64 - bit_length + 1, 64 - p + 1)
+    np.maximum.at(registers, index, rank)
+
+
+def hll_estimate(registers):
+    """
+    HyperLogLog：由寄存器估计不同值的个数，基数较小时用线性计数修正
+    :param registers:
+    :return:
+    """
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.power(2.0, -registers))
+    zeros = int(np.sum(registers == 0))
+    if estimate <= 2.5 * m and zeros > 0:
+        estimate = m * np.log(m / zeros)
+    return int(round(estimate))
+
+
+def frequency_statistics_spark(df, condition):
+    """
+    频次统计（spark），与 frequency_statistics_stream 输出相同：按频率从高到低的 topK 个值，不统计空值
+    :param df: 数据（spark）
+    :param condition:{"projectId":32,"columnName":"Item","topK":100}
+    :return: (频率最高的 topK 个值, 不同值的个数（近似）, 频率的误差上限（精确计数，为 0）)
+    """
+    column_name = condition['columnName']
+    top_k = int(condition.get('topK', const.FREQUENCY_TOP_K))
+    df = df.where(F.col(column_name).isNotNull())
+    result = df.groupBy(column_name).count() \
+        .orderBy(F.col('count').desc()) \
+        .limit(top_k) \
+        .withColumnRenamed('count', '频率')
+    distinct = df.agg(F.approx_count_distinct(column_name)).first()[0]
+    return result.toPandas(), distinct, 0
 
 
 def correlation_coefficient(spark_session, operator_id, file_url, condition):
@@ -148,16 +359,14 @@ def correlation_coefficient(spark_session, operator_id, file_url, condition):
     try:
         # 修改计算状态
         OperatorDao.update_operator_by_id(operator_id, 'running', '', '')
-        # 读取数据
-        df = read_data_pandas(file_url)
         # 相关系数函数
-        result_df = correlation_coefficient_core(df, condition)
+        result_df, note = correlation_coefficient_data(spark_session, file_url, condition)
         if isinstance(result_df, str):
             OperatorDao.update_operator_by_id(operator_id, 'error', '', result_df)
         else:
             # 存储结果
             result_file_url = save_data_pandas(result_df, '', '', 1)
-            run_info = '相关系数算子执行成功'
+            run_info = '相关系数算子执行成功' + note
             # 修改计算状态
             OperatorDao.update_operator_by_id(operator_id, 'success', result_file_url, run_info)
             return [result_file_url]
@@ -169,17 +378,222 @@ def correlation_coefficient(spark_session, operator_id, file_url, condition):
     return []
 
 
+def scatter_plot_data(file_url, condition):
+    """
+    散点图数据：分块读取两列，点数不多时随机抽样，点数很多时可改为二维分箱（密度网格）
+    :param file_url:
+    :param condition: {"columnNames": ["销售额", "折扣"], "sampleSize": 50, "bins": 0}，bins 大于0时按 bins*bins 的网格分箱
+    :return: 抽样：{"keys": 两列列名, "values": [[x, y], ...]}；
+             分箱：{"keys": 两列列名, "xEdges": x 的分箱边界, "yEdges": y 的分箱边界, "counts": 每个格子的点数}
+    """
+    column_names = condition['columnNames']
+    if len(column_names) != 2:
+        return "请选择两列，目前的选择为" + str(column_names)
+    bins = int(condition.get('bins') or 0)
+    if bins > 0:
+        return scatter_plot_bins(file_url, column_names, bins)
+    sample_size = int(condition.get('sampleSize') or const.SCATTER_SAMPLE_SIZE)
+    return scatter_plot_sample(read_data_pandas_chunks(file_url, column_names), column_names, sample_size)
+
+
+def check_scatter_columns(chunk, column_names):
+    """
+    判断所选列的数据类型是否为“数字型”，若不符，返回错误信息
+    :param chunk:
+    :param column_names:
+    :return: 错误信息，没有错误时返回 None
+    """
+    for columnName in column_names:
+        if not is_number_dtype(chunk[columnName].dtype):
+            return "只能画出数值型列的散点图，但是列 <" + columnName + "> 的类型为 " + str(chunk[columnName].dtype)
+    return None
+
+
+def scatter_plot_sample(chunks, column_names, sample_size):
+    """
+    随机抽样（bottom-k 蓄水池抽样）：每行赋一个随机数，保留随机数最小的 sample_size 行，等价于无放回均匀抽样
+    :param chunks: 分块的数据（pandas），只包含所选两列
+    :param column_names:
+    :param sample_size:
+    :return:
+    """
+    values = np.empty((0, 2))
+    keys = np.empty(0)
+    for chunk in chunks:
+        error = check_scatter_columns(chunk, column_names)
+        if error is not None:
+            return error
+        chunk_values = chunk[column_names].dropna().to_numpy()
+        chunk_keys = np.random.random_sample(len(chunk_values))
+        # 蓄水池已满时，只有随机数小于当前第 sample_size 小的行才可能入选
+        if len(keys) >= sample_size:
+            threshold = keys.max()
+            chunk_values = chunk_values[chunk_keys < threshold]
+            chunk_keys = chunk_keys[chunk_keys < threshold]
+        values = np.concatenate([values, chunk_values]) if len(values) else chunk_values
+        keys = np.concatenate([keys, chunk_keys])
+        if len(keys) > sample_size:
+            keep = np.argpartition(keys, sample_size)[:sample_size]
+            values = values[keep]
+            keys = keys[keep]
+    return {"keys": column_names, "values": values.tolist()}
+
+
+def scatter_plot_bins(file_url, column_names, bins):
+    """
+    二维分箱：第一遍求两列的范围，第二遍逐块累加 bins*bins 网格中每个格子的点数
+    :param file_url:
+    :param column_names:
+    :param bins:
+    :return:
+    """
+    x_min, x_max, y_min, y_max = np.inf, -np.inf, np.inf, -np.inf
+    for chunk in read_data_pandas_chunks(file_url, column_names):
+        error = check_scatter_columns(chunk, column_names)
+        if error is not None:
+            return error
+        chunk_values = chunk[column_names].dropna().to_numpy()
+        if len(chunk_values) == 0:
+            continue
+        x_min, y_min = np.minimum([x_min, y_min], chunk_values.min(axis=0))
+        x_max, y_max = np.maximum([x_max, y_max], chunk_values.max(axis=0))
+    if x_min > x_max:
+        return {"keys": column_names, "xEdges": [], "yEdges": [], "counts": []}
+    x_edges = np.linspace(x_min, x_max if x_max > x_min else x_min + 1, bins + 1)
+    y_edges = np.linspace(y_min, y_max if y_max > y_min else y_min + 1, bins + 1)
+    counts = np.zeros((bins, bins), dtype='int64')
+    for chunk in read_data_pandas_chunks(file_url, column_names):
+        chunk_values = chunk[column_names].dropna().to_numpy()
+        chunk_counts, _, _ = np.histogram2d(chunk_values[:, 0], chunk_values[:, 1], bins=[x_edges, y_edges])
+        counts += chunk_counts.astype('int64')
+    return {"keys": column_names, "xEdges": x_edges.tolist(), "yEdges": y_edges.tolist(), "counts": counts.tolist()}
+
+
+# 支持的相关系数：pearson（皮尔逊）、spearman（斯皮尔曼）、kendall（肯德尔，spark 不支持）
+CORRELATION_METHODS = ['pearson', 'spearman', 'kendall']
+
+
+def correlation_coefficient_data(spark_session, file_url, condition):
+    """
+    按方法和数据大小选择计算方式，只读取所选列，不把大数据整体读入 driver：
+    数据超过 const.EXPLORATION_SPARK_THRESHOLD 时，pearson、spearman（在 spark 中求秩）由 spark 计算，
+    kendall 由随机抽样的 const.CORRELATION_KENDALL_SAMPLE_ROWS 行计算；
+    否则 pearson 分块流式计算，spearman、kendall 用 pandas 计算
+    :param spark_session: 数据较大时使用，数据较小时可为 None
+    :param file_url:
+    :param condition: {"projectId": 32, "columnNames": ["销售额", "折扣", "装运成本"], "method": "pearson"}
+    :return: (相关系数矩阵或错误信息, 计算方式的说明)
+    """
+    column_names = condition['columnNames']
+    method = condition.get('method', 'pearson')
+    if method not in CORRELATION_METHODS:
+        return '不支持的相关系数：' + method, ''
+    if use_spark_engine(file_url):
+        if method == 'kendall':
+            sample = sample_rows(read_data_pandas_chunks(file_url, column_names),
+                                 const.CORRELATION_KENDALL_SAMPLE_ROWS)
+            if sample is None:
+                return '没有数据', ''
+            return correlation_coefficient_core(sample, condition), \
+                '（数据较大，肯德尔相关系数由随机抽样的 ' + str(len(sample)) + ' 行计算）'
+        return correlation_coefficient_spark(read_data(spark_session, file_url, column_names), condition), ''
+    if method == 'pearson':
+        # 分块读取数据，流式计算
+        return correlation_coefficient_stream(read_data_pandas_chunks(file_url, column_names), condition), ''
+    return correlation_coefficient_core(read_data_pandas(file_url, column_names), condition), ''
+
+
+def sample_rows(chunks, sample_size):
+    """
+    随机抽样（bottom-k）：每行赋一个随机数，保留随机数最小的 sample_size 行，内存中最多保留 sample_size 行加一块数据
+    :param chunks: 分块的数据（pandas）
+    :param sample_size:
+    :return: pandas DataFrame
+    """
+    sample = None
+    keys = None
+    for chunk in chunks:
+        chunk_keys = pd.Series(np.random.random_sample(len(chunk)))
+        chunk = chunk.reset_index(drop=True)
+        sample = chunk if sample is None else pd.concat([sample, chunk], ignore_index=True)
+        keys = chunk_keys if keys is None else pd.concat([keys, chunk_keys], ignore_index=True)
+        if len(sample) > sample_size:
+            keep = keys.nsmallest(sample_size).index
+            sample = sample.loc[keep].reset_index(drop=True)
+            keys = keys.loc[keep].reset_index(drop=True)
+    return sample
+
+
 def correlation_coefficient_core(df, condition):
     """
+    只计算所选列两两之间的相关系数
     :param df:
-    :param condition: {"projectId": 32, "columnNames": ["销售额", "折扣", "装运成本"]}
+    :param condition: {"projectId": 32, "columnNames": ["销售额", "折扣", "装运成本"], "method": "pearson"}
     :return:
     """
     column_names = condition['columnNames']
     # 报错信息：如果所选列不是数值型，则报错
-    accept_types = ['int64', 'float64']
     for columnName in column_names:
-        if df[columnName].dtype not in accept_types:
+        if not is_number_dtype(df[columnName].dtype):
             return "只能计算数值型列的相关系数，但是 <" + columnName + "> 的类型为 " + str(df[columnName].dtype)
     # 计算出相关系数矩阵df
-    return df.corr()
+    return df[column_names].corr(method=condition.get('method', 'pearson'))
+
+
+def correlation_coefficient_stream(chunks, condition):
+    """
+    pearson 相关系数（流式）：逐块累加两两列的 样本数、一阶和、二阶和、乘积和，与 pandas 一样每对列只用两列都不为空的行
+    为减小舍入误差，累加前先减去第一块的均值
+    :param chunks: 分块的数据（pandas），只包含所选列
+    :param condition: {"projectId": 32, "columnNames": ["销售额", "折扣", "装运成本"]}
+    :return:
+    """
+    column_names = condition['columnNames']
+    k = len(column_names)
+    shift = None
+    n = np.zeros((k, k))
+    sx = np.zeros((k, k))
+    sxx = np.zeros((k, k))
+    sxy = np.zeros((k, k))
+    for chunk in chunks:
+        # 报错信息：如果所选列不是数值型，则报错
+        for columnName in column_names:
+            if not is_number_dtype(chunk[columnName].dtype):
+                return "只能计算数值型列的相关系数，但是 <" + columnName + "> 的类型为 " + str(chunk[columnName].dtype)
+        values = chunk[column_names].to_numpy(dtype='float64')
+        valid = ~np.isnan(values)
+        if shift is None:
+            count = valid.sum(axis=0)
+            shift = np.where(count > 0, np.where(valid, values, 0).sum(axis=0) / np.maximum(count, 1), 0)
+        mask = valid.astype('float64')
+        x = np.where(valid, values - shift, 0)
+        # [i, j]：两列都不为空的行上，第 i 列的累加值
+        n += mask.T @ mask
+        sx += x.T @ mask
+        sxx += (x * x).T @ mask
+        sxy += x.T @ x
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = n * sxy - sx * sx.T
+        var = n * sxx - sx * sx
+        corr = np.clip(cov / np.sqrt(var * var.T), -1, 1)
+    return pd.DataFrame(corr, index=column_names, columns=column_names)
+
+
+def correlation_coefficient_spark(df, condition):
+    """
+    相关系数（spark），与 correlation_coefficient_core 输出相同：所选列两两之间的相关系数矩阵
+    含空值的行不参与计算
+    :param df: 数据（spark）
+    :param condition: {"projectId": 32, "columnNames": ["销售额", "折扣", "装运成本"], "method": "pearson"}
+    :return:
+    """
+    column_names = condition['columnNames']
+    types = dict(df.dtypes)
+    # 报错信息：如果所选列不是数值型，则报错
+    for columnName in column_names:
+        if types[columnName] not in SPARK_NUMBER_TYPES:
+            return "只能计算数值型列的相关系数，但是 <" + columnName + "> 的类型为 " + types[columnName]
+    assembler = VectorAssembler(inputCols=column_names, outputCol='_features', handleInvalid='skip')
+    matrix = Correlation.corr(assembler.transform(df.select(*column_names)).select('_features'), '_features',
+                              condition.get('method', 'pearson')).head()[0]
+    return pd.DataFrame(matrix.toArray(), index=column_names, columns=column_names)
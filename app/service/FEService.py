@@ -148,18 +148,7 @@ def vector_indexer_core(df, condition):
     # 训练
     df = indexer.fit(df).transform(df)
 
-    # 转换新列的数据格式
-    def do_something(col):
-        try:
-            floatrow = []
-            for i in list(col):
-                floatrow.append(float(i))
-            return floatrow
-        except:
-            return []
-
-    udf_dosth = F.udf(do_something, T.ArrayType(T.FloatType()))
-    df = df.withColumn(new_column_name, udf_dosth(df[new_column_name]))
+    # 新列保持向量类型（parquet 原生保存，下游算子可直接作为特征列使用），不经过 python udf 转换
     df = df.drop(features_uuid)
     return df
 
@@ -223,17 +212,7 @@ def standard_scaler_core(df, condition):
     # 训练
     df = standard_scaler_.fit(df).transform(df)
 
-    def do_something(col):
-        try:
-            floatrow = []
-            for i in list(col):
-                floatrow.append(float(i))
-            return floatrow
-        except:
-            return []
-
-    udf_dosth = F.udf(do_something, T.ArrayType(T.FloatType()))
-    df = df.withColumn(new_column_name, udf_dosth(df[new_column_name]))
+    # 新列保持向量类型（parquet 原生保存，下游算子可直接作为特征列使用），不经过 python udf 转换
     df = df.drop(features_uuid)
     return df
 
@@ -309,18 +288,7 @@ def pca_core(df, condition):
     # 训练
     df = pca.fit(df).transform(df)
 
-    # 转换新列的数据格式
-    def do_something(col):
-        try:
-            floatrow = []
-            for i in list(col):
-                floatrow.append(float(i))
-            return floatrow
-        except:
-            return []
-
-    udf_dosth = F.udf(do_something, T.ArrayType(T.FloatType()))
-    df = df.withColumn(new_column_name, udf_dosth(df[new_column_name]))
+    # 新列保持向量类型（parquet 原生保存，下游算子可直接作为特征列使用），不经过 python udf 转换
     df = df.drop(features_uuid)
     return df
 
@@ -500,18 +468,7 @@ def polynomial_expansion_core(df, condition):
     # 训练
     df = px.transform(df)
 
-    # 转换新列的数据格式
-    def do_something(col):
-        try:
-            floatrow = []
-            for i in list(col):
-                floatrow.append(float(i))
-            return floatrow
-        except:
-            return []
-
-    udf_dosth = F.udf(do_something, T.ArrayType(T.FloatType()))
-    df = df.withColumn(new_column_name, udf_dosth(df[new_column_name]))
+    # 新列保持向量类型（parquet 原生保存，下游算子可直接作为特征列使用），不经过 python udf 转换
     df = df.drop(features_uuid)
     return df
 
@@ -599,18 +556,7 @@ def chiSqSelector_core(df, condition):
     except utils.IllegalArgumentException:
         return "选择的列（包括用于卡方选择的列和卡方基准列label）都必须为数值型，请检查列名输入是否有误(Tip:label)"
 
-    # 转换新列的数据格式
-    def do_something(col):
-        try:
-            floatrow = []
-            for i in list(col):
-                floatrow.append(float(i))
-            return floatrow
-        except:
-            return []
-
-    udf_dosth = F.udf(do_something, T.ArrayType(T.FloatType()))
-    df = df.withColumn(new_column_name, udf_dosth(df[new_column_name]))
+    # 新列保持向量类型（parquet 原生保存，下游算子可直接作为特征列使用），不经过 python udf 转换
     df = df.drop(features_uuid)
     if not (column_name_label == label_uuid):
         df = df.drop(label_uuid)
@@ -7,6 +7,7 @@ import app.dao.OperatorTypeDao as OperatorTypeDao
 import app.dao.ModelExecuteDao as ModelExecuteDao
 from app.models.MSEntity import Operator, ModelExecute, MLModel
 import app.service.ModelExecuteService as ModelExecuteService
+import app.service.ml.ModelCache as ModelCache
 from app.Utils import *
 
 """
@@ -26,6 +27,8 @@ def save_ml_model(operator_id, user_id, name):
     operator = OperatorDao.get_operator_by_id(operator_id)
     if operator.operator_type_id > 7000 or operator.operator_type_id < 6001:
         return "所选择的节点并不是模型算子节点"
+    if operator.status == "saving":
+        return "结果保存中，请稍后"
     if operator.status != "success":
         return "请执行该节点"
     if operator.operator_output_url is not None:
@@ -83,6 +86,9 @@ def delete_ml_model(ml_model_id):
     :param ml_model_id:
     :return:
     """
-    filters = {MLModel.id: ml_model_id}
-    MLModel.query.filter(*filters).delete()
-    db.session.commit()
+    ml_model = MLModelDao.get_ml_model(ml_model_id)
+    if MLModelDao.delete_ml_model(ml_model_id) is False:
+        return False
+    # 模型已删除，不再保留已加载的模型
+    if ml_model is not None and ml_model.model_url:
+        ModelCache.invalidate(ml_model.model_url)
@@ -0,0 +1,90 @@
+# -*- coding: UTF-8 -*-
+from app.Utils import *
+from collections import OrderedDict
+import pyarrow.parquet as pq
+import app.service.PreviewService as PreviewService
+
+"""
+数据文件元数据缓存：列名、列类型（由前 const.METADATA_SAMPLE_ROWS 行推断）、行数、文件大小
+按文件指纹（路径、大小、修改时间）缓存，在上传文件、算子保存数据时生成，查询列名时不必再读取整个文件
+"""
+
+# 文件指纹 -> 元数据
+_metadata_cache = OrderedDict()
+_metadata_lock = threading.Lock()
+
+
+def get_metadata(file_url):
+    """
+    获取文件元数据，没有或文件已变化时重新生成
+    :param file_url:
+    :return: {'columns': 列名, 'dtypes': {列名: 类型}, 'numberColumns': 数值型列名, 'rows': 行数, 'size': 文件大小}
+    """
+    fingerprint = file_fingerprint(file_url)
+    if fingerprint is None:
+        raise IOError('文件不存在：' + file_url)
+    with _metadata_lock:
+        metadata = _metadata_cache.get(fingerprint)
+        if metadata is not None:
+            _metadata_cache.move_to_end(fingerprint)
+            return metadata
+    metadata = build_metadata(file_url)
+    with _metadata_lock:
+        _metadata_cache[fingerprint] = metadata
+        while len(_metadata_cache) > const.METADATA_CACHE_SIZE:
+            _metadata_cache.popitem(last=False)
+    return metadata
+
+
+def refresh_metadata(file_url):
+    """
+    文件写入完成后生成元数据，失败不影响调用方
+    :param file_url:
+    :return:
+    """
+    try:
+        get_metadata(file_url)
+    except Exception:
+        traceback.print_exc()
+
+
+def get_column_names(file_url):
+    """
+    所有列名
+    :param file_url:
+    :return:
+    """
+    return get_metadata(file_url)['columns']
+
+
+def get_number_column_names(file_url):
+    """
+    数值型的列名
+    :param file_url:
+    :return:
+    """
+    return get_metadata(file_url)['numberColumns']
+
+
+def build_metadata(file_url):
+    """
+    生成元数据：parquet 的列类型和行数取自 footer；csv 的列类型由前若干行推断，行数取自分页预览的索引
+    :param file_url:
+    :return:
+    """
+    if is_parquet(file_url):
+        index = PreviewService.get_index(file_url, PreviewService.build_parquet_index)
+        part_url = index['row_groups'][0][0] if index['row_groups'] else None
+        if part_url is None:
+            sample = pd.DataFrame(columns=index['columns'])
+        else:
+            sample = pq.ParquetFile(part_url).schema.to_arrow_schema().empty_table().to_pandas()
+        rows = index['rows']
+    else:
+        sample = pd.read_csv(file_url, encoding='utf-8', nrows=const.METADATA_SAMPLE_ROWS)
+        rows = PreviewService.get_index(file_url, PreviewService.build_csv_index)['rows']
+    columns = sample.columns.values.tolist()
+    dtypes = dict((col, str(sample[col].dtype)) for col in columns)
+    number_columns = [col for col in columns if sample[col].dtype.kind in 'if']
+    return {'columns': columns, 'dtypes': dtypes, 'numberColumns': number_columns, 'rows': rows,
+            'size': file_size(file_url)}
@@ -1,8 +1,14 @@
+import os
 import json
 import time
-import queue
-import threading
+import uuid
+import hashlib
 import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from app.ConstFile import const
+from app.Utils import use_scheduler_pool, file_fingerprint
+from app.models.MSEntity import OperatorCache
 import app.service.FEService as FEService
 import app.service.ml.Evaluation as Evaluation
 import app.service.ml.ModelService as ModelService
@@ -12,122 +18,162 @@ import app.service.ml.PredictService as PredictService
 import app.service.ml.SecondClassification as SecondClassification
 import app.service.ml.MultipleClassifition as MultipleClassifition
 import app.dao.OperatorDao as OperatorDao
+import app.dao.OperatorCacheDao as OperatorCacheDao
+import app.DataFrameRegistry as DataFrameRegistry
+import app.ExecutionGraph as ExecutionGraph
+import app.OperatorMetrics as OperatorMetrics
 
 
-def model_thread_execute(spark_session, start_nodes):
+def model_thread_execute(spark_session, start_nodes, registry=None, graph=None, cancel_event=None, metrics=None):
     """
     多线程执行 model（执行流程）
+    按拓扑顺序调度：一次性计算出参与运行的算子的入度，入度为0的算子交给线程池执行，
+    主线程等待算子完成事件，再把入度减为0的子算子交给线程池
     :param spark_session：
     :param start_nodes:['1','2'] model（执行流程启动的节点）
+    :param registry: 本次执行的 DataFrameRegistry，父子算子之间直接传递 DataFrame
+    :param graph: 本次执行的 ExecutionGraph，算子在内存中查找
+    :param cancel_event: 取消标志，设置后不再调度剩余的算子，剩余算子标记为 cancelled
+    :param metrics: 本次执行的 OperatorMetrics.MetricsCollector，记录每个算子的运行指标
     :return:
     """
+    if graph is None:
+        graph = ExecutionGraph.current()
+    # 参与运行的算子及其子算子
+    children = get_execute_children(start_nodes, graph)
+    # 入度：只计算参与运行的父算子
+    in_degree = dict.fromkeys(children.keys(), 0)
+    for operator_id in children.keys():
+        for child_id in children[operator_id]:
+            in_degree[child_id] += 1
 
-    class MyThread(threading.Thread):
-        def __init__(self, threadID, name, q):
-            threading.Thread.__init__(self)
-            self.threadID = threadID
-            self.name = name
-            self.q = q
-
-        def run(self):
-            print("开启线程：" + self.name)
-            process_data(self.name, self.q)
-            print("退出线程：" + self.name)
-
-    def process_data(threadName, q):
-        print('-------进入线程：', threadName)
-
-        while G.noExecFlag or G.execCounter or not workQueue.empty():
-            print('-------进入线程内部循环：', not workQueue.empty())
-            # TODO 多线程安全
-            G.noExecFlag = 0
-            G.execCounter += 1
-            queueLock.acquire()
-            if not workQueue.empty():
-                operator_id = q.get()
-                queueLock.release()
-                # TODO:处理函数
-                could_execute_operator_ids = operator_execute(spark_session, operator_id)
-                if could_execute_operator_ids is False:
-                    print("%s processing %s error" % (threadName, operator_id))
-                else:
-                    for item_id in could_execute_operator_ids:
-                        if item_id != '' and item_id is not None:
-                            q.put(item_id)
-                    print("%s processing %s add %s to queue" % (
-                        threadName, operator_id, ','.join(could_execute_operator_ids)))
-                    print("q.size: %s --- workQueue.size: %s" % (q.qsize(), workQueue.qsize()))
-            else:
-                queueLock.release()
-            G.execCounter -= 1
-            time.sleep(1)
-
-    class G:
-        # 未开始执行
-        noExecFlag = 1
-        # 正在执行operator的个数
-        execCounter = 0
-
-    threadList = ["Thread-1", "Thread-2", "Thread-3"]
-    queueLock = threading.Lock()
-    workQueue = queue.Queue(10)
-    threads = []
-    threadID = 1
-
-    # 填充队列
-    queueLock.acquire()
-    for word in start_nodes:
-        workQueue.put(word)
-    queueLock.release()
-
-    # 创建新线程
-    for tName in threadList:
-        thread = MyThread(threadID, tName, workQueue)
-        thread.start()
-        threads.append(thread)
-        threadID += 1
-
-    # 等待队列清空
-    while (not workQueue.empty()) or G.execCounter:
-        pass
-
-    # 等待所有线程完成
-    for t in threads:
-        t.join()
+    def run(operator_id):
+        use_scheduler_pool(spark_session)
+        ExecutionGraph.bind(graph)
+        OperatorMetrics.bind(metrics)
+        try:
+            operator_execute(spark_session, operator_id, registry)
+        finally:
+            OperatorMetrics.unbind()
+            ExecutionGraph.unbind()
+        return operator_id
+
+    def cancelled():
+        return cancel_event is not None and cancel_event.is_set()
+
+    finished = set()
+    with ThreadPoolExecutor(max_workers=const.EXECUTE_WORKERS) as pool:
+        running = set()
+        for operator_id in in_degree.keys():
+            if in_degree[operator_id] == 0 and not cancelled():
+                running.add(pool.submit(run, operator_id))
+        # 等待算子完成事件
+        while running:
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                operator_id = future.result()
+                finished.add(operator_id)
+                print("------算子执行结束------", operator_id)
+                for child_id in children[operator_id]:
+                    in_degree[child_id] -= 1
+                    if in_degree[child_id] == 0 and not cancelled():
+                        running.add(pool.submit(run, child_id))
+
+    not_executed = [x for x in in_degree.keys() if x not in finished]
+    if cancelled():
+        print("执行已取消，以下算子未执行：", ','.join(not_executed))
+        for operator_id in not_executed:
+            OperatorDao.update_operator_by_id(operator_id, 'cancelled', '', '执行已取消')
+    elif not_executed:
+        print("存在环，以下算子未执行：", ','.join(not_executed))
     print("退出主线程")
 
 
-def operator_execute(spark_session, operator_id):
+def get_execute_children(start_nodes, graph=None):
+    """
+    查找从起始节点开始参与运行的所有算子
+    :param start_nodes:
+    :param graph: ExecutionGraph，为 None 时查询数据库
+    :return: {operator_id: [child_id, ...]}
+    """
+    if graph is not None:
+        return dict((x, graph.children(x)) for x in graph.reachable(start_nodes))
+    children = dict()
+    operator_id_queue = deque(x for x in start_nodes if not (x is None or x == ''))
+    while operator_id_queue:
+        operator_id = operator_id_queue.popleft()
+        if operator_id in children:
+            continue
+        operator = OperatorDao.get_operator_by_id(operator_id)
+        children[operator_id] = [x for x in operator.child_operator_ids.split(',') if x != '']
+        operator_id_queue.extend(children[operator_id])
+    return children
+
+
+def operator_execute(spark_session, operator_id, registry=None):
     """
     执行算子
     :param spark_session:
     :param operator_id:
+    :param registry: 本次执行的 DataFrameRegistry，为 None 时算子之间通过文件传递数据
     :return:
     """
+    # 当前线程绑定的指标收集器和该算子的指标
+    metrics = OperatorMetrics.current()
+    metric = None
     try:
         # 查算子
-        operator = OperatorDao.get_operator_by_id(operator_id)
+        operator = ExecutionGraph.get_operator(operator_id)
         print("------执行算子------", "operator_id：", operator_id, operator.operator_type_id)
         # 获取input_url
         config = json.loads(operator.operator_config)
         file_url_list = config['fileUrl']
         # 获取输入地址
         url_arr = []
+        # 每个输入的标识（用于计算算子内容哈希）
+        input_keys = []
         for file_url_dict in file_url_list:
             key = ''
             for ikey in file_url_dict.keys():
                 key = ikey
             if operator_id == key:
                 url_arr.append(file_url_dict[key])
+                input_keys.append(file_fingerprint(file_url_dict[key]))
             else:
-                father = OperatorDao.get_operator_by_id(key)
-                # 检查父节点是否准备就绪
-                if father.status != 'success':
+                father = ExecutionGraph.get_operator(key)
+                # 检查父节点是否准备就绪（saving：结果已在内存中，正在落盘）
+                if father.status not in ('success', 'saving'):
                     return []
                 # TODO:暂定从0 开始
                 father_output_url_index = file_url_dict[key]
+                # 父节点融合执行，没有保存结果
+                if father.operator_output_url == '':
+                    OperatorDao.update_operator_by_id(operator_id, 'error', '', '父节点与下游算子融合执行，没有保存结果，请从父节点开始执行')
+                    return []
                 father_url_arr = father.operator_output_url.split('*,')
                 url_arr.append(father_url_arr[father_output_url_index])
+                input_keys.append(father_output_key(registry, father, father_output_url_index, url_arr[-1]))
+        # 开始记录运行指标，该算子提交的 spark 作业归入本次执行、该算子的 job group
+        if metrics is not None:
+            metric = metrics.begin(operator_id, operator.operator_type_id, url_arr)
+            OperatorMetrics.set_job_group(spark_session.sparkContext, metric)
+        # 算子内容没有变化时直接复用上次的结果
+        if const.OPERATOR_CACHE and registry is not None:
+            cache_id = operator_hash(operator, config, input_keys)
+            registry.operator_hashes[operator_id] = cache_id
+            if reuse_operator_cache(operator_id, cache_id):
+                return operator.child_operator_ids.split(',')
+        # 登记到注册表：每个输出的使用者为所有子算子和落盘；融合执行的算子不落盘
+        if registry is not None:
+            graph = ExecutionGraph.current()
+            if graph is not None:
+                child_ids = graph.children(operator_id)
+            else:
+                child_ids = [x for x in operator.child_operator_ids.split(',') if x != '']
+            if can_fuse(registry, operator, child_ids):
+                DataFrameRegistry.bind(registry, operator_id, len(child_ids), materialize=False)
+            else:
+                DataFrameRegistry.bind(registry, operator_id, len(child_ids) + 1)
         # 算子函数
         if operator.operator_type_id == 1001:
             preprocessService.filter_multi_conditions(spark_session, operator_id, url_arr[0],
@@ -212,8 +258,149 @@ def operator_execute(spark_session, operator_id):
         elif operator.operator_type_id == 8000:
             ModelService.model_operator(operator_id, json.loads(operator.operator_config)['parameter'])
 
+        # 结果落盘完成后才对外报告 success
+        if registry is not None:
+            publish_after_write(registry, operator_id)
         return operator.child_operator_ids.split(',')
 
     except:
         traceback.print_exc()
         return False
+    finally:
+        if metric is not None:
+            metrics.end(metric)
+        DataFrameRegistry.unbind()
+
+
+def publish_after_write(registry, operator_id):
+    """
+    算子执行成功但结果还在后台落盘时，状态先置为 saving（子算子可以使用内存中的结果，预览等待落盘完成），
+    全部落盘完成后再置为 success；落盘失败时由执行结束时标记为 error
+    :param registry:
+    :param operator_id:
+    :return:
+    """
+    operator = ExecutionGraph.get_operator(operator_id)
+    if operator.status != 'success':
+        return
+    output_url = operator.operator_output_url
+    run_info = operator.run_info
+    OperatorDao.update_operator_by_id(operator_id, 'saving', output_url, '结果保存中')
+
+    def publish():
+        OperatorDao.update_operator_by_id(operator_id, 'success', output_url, run_info)
+
+    if not registry.when_written(operator_id, publish):
+        # 没有未完成的落盘（已完成或不落盘）
+        publish()
+
+
+# 输入输出都是一个 spark DataFrame 的算子，可以和上下游融合成一个执行计划
+FUSIBLE_OPERATOR_TYPES = {5001, 1001, 1002, 1003, 1005, 1006, 1007, 1008,
+                          2001, 2002, 2003, 2004, 2005, 2006, 2007, 2008}
+
+
+def can_fuse(registry, operator, child_ids):
+    """
+    融合执行时，该算子的输出是否可以不落盘，直接作为子算子执行计划的一部分
+    条件：处于线性链路中间（只有一个子算子，且子算子只有这一个输入），算子和子算子都是 DataFrame->DataFrame 的算子，
+    且用户没有要求查看该算子的结果
+    :param registry:
+    :param operator:
+    :param child_ids:
+    :return:
+    """
+    if not registry.fuse or operator.id in registry.preview_ids:
+        return False
+    if operator.operator_type_id not in FUSIBLE_OPERATOR_TYPES or len(child_ids) != 1:
+        return False
+    child = ExecutionGraph.get_operator(child_ids[0])
+    if child.operator_type_id not in FUSIBLE_OPERATOR_TYPES:
+        return False
+    graph = ExecutionGraph.current()
+    if graph is not None:
+        father_ids = graph.fathers(child.id)
+    else:
+        father_ids = [x for x in child.father_operator_ids.split(',') if x != '']
+    return father_ids == [operator.id]
+
+
+# 结果不只由输入数据和参数决定的算子（模型加载依赖已保存的模型），不缓存
+UNCACHEABLE_OPERATOR_TYPES = {8000}
+
+
+def operator_hash(operator, config, input_keys):
+    """
+    算子内容哈希：算子类型、参数、各输入的标识（父算子的哈希或输入文件的指纹）
+    不缓存的算子、以及有输入文件不存在（没有指纹）的算子返回随机值，其下游算子也不会命中缓存
+    :param operator:
+    :param config: operator_config
+    :param input_keys:
+    :return:
+    """
+    if operator.operator_type_id in UNCACHEABLE_OPERATOR_TYPES or None in input_keys:
+        return uuid.uuid4().hex
+    content = json.dumps({'type': operator.operator_type_id,
+                          'parameter': config.get('parameter'),
+                          'inputs': input_keys}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def father_output_key(registry, father, index, url):
+    """
+    父算子第 index 个输出的标识
+    父算子在本次执行中：用本次计算的哈希；否则查缓存表；都没有时用输出文件的指纹
+    :param registry:
+    :param father:
+    :param index:
+    :param url: 父算子第 index 个输出的地址
+    :return:
+    """
+    father_hash = None
+    if registry is not None:
+        father_hash = registry.operator_hashes.get(father.id)
+    if father_hash is None:
+        cache = OperatorCacheDao.get_operator_cache_by_output_url(father.operator_output_url)
+        if cache:
+            father_hash = cache.id
+    if father_hash is None:
+        return file_fingerprint(url)
+    return father_hash + ':' + str(index)
+
+
+def reuse_operator_cache(operator_id, cache_id):
+    """
+    命中缓存且结果文件都还在时，直接使用缓存的结果
+    :param operator_id:
+    :param cache_id:
+    :return: 是否命中
+    """
+    cache = OperatorCacheDao.get_operator_cache(cache_id)
+    if not cache:
+        return False
+    for url in cache.operator_output_url.split('*,'):
+        if not os.path.exists(url):
+            return False
+    print("------命中缓存------", "operator_id：", operator_id)
+    OperatorDao.update_operator_by_id(operator_id, 'success', cache.operator_output_url, '算子内容没有变化，复用上次的运行结果')
+    return True
+
+
+def save_operator_cache(registry):
+    """
+    执行结束后记录本次运行成功、且结果已落盘的算子
+    :param registry:
+    :return:
+    """
+    for operator_id in registry.operator_hashes.keys():
+        if operator_id in registry.errors or operator_id in registry.fused_ids:
+            continue
+        operator = ExecutionGraph.get_operator(operator_id)
+        if operator.operator_type_id in UNCACHEABLE_OPERATOR_TYPES:
+            continue
+        if operator.status != 'success' or not operator.operator_output_url:
+            continue
+        OperatorCacheDao.save_operator_cache(
+            OperatorCache(id=registry.operator_hashes[operator_id], operator_type_id=operator.operator_type_id,
+                          operator_output_url=operator.operator_output_url,
+                          create_time=time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())))
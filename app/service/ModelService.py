@@ -4,8 +4,15 @@ import app.dao.ModelDao as ModelDao
 import app.dao.OperatorDao as OperatorDao
 import app.dao.OperatorTypeDao as OperatorTypeDao
 import app.dao.ModelExecuteDao as ModelExecuteDao
+import app.dao.OperatorEdgeDao as OperatorEdgeDao
+import app.dao.OperatorMetricDao as OperatorMetricDao
 from app.models.MSEntity import Operator, ModelExecute
 import app.service.ModelExecuteService as ModelExecuteService
+import app.DataFrameRegistry as DataFrameRegistry
+import app.ExecutionGraph as ExecutionGraph
+import app.JobManager as JobManager
+import app.ExecutionEvents as ExecutionEvents
+import app.OperatorMetrics as OperatorMetrics
 from app.Utils import *
 
 """
@@ -16,7 +23,7 @@ from app.Utils import *
 def update_model(project_id, start_nodes, config, relationship, config_order):
     """
     更新 model (处理流程图)
-    ToDo: 没有考虑数据库操作的原子性
+    新旧算子按 id 比较，model 和算子的修改在同一事务中提交
     :param project_id:
     :param start_nodes:
     :param config:
@@ -28,16 +35,19 @@ def update_model(project_id, start_nodes, config, relationship, config_order):
         if model is False:
             return False
 
-        # 更新model
-        update_result = ModelDao.update_with_project_id(project_id, start_nodes, relationship, config_order)
-        if update_result is False:
+        # 获取 operator（查询会提交会话，需在修改 model 之前）
+        operator_old = OperatorDao.get_operator_by_model_id(model.id)
+        if operator_old is False:
             return False
+        old_ids = set(old.id for old in operator_old)
 
-        # 获取 operator
-        operator_old = OperatorDao.get_operator_by_model_id(model.id)
+        # 更新model（与算子一起提交）
+        update_result = ModelDao.update_with_project_id(project_id, start_nodes, relationship, config_order, False)
+        if update_result is False:
+            return False
 
         # 新的operator
-        operators = []
+        operators = dict()
         config_dict = json.loads(config)
         for operator_id in config_dict.keys():
             operator_dict = config_dict.get(operator_id)
@@ -51,54 +61,44 @@ def update_model(project_id, start_nodes, config, relationship, config_order):
                            operator_type_id=operator_dict['name'],
                            operator_config=json.dumps(operator_dict['config'], ensure_ascii=False),
                            operator_style=operator_style)
-            operators.append(ope)
+            operators[operator_id] = ope
 
         # 准备删除的算子
-        operator_delete = []
-        # 准备更新的算子
+        operator_delete = [x for x in old_ids if x not in operators]
+        # 准备更新的算子（不修改运行状态）
         operator_update = []
-        for old in operator_old:
-            flag_exist = False
-            for new in operators:
-                if old.id == new.id:
-                    flag_exist = True
-                    operator_update.append([old, new])
-                    break
-            if not flag_exist:
-                operator_delete.append(old)
-        # 删除算子
-        for delete in operator_delete:
-            OperatorDao.delete_operator_by_id(delete.id)
-            print("********删除算子", delete)
-
-        # 更新算子
-        for update in operator_update:
-            update[0].father_operator_ids = update[1].father_operator_ids
-            update[0].child_operator_ids = update[1].child_operator_ids
-            update[0].model_id = update[1].model_id
-            update[0].operator_type_id = update[1].operator_type_id
-            update[0].operator_config = update[1].operator_config
-            update[0].operator_style = update[1].operator_style
-            # 更新算子
-            OperatorDao.create_operator([update[0]])
-            print("*********更新算子", update[0])
-
         # 准备添加的算子
         operator_add = []
-        for new in operators:
-            flag_exist = False
-            for old in operator_old:
-                if old.id == new.id:
-                    flag_exist = True
-                    break
-            if not flag_exist:
+        for operator_id in operators.keys():
+            new = operators[operator_id]
+            if operator_id in old_ids:
+                operator_update.append({'id': operator_id,
+                                        'father_operator_ids': new.father_operator_ids,
+                                        'child_operator_ids': new.child_operator_ids,
+                                        'model_id': new.model_id,
+                                        'operator_type_id': new.operator_type_id,
+                                        'operator_config': new.operator_config,
+                                        'operator_style': new.operator_style})
+            else:
                 operator_add.append(new)
-        # 添加算子
-        OperatorDao.create_operator(operator_add)
+        print("********删除算子", operator_delete)
+        print("*********更新算子", [x['id'] for x in operator_update])
         print("*********添加算子", operator_add)
-        return True
+        # 算子之间的连线
+        edges = []
+        for operator_id in operators.keys():
+            for child_id in config_dict[operator_id]['next']:
+                if child_id != '':
+                    edges.append((operator_id, child_id))
+        if OperatorEdgeDao.replace_model_edges(model.id, edges) is False:
+            # 连线表不可用（如还没有执行 sql/upgrade.sql）时不影响保存，执行时由算子的父子算子 id 生成邻接表
+            print("*********连线保存失败，执行时使用算子的父子算子 id")
+        result = OperatorDao.update_model_operators(operator_delete, operator_update, operator_add)
+        ExecutionGraph.invalidate_adjacency(model.id)
+        return result
     except:
         traceback.print_exc()
+        db.session.rollback()
         return False
 
 
@@ -165,25 +165,12 @@ def get_status_model_execute_end(project_id, start_operator_ids):
         return False
 
     # 获取 operator
-    operators = OperatorDao.get_operator_by_model_id(model.id)
-    if operators is False:
-        return False
-
-    # 构造dict
-    id_operator_dict = {}
-    for operator in operators:
-        id_operator_dict[operator.id] = operator
-
-    operator_from_one_ids = []
-    operator_from_one_ids.extend(start_operator_ids)
+    graph = ExecutionGraph.load(model.id)
 
     # 从此次执行 起始节点及以后节点的状态
     status_set = set()
-    while operator_from_one_ids:
-        item = operator_from_one_ids.pop(0)
-        if not (item is None or item == ''):
-            status_set.add(id_operator_dict[item].status)
-            operator_from_one_ids.extend(id_operator_dict[item].child_operator_ids.split(','))
+    for operator_id in graph.reachable(start_operator_ids):
+        status_set.add(graph.get(operator_id).status)
 
     if len(status_set) == 1 and "success" in status_set:
         return "success"
@@ -206,31 +193,44 @@ def get_run_status_by_project_id(project_id, model_execute_id):
         return False
 
     # 获取 operator
-    operators = OperatorDao.get_operator_by_model_id(model.id)
-    if operators is False:
-        return False
-
-    # 构造dict
-    id_operator_dict = {}
-    for operator in operators:
-        id_operator_dict[operator.id] = operator
+    graph = ExecutionGraph.load(model.id)
 
     # 查看此次执行记录（状态、起始节点）
     model_execute_ = ModelExecuteDao.get_model_execute_by_id(model_execute_id)
-    operator_from_one_ids = model_execute_.start_nodes.split(',')
 
     # 查看此次执行的所有节点的状态
     result = dict()
-    while operator_from_one_ids:
-        item = operator_from_one_ids.pop(0)
-        if not (item is None or item == ''):
-            result[id_operator_dict[item].id] = {"status": id_operator_dict[item].status,
-                                                 "log": id_operator_dict[item].run_info}
-            operator_from_one_ids.extend(id_operator_dict[item].child_operator_ids.split(','))
+    for operator_id in graph.reachable(model_execute_.start_nodes.split(',')):
+        operator = graph.get(operator_id)
+        result[operator.id] = {"status": operator.status, "log": operator.run_info}
 
     return {"modelExecuteStatus": model_execute_.status, "operatorStatus": result}
 
 
+def get_run_report(model_execute_id):
+    """
+    某次执行中每个算子的运行指标，按总耗时从高到低排列，用于定位流程中的瓶颈算子
+
+    :param model_execute_id: model的执行记录ID
+    :return:
+    """
+    operator_metrics = OperatorMetricDao.get_operator_metrics_by_model_execute_id(model_execute_id)
+    if operator_metrics is False:
+        return False
+    operator_metrics = sorted(operator_metrics, key=lambda x: x.wall_time or 0, reverse=True)
+    result = []
+    for metric in operator_metrics:
+        result.append({"operatorId": metric.operator_id, "operatorTypeId": metric.operator_type_id,
+                       "status": metric.status, "wallTime": metric.wall_time, "readTime": metric.read_time,
+                       "computeTime": metric.compute_time, "writeTime": metric.write_time,
+                       "rowsIn": metric.rows_in, "rowsOut": metric.rows_out, "bytesRead": metric.bytes_read,
+                       "bytesWritten": metric.bytes_written, "sparkJobs": metric.spark_jobs,
+                       "sparkStages": metric.spark_stages, "sparkTasks": metric.spark_tasks})
+    return {"modelExecuteId": model_execute_id,
+            "totalOperatorTime": sum(x["wallTime"] or 0 for x in result),
+            "operatorMetrics": result}
+
+
 def run_execute_status_from_start(user_id, project_id):
     """
     设置模型运行时状态(从头开始执行)
@@ -244,8 +244,8 @@ def run_execute_status_from_start(user_id, project_id):
         return False
     # 状态初始化
     start_nodes = model.start_nodes.split(',')
-    model_execute_id = initial_execute_status(user_id, start_nodes)
-    ModelExecuteDao.update_model_execute(model_execute_id, "running", "", "")
+    model_execute_id = initial_execute_status(user_id, start_nodes, ExecutionGraph.load(model.id))
+    ModelExecuteDao.update_model_execute(model_execute_id, "queued", "", "")
     return {'model_execute_id': model_execute_id, 'start_nodes': start_nodes}
 
 
@@ -259,7 +259,7 @@ def run_execute_status_from_one(user_id, operator_id):
     # 状态初始化
     start_nodes = [operator_id]
     model_execute_id = initial_execute_status(user_id, start_nodes)
-    ModelExecuteDao.update_model_execute(model_execute_id, "running", "", "")
+    ModelExecuteDao.update_model_execute(model_execute_id, "queued", "", "")
     return {'model_execute_id': model_execute_id, 'start_nodes': start_nodes}
 
 
@@ -268,47 +268,142 @@ def model_execute(user_id, project_id, param):
     执行模型
     :param user_id: 1
     :param project_id: 32
-    :param param: {'model_execute_id': model_execute_id, 'start_nodes': start_nodes}
+    :param param: {'model_execute_id': model_execute_id, 'start_nodes': start_nodes, 'fuse': False, 'preview_nodes': []}
+    fuse：融合执行，线性链路中间的算子不保存结果；preview_nodes：融合执行时仍需保存结果的算子
     :return:
     """
     model_execute_id = param['model_execute_id']
     start_nodes = param['start_nodes']
-    # spark会话
-    spark_session = getSparkSession(user_id, "executeModel")
-    # 多线程执行
-    print("-----model_execute_from_start------", "start_nodes", ','.join(start_nodes))
-    ModelExecuteService.model_thread_execute(spark_session, start_nodes)
-    # 执行完毕，更改执行状态
-    end_status = get_status_model_execute_end(project_id, start_nodes)
-    ModelExecuteDao.update_model_execute(model_execute_id, end_status, "",
-                                         time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()))
+    # 由任务队列执行时，可被取消
+    job = JobManager.get_job_manager().get(model_execute_id)
+    cancel_event = job.cancel_event if job is not None else None
+    graph = None
+    registry = None
+    # 执行中出现异常时的状态和信息
+    end_status = "error"
+    run_info = ""
+    try:
+        ModelExecuteDao.update_model_execute(model_execute_id, "running", "", "")
+        # 一次加载 model 的所有算子，执行中在内存中查找
+        model = ModelDao.get_model_by_project_id(project_id)
+        if model is False or model is None:
+            raise ValueError('model 不存在，project_id：' + str(project_id))
+        graph = ExecutionGraph.load(model.id)
+        ExecutionGraph.bind(graph)
+        ExecutionEvents.start(model_execute_id, graph.reachable(start_nodes))
+        # spark会话
+        spark_session = getSparkSession(user_id, "executeModel")
+        # 本次执行内父子算子之间直接传递 DataFrame
+        registry = DataFrameRegistry.DataFrameRegistry(fuse=param.get('fuse', False),
+                                                       preview_ids=param.get('preview_nodes', []))
+        # 每个算子的耗时、行数、字节数
+        metrics = OperatorMetrics.MetricsCollector(model_execute_id)
+        # 多线程执行
+        print("-----model_execute_from_start------", "start_nodes", ','.join(start_nodes))
+        ModelExecuteService.model_thread_execute(spark_session, start_nodes, registry, graph, cancel_event, metrics)
+        # 等待后台落盘完成，落盘失败的算子标记为 error
+        write_errors = list(registry.close().items())
+        for operator_id, error in write_errors:
+            OperatorDao.update_operator_by_id(operator_id, 'error', '', error)
+            # 下游算子使用的是内存中的结果，父算子的结果没有保存，一并标记为 error，也不记入结果缓存
+            for child_id in graph.reachable([operator_id]):
+                if child_id != operator_id and child_id not in registry.errors:
+                    registry.errors[child_id] = '父节点 ' + operator_id + ' 的结果保存失败，请重新执行'
+                    OperatorDao.update_operator_by_id(child_id, 'error', '', registry.errors[child_id])
+        # 融合执行的算子没有保存结果
+        for operator_id in registry.fused_ids:
+            OperatorDao.update_operator_by_id(operator_id, 'success', '', '算子已与下游算子融合执行，未保存结果数据')
+        # 记录算子结果缓存，下次执行时内容没有变化的算子直接复用
+        if const.OPERATOR_CACHE:
+            ModelExecuteService.save_operator_cache(registry)
+        # 算子状态立即写入数据库
+        OperatorDao.flush_operator_status()
+        # 保存运行指标（落盘已全部完成）
+        metrics.save(spark_session, graph)
+        # 执行完毕，更改执行状态
+        if cancel_event is not None and cancel_event.is_set():
+            end_status = "cancelled"
+        else:
+            end_status = get_status_model_execute_end(project_id, start_nodes)
+    except Exception as e:
+        traceback.print_exc()
+        end_status = "error"
+        run_info = str(e)
+    finally:
+        # 无论成功与否：等待落盘并释放缓存、写入算子状态、结束执行记录和状态推送、释放内存状态
+        if registry is not None:
+            registry.close()
+        OperatorDao.flush_operator_status()
+        ModelExecuteDao.update_model_execute(model_execute_id, end_status, run_info,
+                                             time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()))
+        ExecutionEvents.finish(model_execute_id, end_status)
+        ExecutionGraph.unbind()
+        release_execute_status(start_nodes, graph)
     return model_execute_id
 
 
-def initial_execute_status(execute_user_id, start_nodes):
+def submit_model_execute(user_id, project_id, param, priority=0):
+    """
+    执行请求放入任务队列
+    :param user_id:
+    :param project_id:
+    :param param: run_execute_status_from_start / run_execute_status_from_one 的返回值
+    :param priority: 优先级，越大越先执行
+    :return: model_execute_id
+    """
+    JobManager.get_job_manager().submit(param['model_execute_id'], user_id, model_execute,
+                                        (user_id, project_id, param), priority)
+    return param['model_execute_id']
+
+
+def cancel_model_execute(model_execute_id):
+    """
+    取消执行：排队中的直接取消；执行中的不再调度剩余的算子，正在执行的算子结束后停止
+    :param model_execute_id:
+    :return: 取消前的状态，没有排队或执行中时返回 None
+    """
+    status = JobManager.get_job_manager().cancel(model_execute_id)
+    if status == 'queued':
+        ModelExecuteDao.update_model_execute(model_execute_id, "cancelled", "执行已取消",
+                                             time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()))
+        ExecutionEvents.finish(model_execute_id, "cancelled")
+        # 排队时已初始化的算子状态不会再由执行释放
+        model_execute_ = ModelExecuteDao.get_model_execute_by_id(model_execute_id)
+        if model_execute_:
+            release_execute_status(model_execute_.start_nodes.split(','))
+    return status
+
+
+def release_execute_status(start_nodes, graph=None):
+    """
+    执行结束或排队中被取消：释放该 model 所有算子在内存中的状态（OperatorDao 写入数据库后释放）
+    :param start_nodes:
+    :param graph: 本次执行的 ExecutionGraph，为 None 时按起始节点加载
+    :return:
+    """
+    try:
+        if graph is None:
+            graph = ExecutionGraph.load_by_operator_id(start_nodes[0])
+        OperatorDao.release_status(graph.operator_ids())
+    except Exception:
+        traceback.print_exc()
+
+
+def initial_execute_status(execute_user_id, start_nodes, graph=None):
     """
     每次执行model时，初始化执行状态
     :param execute_user_id:
     :param start_nodes: []
+    :param graph: model 的 ExecutionGraph，为 None 时按起始节点加载
     :return:
     """
     # 查找参与运行的 operator
-    operator_list = []
-    operator_id_queue = []
-    for x in start_nodes:
-        operator_id_queue.append(x)
-    while len(operator_id_queue) > 0:
-        operator_id = operator_id_queue.pop(0)
-        if operator_id is None or operator_id == "":
-            continue
-        operator = OperatorDao.get_operator_by_id(operator_id)
-        operator_list.append(operator)
-        for x in operator.child_operator_ids.split(','):
-            operator_id_queue.append(x)
-
-    # 每个operator 状态初始化为initial
-    for operator in operator_list:
-        OperatorDao.update_operator_by_id(operator.id, "initial")
+    if graph is None:
+        graph = ExecutionGraph.load_by_operator_id(start_nodes[0])
+
+    # 每个operator 状态初始化为initial（批量写入数据库）
+    for operator_id in graph.reachable(start_nodes):
+        OperatorDao.update_operator_by_id(operator_id, "initial")
 
     # 追加执行记录
     model_execute = ModelExecute(start_nodes=','.join(start_nodes), status='initial', execute_user_id=execute_user_id,
@@ -0,0 +1,186 @@
+# -*- coding: UTF-8 -*-
+from app.Utils import *
+from collections import OrderedDict
+import pyarrow.parquet as pq
+
+"""
+数据分页预览
+
+csv：每个文件第一次预览时扫描一遍，每隔 const.PREVIEW_INDEX_STEP 行记录一次该行的字节偏移，同时得到总行数；
+之后任意一页只需 seek 到最近的偏移处，解析该页的行。
+parquet：行数和每个 row group 的行数都在文件 footer 中，只读取与该页有交集的 row group；
+向量、数组列显示为与 csv 中间数据相同的字符串（如 "[0.5, 0.25]"）。
+索引按文件指纹（路径、大小、修改时间）缓存，文件变化后自动重建。
+"""
+
+# 文件指纹 -> 索引
+_index_cache = OrderedDict()
+_index_lock = threading.Lock()
+
+
+def get_page(file_url, start, end):
+    """
+    读取第 [start, end) 行
+    :param file_url:
+    :param start:
+    :param end:
+    :return: (总行数, 该页的 pandas DataFrame)
+    """
+    start = max(int(start), 0)
+    end = int(end)
+    if is_parquet(file_url):
+        return get_parquet_page(file_url, start, end)
+    if file_url[-4:] in ('.xls', 'xlsx'):
+        data = pd.read_excel(file_url, encoding="utf-8")
+        return len(data), data[start:end]
+    return get_csv_page(file_url, start, end)
+
+
+def get_csv_page(file_url, start, end):
+    """
+    csv 分页读取
+    :param file_url:
+    :param start:
+    :param end:
+    :return: (总行数, 该页的 pandas DataFrame)
+    """
+    index = get_index(file_url, build_csv_index)
+    length = index['rows']
+    end = min(end, length)
+    if start >= end:
+        return length, pd.DataFrame(columns=index['columns'])
+    block = start // const.PREVIEW_INDEX_STEP
+    with open(file_url, 'rb') as f:
+        f.seek(index['offsets'][block])
+        skip_records(f, start - block * const.PREVIEW_INDEX_STEP)
+        data = pd.read_csv(f, encoding='utf-8', header=None, names=index['columns'], nrows=end - start)
+    data.index = range(start, start + len(data))
+    return length, data
+
+
+def get_parquet_page(file_url, start, end):
+    """
+    parquet 分页读取，只读取与该页有交集的 row group
+    :param file_url:
+    :param start:
+    :param end:
+    :return: (总行数, 该页的 pandas DataFrame)
+    """
+    index = get_index(file_url, build_parquet_index)
+    length = index['rows']
+    end = min(end, length)
+    pages = []
+    for part_url, row_group, first, rows in index['row_groups']:
+        if first + rows <= start:
+            continue
+        if first >= end:
+            break
+        table = pq.ParquetFile(part_url).read_row_group(row_group)
+        pages.append(table.to_pandas()[max(start - first, 0):end - first])
+    if not pages:
+        return length, pd.DataFrame(columns=index['columns'])
+    data = pd.concat(pages)
+    data.index = range(start, start + len(data))
+    # 向量、数组列按 csv 中间数据的格式显示
+    return length, format_vector_columns(data)
+
+
+def get_index(file_url, build_func):
+    """
+    获取文件的索引，没有或文件已变化时重建
+    :param file_url:
+    :param build_func: 建索引的函数
+    :return:
+    """
+    fingerprint = file_fingerprint(file_url)
+    if fingerprint is None:
+        raise IOError('文件不存在：' + file_url)
+    with _index_lock:
+        index = _index_cache.get(fingerprint)
+        if index is not None:
+            _index_cache.move_to_end(fingerprint)
+            return index
+    index = build_func(file_url)
+    with _index_lock:
+        _index_cache[fingerprint] = index
+        while len(_index_cache) > const.PREVIEW_INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
+
+
+def build_csv_index(file_url):
+    """
+    扫描一遍 csv，每隔 const.PREVIEW_INDEX_STEP 行记录该行的字节偏移
+    引号内的换行不算作行结束（按引号个数的奇偶判断）
+    :param file_url:
+    :return: {'columns': 列名, 'rows': 总行数, 'offsets': [第0行、第step行...的字节偏移]}
+    """
+    columns = pd.read_csv(file_url, encoding='utf-8', nrows=0).columns.values.tolist()
+    offsets = []
+    rows = 0
+    with open(file_url, 'rb') as f:
+        skip_records(f, 1)
+        position = f.tell()
+        in_quote = False
+        record_start = position
+        for line in f:
+            if not in_quote:
+                record_start = position
+            position += len(line)
+            if line.count(b'"') % 2 == 1:
+                in_quote = not in_quote
+            if in_quote or line.strip() == b'':
+                continue
+            if rows % const.PREVIEW_INDEX_STEP == 0:
+                offsets.append(record_start)
+            rows += 1
+    return {'columns': columns, 'rows': rows, 'offsets': offsets}
+
+
+def skip_records(f, n):
+    """
+    从当前位置跳过 n 条记录（与 build_csv_index 的规则一致）
+    :param f: 二进制方式打开的文件
+    :param n:
+    :return:
+    """
+    in_quote = False
+    while n > 0:
+        line = f.readline()
+        if line == b'':
+            return
+        if line.count(b'"') % 2 == 1:
+            in_quote = not in_quote
+        if in_quote:
+            continue
+        if line.strip() == b'':
+            continue
+        n -= 1
+    # 跳过紧跟的空行，使文件位置停在下一条记录的开头
+    while True:
+        record_start = f.tell()
+        line = f.readline()
+        if line == b'' or line.strip() != b'':
+            f.seek(record_start)
+            return
+
+
+def build_parquet_index(file_url):
+    """
+    读取 parquet 各文件的 footer，得到每个 row group 的行数
+    :param file_url: spark 写出的 parquet 目录或单个 parquet 文件
+    :return: {'columns': 列名, 'rows': 总行数, 'row_groups': [(文件, row group 序号, 起始行, 行数)]}
+    """
+    part_urls = parquet_part_urls(file_url)
+    columns = []
+    row_groups = []
+    rows = 0
+    for part_url in part_urls:
+        metadata = pq.ParquetFile(part_url).metadata
+        if not columns:
+            columns = metadata.schema.to_arrow_schema().names
+        for i in range(metadata.num_row_groups):
+            num_rows = metadata.row_group(i).num_rows
+            row_groups.append((part_url, i, rows, num_rows))
+            rows += num_rows
+    return {'columns': columns, 'rows': rows, 'row_groups': row_groups}
@@ -4,8 +4,10 @@
 模型评估
 """
 import app.dao.OperatorDao as OperatorDao
-from pyspark.mllib.classification import SVMModel
-from pyspark.mllib.regression import LabeledPoint
+import app.ExecutionGraph as ExecutionGraph
+import app.service.ml.ModelCache as ModelCache
+import app.service.ml.FeaturePreparation as FeaturePreparation
+import app.service.ml.PredictService as PredictService
 from pyspark.mllib.evaluation import BinaryClassificationMetrics
 from pyspark.ml.linalg import Vectors
 from pyspark.sql.types import Row
@@ -54,10 +56,10 @@ def second_evaluation_core(spark_session, condition, operator_id):
     """
     # 读模型
     # 当前节点（评估节点）一个父节点
-    operator = OperatorDao.get_operator_by_id(operator_id)
+    operator = ExecutionGraph.get_operator(operator_id)
     # 父节点(预测节点) 两个父节点
     father_id = operator.father_operator_ids
-    father_operator = OperatorDao.get_operator_by_id(father_id)
+    father_operator = ExecutionGraph.get_operator(father_id)
     # 祖节点（模型节点和读预测数据节点）
     grand_father_ids = father_operator.father_operator_ids.split(',')
     print("**********祖节点（模型节点和读预测数据源节点）:", grand_father_ids)
@@ -66,7 +68,7 @@ def second_evaluation_core(spark_session, condition, operator_id):
     def get_predict_data(operator_config_):
         for grand_father_file_ in operator_config_:
             grand_father_id_ = list(grand_father_file_.keys())[0]
-            grand_father_ = OperatorDao.get_operator_by_id(grand_father_id_)
+            grand_father_ = ExecutionGraph.get_operator(grand_father_id_)
             if grand_father_.operator_type_id == 5001 or grand_father_.operator_type_id < 3000:
                 print("***************评估函数，预测数据：", grand_father_.operator_type_id)
                 pre_data_file_url = grand_father_.operator_output_url.split('*,')[
@@ -79,7 +81,7 @@ def second_evaluation_core(spark_session, condition, operator_id):
 
     # 评估
     for grand_father_id in grand_father_ids:
-        grand_father = OperatorDao.get_operator_by_id(grand_father_id)
+        grand_father = ExecutionGraph.get_operator(grand_father_id)
         grand_father_operator_type = grand_father.operator_type_id
         # 模型加载节点
         if grand_father_operator_type == 8000:
@@ -111,34 +113,31 @@ def svm_second_evaluation(spark_session, svm_model_path, df, predict_condition,
     label = condition['label']
 
     # 1. 准备数据
-    def func(x):
-        features_data = []
-        for feature in feature_indexs:
-            features_data.append(x[feature])
-        return LabeledPoint(label=x[label], features=features_data)
-
-    predict_data = df.rdd.map(lambda x: func(x))
+    predict_data = FeaturePreparation.assemble_features(df, feature_indexs, label)
 
-    # 加载模型
-    svm_model = SVMModel.load(spark_session.sparkContext, svm_model_path)
+    # 加载模型（已加载过的直接取缓存）
+    svm_weights = PredictService.load_svm_weights(spark_session, svm_model_path)
 
-    # 计算评估指标
-    svmTotalCorrect = predict_data.map(lambda r: 1 if (svm_model.predict(r.features) == r.label) else 0).reduce(
-        lambda x, y: x + y)
-    svmAccuracy = svmTotalCorrect / float(predict_data.count())
+    # 一次打分同时得到原始评分（带有确信度的结果）、按阈值的预测值和标签，缓存后计算各项指标
+    scores = PredictService.svm_score(svm_weights, predict_data).cache()
+    # 正确个数和总数在同一次遍历中计算
+    svmTotalCorrect, total = scores.map(lambda x: (1 if x[1] == x[2] else 0, 1)).reduce(
+        lambda x, y: (x[0] + y[0], x[1] + y[1]))
+    svmAccuracy = svmTotalCorrect / float(total)
 
-    # 清除默认阈值，这样会输出原始的预测评分，即带有确信度的结果
-    svm_model.clearThreshold()
-    svmPredictionAndLabels = predict_data.map(lambda lp: (float(svm_model.predict(lp.features)), lp.label))
+    svmPredictionAndLabels = scores.map(lambda x: (x[0], x[2]))
     svmMetrics = BinaryClassificationMetrics(svmPredictionAndLabels)
-    print("Area under PR = %s" % svmMetrics.areaUnderPR)
-    print("Area under ROC = %s" % svmMetrics.areaUnderROC)
+    area_under_pr = svmMetrics.areaUnderPR
+    area_under_roc = svmMetrics.areaUnderROC
+    scores.unpersist()
+    print("Area under PR = %s" % area_under_pr)
+    print("Area under ROC = %s" % area_under_roc)
 
     # 返回数据
     result = [("正确个数", float(svmTotalCorrect)),
               ("精准度", float(svmAccuracy)),
-              ("Area under PR", float(svmMetrics.areaUnderPR)),
-              ("Area under ROC", float(svmMetrics.areaUnderROC))]
+              ("Area under PR", float(area_under_pr)),
+              ("Area under ROC", float(area_under_roc))]
     return spark_session.createDataFrame(result, schema=['指标', '值'])
 
 
@@ -167,7 +166,7 @@ def lr_second_evaluation(spark_session, lr_model_path, df, predict_condition, co
 
     # 2.加载模型
     print("*****lr_model_path:", lr_model_path)
-    lr_model = LogisticRegressionModel.load(lr_model_path)
+    lr_model = ModelCache.get_model(lr_model_path, 'lr', LogisticRegressionModel.load)
 
     # 计算评估指标
     result = lr_model.transform(predict_data)
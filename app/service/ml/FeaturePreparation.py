@@ -0,0 +1,71 @@
+# -*- coding: UTF-8 -*-
+"""
+机器学习特征准备
+由 VectorAssembler、StringIndexer 组装特征向量和标签，数据始终在 JVM 中，不经过 python worker，也不再推断 schema
+"""
+from pyspark.ml.feature import VectorAssembler, StringIndexer
+from pyspark.mllib.linalg import Vectors as MLLibVectors
+from pyspark.mllib.regression import LabeledPoint
+from app.Utils import *
+
+
+def column_name(df, index):
+    """
+    列名或列号 -> 列名
+    :param df:
+    :param index: 列名或列号
+    :return:
+    """
+    if isinstance(index, int):
+        return df.columns[index]
+    return index
+
+
+def assemble_features(df, feature_indexs, label_index=None, cast_label=True, handle_invalid=None):
+    """
+    只保留特征列和标签列，特征列转换成 double 后组装成向量
+    :param df:
+    :param feature_indexs: 特征列(列名或列号)
+    :param label_index: 标签列(列名或列号)，None 或 "" 表示无标签列
+    :param cast_label: 标签列是否转换成 double（需要 StringIndexer 转索引的标签保留原类型）
+    :param handle_invalid: 无效值的处理，默认为训练时的 const.ML_TRAIN_HANDLE_INVALID，预测时传 const.ML_PREDICT_HANDLE_INVALID
+    :return: spark DataFrame，列为 features（和 label）
+    """
+    if handle_invalid is None:
+        handle_invalid = const.ML_TRAIN_HANDLE_INVALID
+    # 特征列用临时列名，避免原列名中的特殊字符、与 label/features 重名
+    feature_cols = ['feature_' + str(i) for i in range(len(feature_indexs))]
+    columns = [df[column_name(df, feature_indexs[i])].cast('double').alias(feature_cols[i])
+               for i in range(len(feature_indexs))]
+    has_label = not (label_index is None or label_index == "")
+    if has_label:
+        label = df[column_name(df, label_index)]
+        columns.append((label.cast('double') if cast_label else label).alias('label'))
+    assembler = VectorAssembler(inputCols=feature_cols, outputCol='features', handleInvalid=handle_invalid)
+    df = assembler.transform(df.select(*columns))
+    return df.select('label', 'features') if has_label else df.select('features')
+
+
+def index_label(df, input_col='label', output_col='indexed', handle_invalid=None):
+    """
+    标签列转换成索引（StringIndexer）
+    :param df:
+    :param input_col:
+    :param output_col:
+    :param handle_invalid: 无效值的处理，默认为 const.ML_TRAIN_HANDLE_INVALID
+    :return: spark DataFrame
+    """
+    if handle_invalid is None:
+        handle_invalid = const.ML_TRAIN_HANDLE_INVALID
+    indexer = StringIndexer(inputCol=input_col, outputCol=output_col, handleInvalid=handle_invalid)
+    return indexer.fit(df).transform(df)
+
+
+def labeled_points(df):
+    """
+    mllib 训练、评估用的 LabeledPoint RDD，只转换 label、features 两列
+    :param df: assemble_features 的结果（有标签列）
+    :return:
+    """
+    return df.select('label', 'features').rdd.map(
+        lambda r: LabeledPoint(r.label, MLLibVectors.fromML(r.features)))
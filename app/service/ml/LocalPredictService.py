@@ -0,0 +1,264 @@
+# -*- coding: UTF-8 -*-
+"""
+在线预测
+直接读取已保存模型（ml_model 表）的 parquet 数据，在本进程内用 numpy 计算，不提交 spark 作业；
+解析好的模型由 ModelCache 缓存，之后的请求只做矩阵运算。
+支持：支持向量机二分类（6001）、GBDT 二分类（6002）、逻辑回归二分类/多分类（6003、6004）、多层感知机多分类（6005）
+"""
+import numpy as np
+import pyarrow.parquet as pq
+import app.dao.MLModelDao as MLModelDao
+import app.service.ml.ModelCache as ModelCache
+from app.Utils import *
+
+
+def predict(ml_model_id, rows, columns=None):
+    """
+    用保存的模型预测一批数据
+    :param ml_model_id: ml_model 表的 id
+    :param rows: 特征行，[[特征1, 特征2, ...]] 按训练时特征列的顺序；或 [{列名: 值}]，需同时给出 columns
+    :param columns: rows 为字典时特征列的顺序
+    :return: {'prediction': [...], 'probability': [[...]]（有概率输出的模型）}，出错时返回错误信息（str）
+    """
+    ml_model = MLModelDao.get_ml_model(ml_model_id)
+    if ml_model is None:
+        return "模型不存在"
+    loader = LOCAL_MODEL_LOADERS.get(ml_model.operator_type_id)
+    if loader is None:
+        return "不支持该类型的模型：" + str(ml_model.operator_type_id)
+    if not rows:
+        return "没有需要预测的数据"
+    model = ModelCache.get_model(ml_model.model_url, 'local', loader)
+    if isinstance(rows[0], dict):
+        if not columns:
+            return "特征行为字典时需给出特征列 columns"
+        rows = [[row.get(column) for column in columns] for row in rows]
+    features = np.array(rows, dtype=np.float64).reshape(len(rows), -1)
+    if model['num_features'] and features.shape[1] != model['num_features']:
+        return "特征个数应为 " + str(model['num_features'])
+    return model['score'](features)
+
+
+def read_model_data(model_url, name='data'):
+    """
+    读取模型目录下的 parquet 数据（spark 保存模型时写出的 data、treesMetadata 目录）
+    :param model_url:
+    :param name:
+    :return: pandas DataFrame
+    """
+    part_urls = parquet_part_urls(os.path.join(model_url, name))
+    return pd.concat([pq.read_table(part_url).to_pandas() for part_url in part_urls], ignore_index=True)
+
+
+def read_model_metadata(model_url):
+    """
+    读取模型目录下的 metadata（一行 json）
+    :param model_url:
+    :return:
+    """
+    metadata_url = os.path.join(model_url, 'metadata')
+    for name in sorted(os.listdir(metadata_url)):
+        if not name.startswith(('_', '.')):
+            with open(os.path.join(metadata_url, name), encoding='utf-8') as f:
+                return json.loads(f.readline())
+    return {}
+
+
+def to_vector(vector):
+    """
+    parquet 中的向量（type 0 稀疏，1 稠密）-> numpy 数组
+    :param vector: {'type', 'size', 'indices', 'values'}
+    :return:
+    """
+    if vector['type'] == 1:
+        return np.asarray(vector['values'], dtype=np.float64)
+    result = np.zeros(vector['size'])
+    result[np.asarray(vector['indices'], dtype=np.int64)] = vector['values']
+    return result
+
+
+def to_matrix(matrix):
+    """
+    parquet 中的矩阵（type 0 稀疏 CSC，1 稠密，列优先存储）-> numpy 二维数组
+    :param matrix: {'type', 'numRows', 'numCols', 'colPtrs', 'rowIndices', 'values', 'isTransposed'}
+    :return:
+    """
+    num_rows = matrix['numRows']
+    num_cols = matrix['numCols']
+    values = np.asarray(matrix['values'], dtype=np.float64)
+    if matrix['type'] == 1:
+        if matrix['isTransposed']:
+            return values.reshape((num_rows, num_cols))
+        return values.reshape((num_rows, num_cols), order='F')
+    # 稀疏矩阵：isTransposed 时按行压缩（CSR）
+    major, minor = (num_rows, num_cols) if matrix['isTransposed'] else (num_cols, num_rows)
+    result = np.zeros((major, minor))
+    col_ptrs = matrix['colPtrs']
+    row_indices = matrix['rowIndices']
+    for i in range(major):
+        for k in range(col_ptrs[i], col_ptrs[i + 1]):
+            result[i, row_indices[k]] = values[k]
+    return result if matrix['isTransposed'] else result.T
+
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def softmax(x):
+    x = np.exp(x - x.max(axis=1, keepdims=True))
+    return x / x.sum(axis=1, keepdims=True)
+
+
+def load_svm(model_url):
+    """
+    支持向量机（mllib SVMModel）：weights、intercept、threshold
+    :param model_url:
+    :return:
+    """
+    data = read_model_data(model_url).iloc[0]
+    weights = to_vector(data['weights'])
+    intercept = float(data['intercept'])
+    threshold = data['threshold'] if 'threshold' in data and pd.notnull(data['threshold']) else None
+
+    def score(features):
+        margin = features.dot(weights) + intercept
+        if threshold is None:
+            return {'prediction': margin.tolist()}
+        return {'prediction': np.where(margin > threshold, 1.0, 0.0).tolist()}
+
+    return {'num_features': len(weights), 'score': score}
+
+
+def load_lr(model_url):
+    """
+    逻辑回归（ml LogisticRegressionModel）：二分类为 sigmoid + 阈值，多分类为 softmax
+    :param model_url:
+    :return:
+    """
+    data = read_model_data(model_url).iloc[0]
+    coefficients = to_matrix(data['coefficientMatrix'])
+    intercepts = to_vector(data['interceptVector'])
+    param_map = read_model_metadata(model_url).get('paramMap', {})
+    threshold = float(param_map.get('threshold', 0.5))
+
+    def score(features):
+        margins = features.dot(coefficients.T) + intercepts
+        if data['isMultinomial']:
+            probability = softmax(margins)
+            prediction = probability.argmax(axis=1).astype(np.float64)
+        else:
+            positive = sigmoid(margins[:, 0])
+            probability = np.column_stack((1.0 - positive, positive))
+            prediction = np.where(positive > threshold, 1.0, 0.0)
+        return {'prediction': prediction.tolist(), 'probability': probability.tolist()}
+
+    return {'num_features': int(data['numFeatures']), 'score': score}
+
+
+def load_mpc(model_url):
+    """
+    多层感知机（ml MultilayerPerceptronClassificationModel）：
+    weights 依次为每层的权重矩阵（输出个数 x 输入个数，列优先）和偏置，隐藏层 sigmoid，输出层 softmax
+    :param model_url:
+    :return:
+    """
+    weights = to_vector(read_model_data(model_url).iloc[0]['weights'])
+    layers = read_model_metadata(model_url)['paramMap']['layers']
+    affine = []
+    offset = 0
+    for num_in, num_out in zip(layers[:-1], layers[1:]):
+        w = weights[offset:offset + num_out * num_in].reshape((num_out, num_in), order='F')
+        offset += num_out * num_in
+        b = weights[offset:offset + num_out]
+        offset += num_out
+        affine.append((w, b))
+
+    def score(features):
+        output = features
+        for i in range(len(affine)):
+            w, b = affine[i]
+            output = output.dot(w.T) + b
+            output = softmax(output) if i == len(affine) - 1 else sigmoid(output)
+        return {'prediction': output.argmax(axis=1).astype(np.float64).tolist(), 'probability': output.tolist()}
+
+    return {'num_features': layers[0], 'score': score}
+
+
+def load_gbdt(model_url):
+    """
+    GBDT 二分类（ml GBTClassificationModel）：每棵回归树的预测值按树权重累加得到 margin，margin > 0 为正类
+    :param model_url:
+    :return:
+    """
+    nodes = read_model_data(model_url)
+    tree_weights = read_model_data(model_url, 'treesMetadata').set_index('treeID')['weights']
+    metadata = read_model_metadata(model_url)
+    trees = []
+    for tree_id, tree_nodes in nodes.groupby('treeID'):
+        trees.append((float(tree_weights[tree_id]), build_tree(tree_nodes['nodeData'].tolist())))
+
+    def score(features):
+        margin = np.zeros(features.shape[0])
+        for weight, tree in trees:
+            margin += weight * predict_tree(tree, features)
+        positive = sigmoid(2.0 * margin)
+        return {'prediction': np.where(margin > 0.0, 1.0, 0.0).tolist(),
+                'probability': np.column_stack((1.0 - positive, positive)).tolist()}
+
+    return {'num_features': int(metadata.get('numFeatures', 0)), 'score': score}
+
+
+def build_tree(node_data):
+    """
+    决策树节点 -> 按节点 id 索引的数组
+    :param node_data: [{'id', 'prediction', 'leftChild', 'rightChild', 'split': {'featureIndex', 'leftCategoriesOrThreshold', 'numCategories'}}]
+    :return:
+    """
+    size = max(node['id'] for node in node_data) + 1
+    tree = {'feature': np.zeros(size, dtype=np.int64), 'threshold': np.zeros(size),
+            'left': np.full(size, -1, dtype=np.int64), 'right': np.full(size, -1, dtype=np.int64),
+            'value': np.zeros(size), 'categories': {}}
+    for node in node_data:
+        i = node['id']
+        tree['value'][i] = node['prediction']
+        tree['left'][i] = node['leftChild']
+        tree['right'][i] = node['rightChild']
+        # 叶子节点保存为 SplitData(-1, [], -1)，没有切分
+        if node['leftChild'] == -1:
+            continue
+        split = node['split']
+        tree['feature'][i] = split['featureIndex']
+        if split['numCategories'] == -1:
+            tree['threshold'][i] = split['leftCategoriesOrThreshold'][0]
+        else:
+            tree['categories'][i] = np.asarray(split['leftCategoriesOrThreshold'], dtype=np.float64)
+    return tree
+
+
+def predict_tree(tree, features):
+    """
+    一批数据同时从根节点向下走，直到叶子节点
+    连续特征 <= 阈值走左子树；类别特征属于左子树的类别时走左子树
+    :param tree:
+    :param features:
+    :return: 每行的叶子节点预测值
+    """
+    node = np.zeros(features.shape[0], dtype=np.int64)
+    rows = np.arange(features.shape[0])
+    active = tree['left'][node] != -1
+    while active.any():
+        active_rows = rows[active]
+        active_node = node[active]
+        values = features[active_rows, tree['feature'][active_node]]
+        go_left = values <= tree['threshold'][active_node]
+        for i in set(active_node.tolist()) & set(tree['categories'].keys()):
+            mask = active_node == i
+            go_left[mask] = np.isin(values[mask], tree['categories'][i])
+        node[active_rows] = np.where(go_left, tree['left'][active_node], tree['right'][active_node])
+        active = tree['left'][node] != -1
+    return tree['value'][node]
+
+
+# 模型类型（operator_type_id） -> 解析函数
+LOCAL_MODEL_LOADERS = {6001: load_svm, 6002: load_gbdt, 6003: load_lr, 6004: load_lr, 6005: load_mpc}
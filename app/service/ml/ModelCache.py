@@ -0,0 +1,84 @@
+# -*- coding: UTF-8 -*-
+"""
+已加载模型的缓存
+预测、评估算子每次执行都从模型目录加载模型，定时执行的流程会反复加载同一个模型；
+按（加载方式, 模型文件指纹）缓存加载好的模型，模型目录变化后指纹随之变化，自动重新加载；
+缓存的模型目录总大小超过 const.MODEL_CACHE_MAX_BYTES 时淘汰最久未使用的模型。
+缓存的模型由多个线程共享，使用者不能修改（如 SVMModel.clearThreshold）。
+"""
+from collections import OrderedDict
+from app.Utils import *
+
+# (model_type, 文件指纹) -> {'model_url', 'model', 'size'}
+_model_cache = OrderedDict()
+_model_lock = threading.Lock()
+_cache_bytes = 0
+
+
+def get_model(model_url, model_type, loader, release=None):
+    """
+    获取模型，没有或模型目录已变化时加载
+    :param model_url: 模型目录
+    :param model_type: 加载方式，如 'svm'、'gbdt'，同一目录按不同方式加载的模型分别缓存
+    :param loader: 加载函数 loader(model_url)
+    :param release: 模型移出缓存时的释放函数 release(model)，如释放广播变量
+    :return:
+    """
+    global _cache_bytes
+    fingerprint = file_fingerprint(model_url)
+    if fingerprint is None:
+        raise IOError('模型不存在：' + model_url)
+    key = (model_type, fingerprint)
+    with _model_lock:
+        entry = _model_cache.get(key)
+        if entry is not None:
+            _model_cache.move_to_end(key)
+            return entry['model']
+    model = loader(model_url)
+    size = file_size(model_url)
+    evicted = []
+    with _model_lock:
+        if key not in _model_cache:
+            _model_cache[key] = {'model_url': model_url, 'model': model, 'size': size, 'release': release}
+            _cache_bytes += size
+        else:
+            # 其他线程已加载，释放本次加载的
+            evicted.append({'model': model, 'release': release})
+            model = _model_cache[key]['model']
+        # 至少保留刚加载的模型
+        while _cache_bytes > const.MODEL_CACHE_MAX_BYTES and len(_model_cache) > 1:
+            evicted_key, entry = _model_cache.popitem(last=False)
+            _cache_bytes -= entry['size']
+            evicted.append(entry)
+    release_models(evicted)
+    return model
+
+
+def invalidate(model_url):
+    """
+    移除某个模型目录的所有缓存（删除模型时调用）
+    :param model_url:
+    :return:
+    """
+    global _cache_bytes
+    evicted = []
+    with _model_lock:
+        for key in [x for x in _model_cache.keys() if _model_cache[x]['model_url'] == model_url]:
+            entry = _model_cache.pop(key)
+            _cache_bytes -= entry['size']
+            evicted.append(entry)
+    release_models(evicted)
+
+
+def release_models(entries):
+    """
+    释放移出缓存的模型（在锁外调用）
+    :param entries: [{'model', 'release'}]
+    :return:
+    """
+    for entry in entries:
+        if entry['release'] is not None:
+            try:
+                entry['release'](entry['model'])
+            except Exception:
+                traceback.print_exc()
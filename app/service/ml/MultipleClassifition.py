@@ -4,10 +4,9 @@
 """
 
 import app.dao.OperatorDao as OperatorDao
+import app.service.ml.FeaturePreparation as FeaturePreparation
 from app.Utils import *
-from pyspark.ml.linalg import Vectors
 from pyspark.ml.classification import LogisticRegression, MultilayerPerceptronClassifier
-from pyspark.sql.types import Row
 
 
 def model_url():
@@ -80,13 +79,7 @@ def lr_core(df, condition):
             fitIntercept = True
 
     # 1. 准备数据
-    def func(x):
-        features_data = []
-        for feature in feature_indexs:
-            features_data.append(x[feature])
-        return Row(label=x[label_index], features=Vectors.dense(features_data))
-
-    training_set = df.rdd.map(lambda x: func(x)).toDF()
+    training_set = FeaturePreparation.assemble_features(df, feature_indexs, label_index)
 
     # 2.训练模型
     lr_param = LogisticRegression(featuresCol="features", labelCol="label", predictionCol="prediction",
@@ -178,13 +171,7 @@ def mpc_core(df, condition):
         stepSize = float(stepSize)
 
     # 1. 准备数据
-    def func(x):
-        features_data = []
-        for feature in feature_indexs:
-            features_data.append(x[feature])
-        return Row(label=x[label_index], features=Vectors.dense(features_data))
-
-    training_set = df.rdd.map(lambda x: func(x)).toDF()
+    training_set = FeaturePreparation.assemble_features(df, feature_indexs, label_index)
 
     # 2.训练模型
     mpc_param = MultilayerPerceptronClassifier(maxIter=iterations, tol=tol, seed=seed, layers=layers,
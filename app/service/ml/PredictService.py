@@ -3,11 +3,12 @@
 二分类
 """
 from pyspark.mllib.classification import SVMModel
-from pyspark.mllib.regression import LabeledPoint
 import app.dao.OperatorDao as OperatorDao
+import app.ExecutionGraph as ExecutionGraph
+import app.service.ml.FeaturePreparation as FeaturePreparation
+import app.service.ml.ModelCache as ModelCache
 from app.Utils import *
-from pyspark.ml.linalg import Vectors
-from pyspark.sql.types import Row
+from pyspark.sql.types import StructType, StructField, DoubleType
 from pyspark.ml.classification import GBTClassificationModel, LogisticRegressionModel, \
     MultilayerPerceptronClassificationModel
 
@@ -28,7 +29,7 @@ def ml_predict(spark_session, operator_id, file_urls, condition):
         # 读取数据
         for url in file_urls:
             print("------fileUrl:", file_urls)
-            if url[-4:] == ".csv":
+            if is_data_file(url):
                 url1 = url
             else:
                 url0 = url
@@ -65,11 +66,11 @@ def ml_predict_core(spark_session, operator_id, df, model_url, condition):
     """
 
     # 父节点是什么组件
-    operator = OperatorDao.get_operator_by_id(operator_id)
+    operator = ExecutionGraph.get_operator(operator_id)
     father_ids = operator.father_operator_ids.split(',')
     print("**********", operator.father_operator_ids)
     for father_id in father_ids:
-        father = OperatorDao.get_operator_by_id(father_id)
+        father = ExecutionGraph.get_operator(father_id)
         print("***************", father.operator_type_id)
         print("---------------", father.operator_type_id == 6001)
         operator_type_flag = father.operator_type_id
@@ -105,52 +106,97 @@ def svm_second_predict(spark_session, svm_model_path, df, condition):
     """
     feature_indexs = condition['features']
     label_index = condition['label']
+    # 加载模型（已加载过的直接取缓存）
+    svm_weights = load_svm_weights(spark_session, svm_model_path)
+    # 1. 准备数据
+    predict_data = FeaturePreparation.assemble_features(df, feature_indexs, label_index,
+                                                        handle_invalid=const.ML_PREDICT_HANDLE_INVALID)
+    # 2.预测，按给定的 schema 建 DataFrame，不再推断
+    scores = svm_score(svm_weights, predict_data)
     if label_index is None or label_index == "":  # 无标签列
-        # 1. 准备数据
-        def func(x):
-            features_data = []
-            for feature in feature_indexs:
-                features_data.append(x[feature])
-            return features_data
-
-        predict_data = df.rdd.map(lambda x: func(x))
-        print(predict_data.take(10))
-
-        # 2.加载模型
-        svm_model = SVMModel.load(spark_session.sparkContext, svm_model_path)
-
-        # 3.预测
-        def f(x):
-            return {"prediction_result": x}
-
-        prediction_rdd = svm_model.predict(predict_data)
-        print(prediction_rdd.take(10))
-        prediction_df = prediction_rdd.map(lambda x: Row(**f(x))).toDF()
-        return prediction_df
+        schema = StructType([StructField("prediction_result", DoubleType())])
+        return spark_session.createDataFrame(scores.map(lambda x: (x[1],)), schema)
     else:  # 有标签列
-        # 1. 准备数据
-        def func(x):
-            features_data = []
-            for feature in feature_indexs:
-                features_data.append(x[feature])
-            return LabeledPoint(label=x[label_index], features=features_data)
+        schema = StructType([StructField("prediction_result", DoubleType()),
+                             StructField(FeaturePreparation.column_name(df, label_index), DoubleType())])
+        return spark_session.createDataFrame(scores.map(lambda x: (x[1], x[2])), schema)
 
-        predict_label_data = df.rdd.map(lambda x: func(x))
-        print(predict_label_data.take(10))
 
-        # 2.加载模型
-        svm_model = SVMModel.load(spark_session.sparkContext, svm_model_path)
+def load_svm_weights(spark_session, svm_model_path):
+    """
+    加载支持向量机模型并广播权重（已加载过的直接取缓存）
+    同一模型的所有预测、评估共用一个广播变量，模型被淘汰出缓存时释放
+    :param spark_session:
+    :param svm_model_path: 模型地址
+    :return: 广播变量 (weights, intercept, threshold)
+    """
 
-        # 3.预测
-        from pyspark.sql.types import Row
+    def loader(model_url):
+        svm_model = SVMModel.load(spark_session.sparkContext, model_url)
+        return spark_session.sparkContext.broadcast(
+            (svm_model.weights.toArray(), float(svm_model.intercept), svm_model.threshold))
 
-        def f(x):
-            return {"prediction_result": x[0], label_index: x[1]}
+    # 淘汰时只 unpersist 不 destroy：仍在使用它的作业会重新分发
+    return ModelCache.get_model(svm_model_path, 'svm', loader, release=lambda x: x.unpersist())
 
-        prediction_rdd = predict_label_data.map(lambda x: (svm_model.predict(x.features), x.label))
-        print(prediction_rdd.take(10))
-        prediction_df = prediction_rdd.map(lambda x: Row(**f(x))).toDF()
-        return prediction_df
+
+def svm_score(svm_weights, df):
+    """
+    支持向量机批量打分
+    每个分区按 const.SVM_SCORE_BATCH_ROWS 行一批，用 numpy 做一次矩阵乘法，
+    不再在每个 task 的闭包中序列化模型、逐行调用 svm_model.predict
+    :param svm_weights: load_svm_weights 的结果
+    :param df: FeaturePreparation.assemble_features 的结果
+    :return: RDD [(原始评分, 预测值, 标签)]，预测值按模型的阈值为 0/1（模型没有阈值时为原始评分，与 mllib 一致），
+             没有标签列时标签为 None
+    """
+    has_label = 'label' in df.columns
+    batch_rows = const.SVM_SCORE_BATCH_ROWS
+
+    def score_batch(batch):
+        import numpy as np
+        weights, intercept, svm_threshold = svm_weights.value
+        margins = np.vstack([row.features.toArray() for row in batch]).dot(weights) + intercept
+        if svm_threshold is None:
+            predictions = margins
+        else:
+            predictions = np.where(margins > svm_threshold, 1.0, 0.0)
+        for i in range(len(batch)):
+            label = float(batch[i].label) if has_label and batch[i].label is not None else None
+            yield float(margins[i]), float(predictions[i]), label
+
+    def score_partition(rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_rows:
+                for result in score_batch(batch):
+                    yield result
+                batch = []
+        if batch:
+            for result in score_batch(batch):
+                yield result
+
+    columns = ['label', 'features'] if has_label else ['features']
+    return df.select(*columns).rdd.mapPartitions(score_partition)
+
+
+def spark_ml_predict(model, df, condition):
+    """
+    spark ml 模型预测：组装特征向量后 transform
+    :param model: 已加载的模型
+    :param df: 数据
+    :param condition: {"features": [12, 13, 14, 15], "label": "label"}
+    :return: 预测结果 spark dataframe
+    """
+    feature_indexs = condition['features']
+    label_index = condition['label']
+    # 预测时标签列原样输出
+    predict_set = FeaturePreparation.assemble_features(df, feature_indexs, label_index, cast_label=False,
+                                                       handle_invalid=const.ML_PREDICT_HANDLE_INVALID)
+    if label_index is None or label_index == "":  # 无标签列
+        return model.transform(predict_set).select("prediction", "features")
+    return model.transform(predict_set).select("prediction", "label", "features")
 
 
 def gbdt_second_predict(gbdt_model_path, df, condition):
@@ -162,42 +208,9 @@ def gbdt_second_predict(gbdt_model_path, df, condition):
     特征列
     :return: 预测结果 sparkframe
     """
-    feature_indexs = condition['features']
-    label_index = condition['label']
-
-    if label_index is None or label_index == "":  # 无标签列
-        # 1. 准备数据
-        def func(x):
-            features_data = []
-            for feature in feature_indexs:
-                features_data.append(x[feature])
-            return Row(features=Vectors.dense(features_data))
-
-        training_set = df.rdd.map(lambda x: func(x)).toDF()
-
-        # 2.加载模型
-        gbdt_model = GBTClassificationModel.load(gbdt_model_path)
-
-        # 3.预测
-        prediction_df = gbdt_model.transform(training_set).select("prediction", "features")
-        return prediction_df
-    else:  # 有标签列
-        # 1. 准备数据
-        def func(x):
-            features_data = []
-            for feature in feature_indexs:
-                features_data.append(x[feature])
-            return Row(label=x[label_index], features=Vectors.dense(features_data))
-
-        training_set = df.rdd.map(lambda x: func(x)).toDF()
-
-        # 2.加载模型
-        print("****gbdt_model_path:", gbdt_model_path)
-        gbdt_model = GBTClassificationModel.load(gbdt_model_path)
-
-        # 3.预测
-        prediction_df = gbdt_model.transform(training_set).select("prediction", "label", "features")
-        return prediction_df
+    print("****gbdt_model_path:", gbdt_model_path)
+    gbdt_model = ModelCache.get_model(gbdt_model_path, 'gbdt', GBTClassificationModel.load)
+    return spark_ml_predict(gbdt_model, df, condition)
 
 
 def lr_second_predict(lr_model_path, df, condition):
@@ -209,42 +222,9 @@ def lr_second_predict(lr_model_path, df, condition):
     特征列
     :return: 预测结果 spark dataframe
     """
-    feature_indexs = condition['features']
-    label_index = condition['label']
-
-    if label_index is None or label_index == "":  # 无标签列
-        # 1. 准备数据
-        def func(x):
-            features_data = []
-            for feature in feature_indexs:
-                features_data.append(x[feature])
-            return Row(features=Vectors.dense(features_data))
-
-        training_set = df.rdd.map(lambda x: func(x)).toDF()
-
-        # 2.加载模型
-        lr_model = LogisticRegressionModel.load(lr_model_path)
-
-        # 3.预测
-        prediction_df = lr_model.transform(training_set).select("prediction", "features")
-        return prediction_df
-    else:  # 有标签列
-        # 1. 准备数据
-        def func(x):
-            features_data = []
-            for feature in feature_indexs:
-                features_data.append(x[feature])
-            return Row(label=x[label_index], features=Vectors.dense(features_data))
-
-        training_set = df.rdd.map(lambda x: func(x)).toDF()
-
-        # 2.加载模型
-        print("*****lr_model_path:", lr_model_path)
-        lr_model = LogisticRegressionModel.load(lr_model_path)
-
-        # 3.预测
-        prediction_df = lr_model.transform(training_set).select("prediction", "label", "features")
-        return prediction_df
+    print("*****lr_model_path:", lr_model_path)
+    lr_model = ModelCache.get_model(lr_model_path, 'lr', LogisticRegressionModel.load)
+    return spark_ml_predict(lr_model, df, condition)
 
 
 """ 多分类 """
@@ -271,39 +251,6 @@ def mpc_multiple_predict(mpc_model_path, df, condition):
     特征列
     :return: 预测结果 sparkframe
     """
-    feature_indexs = condition['features']
-    label_index = condition['label']
-
-    if label_index is None or label_index == "":  # 无标签列
-        # 1. 准备数据
-        def func(x):
-            features_data = []
-            for feature in feature_indexs:
-                features_data.append(x[feature])
-            return Row(features=Vectors.dense(features_data))
-
-        training_set = df.rdd.map(lambda x: func(x)).toDF()
-
-        # 2.加载模型
-        mpc_model = MultilayerPerceptronClassificationModel.load(mpc_model_path)
-
-        # 3.预测
-        prediction_df = mpc_model.transform(training_set).select("prediction", "features")
-        return prediction_df
-    else:  # 有标签列
-        # 1. 准备数据
-        def func(x):
-            features_data = []
-            for feature in feature_indexs:
-                features_data.append(x[feature])
-            return Row(label=x[label_index], features=Vectors.dense(features_data))
-
-        training_set = df.rdd.map(lambda x: func(x)).toDF()
-
-        # 2.加载模型
-        print("*****mpc_model_path:", mpc_model_path)
-        mpc_model = MultilayerPerceptronClassificationModel.load(mpc_model_path)
-
-        # 3.预测
-        prediction_df = mpc_model.transform(training_set).select("prediction", "label", "features")
-        return prediction_df
+    print("*****mpc_model_path:", mpc_model_path)
+    mpc_model = ModelCache.get_model(mpc_model_path, 'mpc', MultilayerPerceptronClassificationModel.load)
+    return spark_ml_predict(mpc_model, df, condition)
@@ -3,14 +3,11 @@
 二分类
 """
 from pyspark.mllib.classification import SVMWithSGD
-from pyspark.mllib.regression import LabeledPoint
 import app.dao.OperatorDao as OperatorDao
+import app.service.ml.FeaturePreparation as FeaturePreparation
 from app.Utils import *
 
-from pyspark.ml.linalg import Vectors
 from pyspark.ml.classification import GBTClassifier, LogisticRegression
-from pyspark.ml.feature import StringIndexer
-from pyspark.sql.types import Row
 
 
 def model_url():
@@ -68,14 +65,9 @@ def svm_core(spark_session, df, condition):
     reg_type = condition['regType']  # 正则化
     convergence_tol = condition['convergenceTol']  # 收敛系数
 
-    # 1. 准备数据
-    def func(x):
-        features_data = []
-        for feature in feature_indexs:
-            features_data.append(x[feature])
-        return LabeledPoint(label=x[label_index], features=features_data)
-
-    training_data = df.rdd.map(lambda x: func(x))
+    # 1. 准备数据（mllib 只接受 RDD，只转换组装好的 label、features 两列）
+    training_data = FeaturePreparation.labeled_points(
+        FeaturePreparation.assemble_features(df, feature_indexs, label_index))
 
     # 2. 训练
     svm_model = SVMWithSGD.train(training_data, iterations=iterations, step=step, regParam=reg_param,
@@ -138,17 +130,8 @@ def gbdt_core(df, condition):
     seed = condition['seed']  # 随机数产生器种子[0,10]
 
     # 1. 准备数据
-    def func(x):
-        features_data = []
-        for feature in feature_indexs:
-            features_data.append(x[feature])
-        return Row(label=x[label_index], features=Vectors.dense(features_data))
-
-    training_set = df.rdd.map(lambda x: func(x)).toDF()
-
-    string_indexer = StringIndexer(inputCol="label", outputCol="indexed")
-    si_model = string_indexer.fit(training_set)
-    tf = si_model.transform(training_set)
+    training_set = FeaturePreparation.assemble_features(df, feature_indexs, label_index, cast_label=False)
+    tf = FeaturePreparation.index_label(training_set, "label", "indexed")
 
     # 2. 训练
     gbdt = GBTClassifier(labelCol="indexed",
@@ -230,13 +213,7 @@ def lr_core(df, condition):
         threshold = float(threshold)
 
     # 1. 准备数据
-    def func(x):
-        features_data = []
-        for feature in feature_indexs:
-            features_data.append(x[feature])
-        return Row(label=x[label_index], features=Vectors.dense(features_data))
-
-    training_set = df.rdd.map(lambda x: func(x)).toDF()
+    training_set = FeaturePreparation.assemble_features(df, feature_indexs, label_index)
 
     # 2.训练模型
     lr_param = LogisticRegression(featuresCol="features", labelCol="label", predictionCol="prediction",
@@ -5,6 +5,7 @@ from app.Utils import *
 import app.dao.OperatorDao as OperatorDao
 import pandas as pd
 import app.service.MLModelService as MLModelService
+import app.service.PreviewService as PreviewService
 
 
 # 解决 list, dict 不能返回的问题
@@ -30,23 +31,23 @@ def get_operate_result_data():
     end = int(request.form.get('end'))
     print(operator_id, start, end)
     operator = OperatorDao.get_operator_by_id(operator_id)
+    if operator.status == "saving":
+        return "结果保存中，请稍后"
     if operator.status != "success":
         return "请执行该节点"
-    if operator.operator_output_url is not None:
+    if operator.operator_output_url is not None and operator.operator_output_url != '':
         operator_output_url = operator.operator_output_url.split('*,')
     else:
         return "没有运行结果"
     result_arr = []
     try:
         for i in range(len(operator_output_url)):
-            data = pd.read_csv(operator_output_url[i], encoding='utf-8')
-            if len(data) < end:
-                end = len(data)
-            if start > end:
-                result_arr.append({'length': len(data), 'data': "请输入合法参数", 'position': i})
+            length, data = PreviewService.get_page(operator_output_url[i], start, end)
+            if start > min(end, length):
+                result_arr.append({'length': length, 'data': "请输入合法参数", 'position': i})
             else:
-                data2 = data[int(start):int(end)].to_json(orient='records', force_ascii=False)
-                result_arr.append({'length': len(data), 'data': json.loads(data2), 'position': i})
+                data2 = data.to_json(orient='records', force_ascii=False)
+                result_arr.append({'length': length, 'data': json.loads(data2), 'position': i})
         return jsonify(result_arr)
     except:
         traceback.print_exc()
@@ -106,8 +107,8 @@ def delete_operate_model():
     """
     ml_model_id = request.form.get('MLModelId')
     try:
-        model = MLModelService.delete_ml_model(ml_model_id)
-        return 'success'
+        if MLModelService.delete_ml_model(ml_model_id) is not False:
+            return 'success'
     except:
         traceback.print_exc()
     return "Error，please contact the administrator "
@@ -0,0 +1,34 @@
+# -*- coding: UTF-8 -*-
+from flask import jsonify, Response, request
+from app import app
+from app.Utils import *
+import app.service.ml.LocalPredictService as LocalPredictService
+
+
+# 解决 list, dict 不能返回的问题
+class MyResponse(Response):
+    @classmethod
+    def force_type(cls, response, environ=None):
+        if isinstance(response, (list, dict)):
+            response = jsonify(response)
+        return super(Response, cls).force_type(response, environ)
+
+
+app.response_class = MyResponse
+
+
+@app.route('/predict/<int:ml_model_id>', methods=['POST'])
+def online_predict(ml_model_id):
+    """
+    在线预测：用保存的模型（ml_model）预测一批数据，不经过 spark
+    请求体（json）：{"rows": [[特征1, 特征2, ...], ...]} 或 {"columns": ["列1", "列2"], "rows": [{"列1": 值, "列2": 值}, ...]}
+    :param ml_model_id:
+    :return: {"prediction": [...], "probability": [[...]]}
+    """
+    body = request.get_json(force=True, silent=True) or {}
+    try:
+        result = LocalPredictService.predict(ml_model_id, body.get('rows'), body.get('columns'))
+    except Exception as e:
+        traceback.print_exc()
+        return "预测失败：" + str(e)
+    return result
@@ -1,9 +1,12 @@
 # -*- coding: UTF-8 -*-
-from flask import request, jsonify, Response
+from flask import request, jsonify, Response, stream_with_context
 from app import app
 from app.Utils import *
 from app.dao.ModelDao import *
 import app.service.ModelService as ModelService
+import app.dao.ModelExecuteDao as ModelExecuteDao
+import app.ExecutionEvents as ExecutionEvents
+import queue
 
 
 # 解决 list, dict 不能返回的问题
@@ -78,22 +81,101 @@ def get_run_status():
     return flow
 
 
+@app.route("/model/getRunReport", methods=['POST'])
+def get_run_report():
+    """
+    查看某次执行中每个算子的运行指标（耗时、行数、字节数、spark stage 数）
+    :return:
+    """
+    model_execute_id = request.form.get('modelExecuteId')
+    report = ModelService.get_run_report(model_execute_id)
+    if report is False:
+        return "获取运行报告失败，请联系工作人员"
+    return report
+
+
+@app.route("/model/runStatusStream", methods=['GET'])
+def run_status_stream():
+    """
+    推送某次执行中算子的状态变化（Server-Sent Events），代替轮询 /model/getRunStatus
+    先推送一次当前状态（传 projectId 时），之后每个算子状态变化推送一次，执行结束后关闭
+    :return:
+    """
+    project_id = request.args.get('projectId')
+    model_execute_id = int(request.args.get('modelExecuteId'))
+    # 先订阅，再查当前状态，避免漏掉之间的事件
+    subscriber = ExecutionEvents.subscribe(model_execute_id)
+
+    def send(event):
+        return 'data: ' + json.dumps(event, ensure_ascii=False) + '\n\n'
+
+    def stream():
+        try:
+            if project_id:
+                flow = ModelService.get_run_status_by_project_id(project_id, model_execute_id)
+                if flow is not False:
+                    yield send({'type': 'snapshot', 'data': flow})
+            model_execute = ModelExecuteDao.get_model_execute_by_id(model_execute_id)
+            if not model_execute or model_execute.status not in ('initial', 'queued', 'running'):
+                yield send({'type': 'execute', 'status': model_execute.status if model_execute else 'error'})
+                return
+            while True:
+                try:
+                    event = subscriber.get(timeout=const.EVENT_STREAM_HEARTBEAT)
+                except queue.Empty:
+                    # 心跳，保持连接
+                    yield ': keep-alive\n\n'
+                    continue
+                yield send(event)
+                if event['type'] == 'execute':
+                    return
+        finally:
+            ExecutionEvents.unsubscribe(model_execute_id, subscriber)
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+def get_fuse_param():
+    """
+    执行方式参数
+    fuse：'true' 时融合执行，线性链路中间的算子不保存结果；previewNodes：融合执行时仍需保存结果的算子 "id1,id2"
+    :return:
+    """
+    fuse = request.form.get('fuse') == 'true'
+    preview_nodes = request.form.get('previewNodes')
+    if preview_nodes is None or preview_nodes == '':
+        preview_nodes = []
+    else:
+        preview_nodes = preview_nodes.split(',')
+    return {'fuse': fuse, 'preview_nodes': preview_nodes}
+
+
+def get_priority_param():
+    """
+    执行优先级参数 priority，越大越先执行，默认为0
+    :return:
+    """
+    priority = request.form.get('priority')
+    if priority is None or priority == '':
+        return 0
+    return int(priority)
+
+
 @app.route("/model/executeAll", methods=['POST'])
 def model_execute_all():
     """
     从model（执行流程）中的某个节点开始执行
     :return:
     """
-    import _thread
-
     project_id = request.form.get('projectId')
     user_id = request.form.get('userId')
     print('-----/model/executeAll-----', user_id, project_id)
 
     try:
         param = ModelService.run_execute_status_from_start(user_id, project_id)
-        _thread.start_new_thread(ModelService.model_execute, (user_id, project_id, param))
-        return {'model_execute_id': param['model_execute_id']}
+        param.update(get_fuse_param())
+        ModelService.submit_model_execute(user_id, project_id, param, get_priority_param())
+        return {'model_execute_id': param['model_execute_id'], 'status': 'queued'}
     except:
         traceback.print_exc()
         print("Error: 无法启动线程")
@@ -106,8 +188,6 @@ def model_execute_from_one():
     从model（执行流程）中的某个节点开始执行
     :return:
     """
-    import _thread
-
     project_id = request.form.get('projectId')
     user_id = request.form.get('userId')
     operator_id = request.form.get('operatorId')
@@ -115,10 +195,26 @@ def model_execute_from_one():
 
     try:
         param = ModelService.run_execute_status_from_one(user_id, operator_id)
-        _thread.start_new_thread(ModelService.model_execute, (user_id, project_id, param))
-        return {'model_execute_id': param['model_execute_id']}
+        param.update(get_fuse_param())
+        ModelService.submit_model_execute(user_id, project_id, param, get_priority_param())
+        return {'model_execute_id': param['model_execute_id'], 'status': 'queued'}
     except:
         print("Error: 无法启动线程")
         return '启动失败'
 
     return '启动成功'
+
+
+@app.route("/model/cancelExecute", methods=['POST'])
+def model_cancel_execute():
+    """
+    取消 model（执行流程）的执行
+    :return:
+    """
+    model_execute_id = int(request.form.get('modelExecuteId'))
+    print('-----/model/cancelExecute-----', model_execute_id)
+
+    status = ModelService.cancel_model_execute(model_execute_id)
+    if status is None:
+        return "该执行已结束或不存在"
+    return {'model_execute_id': model_execute_id, 'status': 'cancelled'}
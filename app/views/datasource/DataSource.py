@@ -9,6 +9,9 @@ from sqlalchemy.sql import and_, or_, text
 from flask.json import jsonify
 import json
 import pandas as pd
+import app.service.PreviewService as PreviewService
+import app.service.MetadataService as MetadataService
+import app.service.ExplorationService as ExplorationService
 
 ALLOWED_EXTENSIONS = set(['txt', 'csv', 'pdf', 'png', 'jpg', 'jpeg', 'gif'])
 
@@ -74,6 +77,8 @@ def upload_file():
             # 格式化成2016-03-20 11:45:39形式
             create_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
             add_DataSource(file.filename[:-4], file_url, "CSV", create_user, open_level, create_time)
+            # 生成文件元数据（列名、列类型、行数）
+            MetadataService.refresh_metadata(file_url)
             return '文件上传成功'
     return html
 
@@ -133,9 +138,9 @@ def data_preview():
         end = request.form.get('end')
 
     try:
-        data = pd.read_csv(fileUrl, encoding='utf-8')
-        data2 = data[int(start):int(end)].to_json(orient='records', force_ascii=False)
-        return jsonify({'length': len(data), 'data': json.loads(data2)})
+        length, data = PreviewService.get_page(fileUrl, start, end)
+        data2 = data.to_json(orient='records', force_ascii=False)
+        return jsonify({'length': length, 'data': json.loads(data2)})
     except:
         return "error read"
 
@@ -154,8 +159,7 @@ def get_column_names():
         return "需要get请求"
 
     try:
-        data = pd.read_csv(fileUrl, encoding='utf-8')
-        return jsonify(data.columns.values.tolist())
+        return jsonify(MetadataService.get_column_names(fileUrl))
     except:
         return "error read"
 
@@ -173,12 +177,24 @@ def get_column_names_with_number_type():
     else:
         return "需要get请求"
     try:
-        data = pd.read_csv(fileUrl, encoding='utf-8')
-        res = []
-        for col in data.columns.values.tolist():
-            if (data[col].dtype == 'int64' or data[col].dtype == 'float64'):
-                res.append(col)
-        return jsonify(res)
+        return jsonify(MetadataService.get_number_column_names(fileUrl))
+    except:
+        return "error read"
+
+
+@app.route("/dataSource/scatterPlot", methods=['GET', 'POST'])
+def scatter_plot():
+    """
+    散点图数据：只读取所选两列，点数多时随机抽样（sampleSize）或按 bins*bins 网格分箱（bins）
+    :return:
+    """
+    fileUrl = request.form.get('fileUrl')
+    columnNames = request.form.get('columnNames').split(',')
+    sampleSize = request.form.get('sampleSize')
+    bins = request.form.get('bins')
+    try:
+        return jsonify(ExplorationService.scatter_plot_data(fileUrl, {'columnNames': columnNames,
+                                                                      'sampleSize': sampleSize, 'bins': bins}))
     except:
         return "error read"
 
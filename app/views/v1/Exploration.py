@@ -3,9 +3,11 @@ from flask import request, jsonify, Response
 from flask.json import jsonify
 from app import app
 import json, os, shutil
-from app.Utils import mkdir, getProjectCurrentDataUrl
+from app.Utils import mkdir, getProjectCurrentDataUrl, read_data_pandas_chunks, getSparkSession
 import pandas as pd
 from app.ConstFile import const
+import app.service.MetadataService as MetadataService
+import app.service.ExplorationService as ExplorationService
 
 jsonFileName = const.JSONFILENAME
 
@@ -34,8 +36,7 @@ def getColumnNames():
         projectName = request.form.get('projectName')
     fileUrl = getProjectCurrentDataUrl(projectName)['fileUrl']
     try:
-        data = pd.read_csv(fileUrl, encoding='utf-8')
-        return data.columns.values.tolist()
+        return MetadataService.get_column_names(fileUrl[len('file://'):])
     except:
         return "error read"
 
@@ -49,12 +50,7 @@ def getColumnNameWithNumberType():
         projectName = request.form.get('projectName')
     fileUrl = getProjectCurrentDataUrl(projectName)['fileUrl']
     try:
-        data = pd.read_csv(fileUrl, encoding='utf-8')
-        res = []
-        for col in data.columns.values.tolist():
-            if (data[col].dtype == 'int64' or data[col].dtype == 'float64'):
-                res.append(col)
-        return res
+        return MetadataService.get_number_column_names(fileUrl[len('file://'):])
     except:
         return "error read"
 
@@ -76,38 +72,20 @@ def fullTableStatistics():
     fileUrl = urls['fileUrl']
     projectAddress = urls['projectAddress']
     if fileUrl[-4:] == ".csv":
-        df_excel = pd.read_csv(fileUrl, encoding="utf-8")
+        df_excel = pd.read_csv(fileUrl, encoding="utf-8", usecols=columnNames)
     else:
-        df_excel = pd.read_excel(fileUrl, encoding="utf-8")
+        df_excel = pd.read_excel(fileUrl, encoding="utf-8", usecols=columnNames)
     # 全表统计
     res = []
     statistics = [' 字段名', ' 类型', '总数', '最小值', '最小值位置', '25%分位数', '中位数', '75%分位数', '均值', '最大值', '最大值位置', '平均绝对偏差', '方差',
                   '标准差', '偏度', '峰度']
+    result_df = ExplorationService.full_table_statistics_core(df_excel, {'columnNames': columnNames})
     for columnName in columnNames:
-        info = {}.fromkeys(statistics)
-        info[' 字段名'] = columnName
-        info[' 类型'] = df_excel[columnName].dtype
-        if info[' 类型'] == 'int64' or info[' 类型'] == 'float64':
-            info[' 类型'] = 'number'
-            info['总数'] = str(df_excel[columnName].count())
-            info['最小值'] = str(df_excel[columnName].min())
-            info['最小值位置'] = str(df_excel[columnName].idxmin())
-            info['25%分位数'] = str(df_excel[columnName].quantile(.25))
-            info['中位数'] = str(df_excel[columnName].median())
-            info['75%分位数'] = str(df_excel[columnName].quantile(.75))
-            info['均值'] = str(df_excel[columnName].mean())
-            info['最大值'] = str(df_excel[columnName].max())
-            info['最大值位置'] = str(df_excel[columnName].idxmax())
-            info['平均绝对偏差'] = str(df_excel[columnName].mad())
-            info['方差'] = str(df_excel[columnName].var())
-            info['标准差'] = str(df_excel[columnName].std())
-            info['偏度'] = str(df_excel[columnName].skew())
-            info['峰度'] = str(df_excel[columnName].kurt())
-            print('int')
-        else:
-            info[' 类型'] = "text"
-            info['总数'] = str(df_excel[columnName].count())
-            print("text")
+        info = dict(zip(statistics, [columnName] + result_df[columnName].tolist()))
+        if info[' 类型'] == 'text':
+            # 文本列只有总数
+            for statistic in statistics[3:]:
+                info[statistic] = None
         res.append(info)
     # 写入文件
     mkdir(projectAddress + '/全表统计')
@@ -413,8 +391,7 @@ def getColumnNamesAndViews():
     fileUrl = getProjectCurrentDataUrl(projectName)['fileUrl']
     result = {}
     try:
-        data = pd.read_csv(fileUrl, encoding='utf-8')
-        result['columnNames'] = data.columns.values.tolist()
+        result['columnNames'] = MetadataService.get_column_names(fileUrl[len('file://'):])
         result['FullTableStatisticsView'] = getfileListFun('FullTableStatisticsView', projectName)
         result['FrequencyStatisticsView'] = getfileListFun('FrequencyStatisticsView', projectName)
         result['CorrelationCoefficientView'] = getfileListFun('CorrelationCoefficientView', projectName)
@@ -444,16 +421,13 @@ def frequencyStatistics():
         return '项目名或项目路径有误'
     fileUrl = urls['fileUrl']
     projectAddress = urls['projectAddress']
-    if fileUrl[-4:] == ".csv":
-        df = pd.read_csv(fileUrl, encoding="utf-8")
-    else:
-        df = pd.read_excel(fileUrl, encoding="utf-8")
-
-    # 频次统计
+    # 频次统计（分块读取所选列，流式计算）
+    chunks = read_data_pandas_chunks(fileUrl[len('file://'):], [columnName])
+    result_df, distinct, error = ExplorationService.frequency_statistics_stream(chunks, {'columnName': columnName})
     res = {}
-    for i in range(len(df[columnName].value_counts().index)):
-        res.setdefault(df[columnName].value_counts().index[i], str(df[columnName].value_counts().values[i]))
-        i += 1
+    values = result_df[columnName].tolist()
+    for i in range(len(values)):
+        res.setdefault(values[i], str(result_df['频率'].iat[i]))
 
     # 写入文件
     mkdir(projectAddress + '/频次统计')
@@ -465,6 +439,10 @@ def frequencyStatistics():
     response = jsonify(res)
     print(res)
     response.headers.add('Access-Control-Allow-Origin', '*')
+    # 不同值的个数（近似）和频率的误差上限（为 0 时是精确计数）
+    response.headers.add('Distinct-Count', str(distinct))
+    response.headers.add('Frequency-Error', str(error))
+    response.headers.add('Access-Control-Expose-Headers', 'Distinct-Count, Frequency-Error')
     return response
 
 
@@ -487,29 +465,15 @@ def correlationCoefficient():
         return '项目名或项目路径有误'
     fileUrl = urls['fileUrl']
     projectAddress = urls['projectAddress']
-    if fileUrl[-4:] == ".csv":
-        df = pd.read_csv(fileUrl, encoding="utf-8")
-    else:
-        df = pd.read_excel(fileUrl, encoding="utf-8")
-
-    # 报错信息：如果所选列不是数值型，则报错
-    acceptTypes = ['int64', 'float64']
-    for columnName in columnNames:
-        if df[columnName].dtype not in acceptTypes:
-            return "只能计算数值型列的相关系数，但是 <" + columnName + "> 的类型为 " + str(df[columnName].dtype)
-
-    # 计算出相关系数矩阵df
-    df = df.corr()
-    res = {}
-    print(df)
-    # 转存成为dict，此时对数据进行过滤，只显示用户在columnNames里面选择的列
-    for index in df.index:
-        if index in columnNames:
-            temp = {}
-            for column in df.columns:
-                if column in columnNames:
-                    temp.setdefault(column, df.loc[index, column])
-            res.setdefault(index, temp)
+    # 只读取、只计算所选列；数据较大时用 spark 计算
+    condition = {'columnNames': columnNames, 'method': request.form.get('method', 'pearson')}
+    spark_session = None
+    if ExplorationService.use_spark_engine(fileUrl[len('file://'):]):
+        spark_session = getSparkSession(request.form.get('userId'), 'correlationCoefficient')
+    df, note = ExplorationService.correlation_coefficient_data(spark_session, fileUrl[len('file://'):], condition)
+    if isinstance(df, str):
+        return df
+    res = df.to_dict(orient='index')
     print(res)
 
     # 写入文件
@@ -536,36 +500,19 @@ def scatterPlot():
         columnNames[i] = columnNames[i].strip('""')
     print('projectName: {}, columnNames: {}'.format(projectName, columnNames))
 
-    # 报错：若选择多于两列，则报错
-    if len(columnNames) != 2:
-        return "请选择两列，目前的选择为" + str(columnNames)
-
     # 读取项目对应的当前数据
     urls = getProjectCurrentDataUrl(projectName)
     if urls == 'error':
         return '项目名或项目路径有误'
     fileUrl = urls['fileUrl']
     projectAddress = urls['projectAddress']
-    if fileUrl[-4:] == ".csv":
-        df = pd.read_csv(fileUrl, encoding="utf-8")
-    else:
-        df = pd.read_excel(fileUrl, encoding="utf-8")
 
-    # 判断所选列的数据类型是否为“数字型”，若不符，返回错误信息
-    acceptTypes = ['int64', 'float64']
-    for columnName in columnNames:
-        if df[columnName].dtype not in acceptTypes:
-            return "只能画出数值型列的散点图，但是列 <" + columnName + "> 的类型为 " + str(df[columnName].dtype)
-    # 写入散点数据
-    col1 = columnNames[0]
-    col2 = columnNames[1]
-    res = {}
-    res.setdefault("keys", [col1, col2])
-    if len(df) > 50:
-        data = df[[col1, col2]].sample(n=50).values.tolist()
-    else:
-        data = df[[col1, col2]].values.tolist()
-    res.setdefault("values", data)
+    # 散点数据：只读取所选两列，抽样或分箱
+    condition = {'columnNames': columnNames, 'sampleSize': request.form.get('sampleSize'),
+                 'bins': request.form.get('bins')}
+    res = ExplorationService.scatter_plot_data(fileUrl[len('file://'):], condition)
+    if isinstance(res, str):
+        return res
 
     # 写入文件
     mkdir(projectAddress + '/散点图')
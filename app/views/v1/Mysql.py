@@ -19,6 +19,7 @@ import os
 from app.Utils import mkdir, getProjectCurrentDataUrl, getProjectByNameAndUserId
 from app.ConstFile import const
 from app.models.ServerNameMap import ServerNameMap
+import app.service.PreviewService as PreviewService
 
 
 # 解决 list, dict 不能返回的问题
@@ -161,9 +162,9 @@ def rawDataPreview():
     except:
         return "error"
     try:
-        data = pd.read_csv(fileUrl, encoding='utf-8')
-        data2 = data[int(start):int(end)].to_json(orient='records', force_ascii=False)
-        return jsonify({'length': len(data), 'data': json.loads(data2)})
+        length, data = PreviewService.get_page(fileUrl[len('file://'):], start, end)
+        data2 = data.to_json(orient='records', force_ascii=False)
+        return jsonify({'length': length, 'data': json.loads(data2)})
     except:
         return "error read"
 
@@ -188,8 +189,8 @@ def currentDataPreview():
     except:
         return "error"
     try:
-        data = pd.read_csv(fileUrl, encoding='utf-8')
-        data2 = data[int(start):int(end)].to_json(orient='records', force_ascii=False)
-        return jsonify({'length': len(data), 'data': json.loads(data2)})
+        length, data = PreviewService.get_page(fileUrl[len('file://'):], start, end)
+        data2 = data.to_json(orient='records', force_ascii=False)
+        return jsonify({'length': length, 'data': json.loads(data2)})
     except:
         return "error read"
@@ -1,5 +1,11 @@
 #!flask/bin/python
+import os
 from app import app
+from app.Utils import init_spark_session
+
+# 启动时创建共享的 SparkSession（debug 模式下只在实际提供服务的子进程中创建）
+if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    init_spark_session()
 app.run(debug=True, host='10.108.211.130', port=8993)
 # app.run(debug=True, host='0.0.0.0', port=8993)
 # app.run(debug=True, host='127.0.0.1', port=8993)
\ No newline at end of file
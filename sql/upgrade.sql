@@ -0,0 +1,51 @@
+-- 数据库升级脚本（MySQL），部署新版本之前按顺序执行
+-- 项目没有使用 db.create_all()，新增的表和修改的列需要手动执行以下语句
+
+-- 算子的父、子算子 id 不再限制长度；算子之间的连线单独建表（见 MSEntity.Operator、MSEntity.OperatorEdge）
+ALTER TABLE operator
+    MODIFY father_operator_ids TEXT,
+    MODIFY child_operator_ids TEXT;
+
+CREATE TABLE IF NOT EXISTS operator_edge (
+    id INT NOT NULL AUTO_INCREMENT,
+    model_id INT,
+    father_operator_id VARCHAR(128),
+    child_operator_id VARCHAR(128),
+    PRIMARY KEY (id),
+    KEY ix_operator_edge_model_id (model_id),
+    KEY ix_operator_edge_father_operator_id (father_operator_id),
+    KEY ix_operator_edge_child_operator_id (child_operator_id)
+) ENGINE = InnoDB DEFAULT CHARSET = utf8;
+
+-- 算子结果缓存（见 MSEntity.OperatorCache）
+CREATE TABLE IF NOT EXISTS operator_cache (
+    id VARCHAR(64) NOT NULL,
+    operator_type_id INT,
+    operator_output_url VARCHAR(512),
+    create_time VARCHAR(32),
+    PRIMARY KEY (id),
+    KEY ix_operator_cache_operator_output_url (operator_output_url)
+) ENGINE = InnoDB DEFAULT CHARSET = utf8;
+
+-- 每次执行中每个算子的运行指标（见 MSEntity.OperatorMetric）
+CREATE TABLE IF NOT EXISTS operator_metric (
+    id INT NOT NULL AUTO_INCREMENT,
+    model_execute_id INT,
+    operator_id VARCHAR(128),
+    operator_type_id INT,
+    status VARCHAR(32),
+    wall_time FLOAT,
+    read_time FLOAT,
+    compute_time FLOAT,
+    write_time FLOAT,
+    rows_in BIGINT,
+    rows_out BIGINT,
+    bytes_read BIGINT,
+    bytes_written BIGINT,
+    spark_jobs INT,
+    spark_stages INT,
+    spark_tasks INT,
+    create_time VARCHAR(32),
+    PRIMARY KEY (id),
+    KEY ix_operator_metric_model_execute_id (model_execute_id)
+) ENGINE = InnoDB DEFAULT CHARSET = utf8;
@@ -0,0 +1,62 @@
+# -*- coding: UTF-8 -*-
+"""
+相关系数：分块流式计算、只计算所选列的结果与 pandas 的 DataFrame.corr 一致
+"""
+import pytest
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+pytest.importorskip('pyspark')
+pytest.importorskip('flask_sqlalchemy')
+
+import app.service.ExplorationService as ExplorationService
+
+
+def sample_df():
+    rng = np.random.RandomState(2)
+    x = rng.normal(loc=1000.0, size=500)
+    df = pd.DataFrame({'x': x, 'y': 3 * x + rng.normal(size=500), 'z': rng.randint(0, 10, size=500).astype('int32'),
+                       'other': rng.normal(size=500)})
+    df.loc[[1, 50, 51], 'x'] = np.nan
+    df.loc[[50, 200], 'y'] = np.nan
+    return df
+
+
+def chunks(df, size):
+    return [df.iloc[i:i + size] for i in range(0, len(df), size)]
+
+
+@pytest.mark.parametrize('chunk_rows', [37, 500])
+def test_pearson_stream(chunk_rows):
+    df = sample_df()
+    column_names = ['x', 'y', 'z']
+    result = ExplorationService.correlation_coefficient_stream(chunks(df[column_names], chunk_rows),
+                                                               {'columnNames': column_names})
+    expected = df[column_names].corr()
+    assert result.index.tolist() == column_names
+    assert np.allclose(result.to_numpy(), expected.to_numpy(), atol=1e-9)
+
+
+@pytest.mark.parametrize('method', ['pearson', 'spearman', 'kendall'])
+def test_core_selected_columns(method):
+    df = sample_df()
+    result = ExplorationService.correlation_coefficient_core(df, {'columnNames': ['x', 'z'], 'method': method})
+    # 只包含所选列
+    assert result.columns.tolist() == ['x', 'z']
+    assert np.allclose(result.to_numpy(), df.corr(method=method).loc[['x', 'z'], ['x', 'z']].to_numpy())
+
+
+def test_not_number_column():
+    df = pd.DataFrame({'x': [1.0, 2.0], 's': ['a', 'b']})
+    result = ExplorationService.correlation_coefficient_stream([df], {'columnNames': ['x', 's']})
+    assert isinstance(result, str)
+
+
+def test_sample_rows():
+    df = sample_df()
+    sample = ExplorationService.sample_rows(chunks(df, 64), 100)
+    assert len(sample) == 100
+    # 抽到的行都来自原数据，且不重复
+    merged = sample.merge(df.reset_index(), how='left', on='other')
+    assert merged['index'].notnull().all()
+    assert merged['index'].is_unique
@@ -0,0 +1,52 @@
+# -*- coding: UTF-8 -*-
+"""
+频次统计（流式）：不同值较少时与 value_counts 完全一致；不同值较多时满足 Misra-Gries 摘要的误差界
+"""
+import pytest
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+pytest.importorskip('pyspark')
+pytest.importorskip('flask_sqlalchemy')
+
+from app.ConstFile import const
+import app.service.ExplorationService as ExplorationService
+
+
+def chunks(df, size):
+    return [df.iloc[i:i + size] for i in range(0, len(df), size)]
+
+
+def test_exact():
+    rng = np.random.RandomState(3)
+    df = pd.DataFrame({'item': rng.choice(['a', 'b', 'c', 'd', None], size=1000, p=[.4, .3, .15, .1, .05])})
+    result, distinct, error = ExplorationService.frequency_statistics_stream(chunks(df, 70),
+                                                                           {'columnName': 'item', 'topK': 3})
+    expected = df['item'].value_counts()
+    assert error == 0
+    assert distinct == 4
+    assert result['item'].tolist() == expected.index[:3].tolist()
+    assert result['频率'].tolist() == expected.values[:3].tolist()
+
+
+def test_sketch_error_bound(monkeypatch):
+    # const 不允许重新赋值，直接替换属性字典中的值
+    monkeypatch.setitem(const.__dict__, 'FREQUENCY_EXACT_LIMIT', 50)
+    monkeypatch.setitem(const.__dict__, 'FREQUENCY_SKETCH_SIZE', 20)
+    rng = np.random.RandomState(4)
+    # 少数高频值 + 大量只出现几次的值，高频值在数据中间才开始出现
+    heavy = np.repeat(np.arange(5), 300)
+    light = rng.randint(1000, 5000, size=3000)
+    values = np.concatenate([light[:1500], heavy, light[1500:]])
+    df = pd.DataFrame({'item': values})
+    result, distinct, error = ExplorationService.frequency_statistics_stream(chunks(df, 200),
+                                                                           {'columnName': 'item', 'topK': 10})
+    expected = df['item'].value_counts()
+    assert 0 < error <= len(df) / (const.FREQUENCY_SKETCH_SIZE + 1)
+    # 计数只会偏小，且不超过 error
+    for value, count in zip(result['item'], result['频率']):
+        assert 0 <= expected[value] - count <= error
+    # 频率超过 error 的值一定保留
+    assert set(expected[expected > error].index) <= set(result['item'])
+    # HyperLogLog 估计的不同值个数
+    assert distinct == pytest.approx(df['item'].nunique(), rel=0.05)
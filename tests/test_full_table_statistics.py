@@ -0,0 +1,54 @@
+# -*- coding: UTF-8 -*-
+"""
+全表统计（full_table_statistics_core）与原来逐列调用 pandas 的结果一致
+"""
+import pytest
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+pytest.importorskip('pyspark')
+pytest.importorskip('flask_sqlalchemy')
+
+import app.service.ExplorationService as ExplorationService
+
+
+def pandas_statistics(column):
+    """
+    原来的实现：每个统计量单独调用一次 pandas（mad 在新版 pandas 中已移除，按定义计算）
+    """
+    return [column.count(), column.min(), column.idxmin(), column.quantile(.25), column.median(),
+            column.quantile(.75), column.mean(), column.max(), column.idxmax(),
+            (column - column.mean()).abs().mean(), column.var(), column.std(), column.skew(), column.kurt()]
+
+
+def test_number_columns():
+    rng = np.random.RandomState(1)
+    df = pd.DataFrame({'a': rng.normal(size=200), 'b': rng.randint(-50, 50, size=200).astype('int32'),
+                       'c': rng.exponential(size=200).astype('float32'), 'd': ['x'] * 200})
+    df.loc[[3, 17, 100], 'a'] = np.nan
+    result = ExplorationService.full_table_statistics_core(df, {'columnNames': ['a', 'b', 'c', 'd']})
+
+    for column_name in ['a', 'b', 'c']:
+        assert result[column_name].iat[0] == 'number'
+        expected = pandas_statistics(df[column_name])
+        actual = result[column_name].tolist()[1:]
+        assert int(actual[0]) == expected[0]
+        # 最小值、最大值位置为行号
+        assert int(actual[2]) == expected[2]
+        assert int(actual[8]) == expected[8]
+        for i in [1, 3, 4, 5, 6, 7, 9, 10, 11, 12, 13]:
+            assert float(actual[i]) == pytest.approx(float(expected[i]), rel=1e-5, abs=1e-9)
+    assert result['d'].tolist()[:2] == ['text', '200']
+
+
+def test_small_and_empty_columns():
+    df = pd.DataFrame({'one': [5.0, np.nan, np.nan, np.nan], 'none': [np.nan] * 4, 'same': [2.0] * 4})
+    result = ExplorationService.full_table_statistics_core(df, {'columnNames': ['one', 'none', 'same']})
+
+    # 只有一个值：方差、偏度、峰度与 pandas 一样为 nan
+    assert result['one'].tolist()[1:3] == ['1', '5.0']
+    assert result['one']['方差'] == 'nan'
+    assert result['none'].tolist()[1] == '0'
+    # 所有值相同：与 pandas 一样偏度、峰度为 0
+    assert float(result['same']['偏度']) == df['same'].skew() == 0
+    assert float(result['same']['峰度']) == df['same'].kurt() == 0
@@ -0,0 +1,87 @@
+# -*- coding: UTF-8 -*-
+"""
+在线预测（LocalPredictService）的解析函数与 spark 预测结果一致
+每种模型在本地 spark 上训练一个小模型并保存，再用 numpy 解析、打分，与 spark 的预测比较
+"""
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('pandas')
+pytest.importorskip('pyarrow')
+pytest.importorskip('pyspark')
+
+from pyspark.sql import SparkSession
+from pyspark.ml.linalg import Vectors
+from pyspark.ml.classification import GBTClassifier, LogisticRegression, MultilayerPerceptronClassifier
+from pyspark.mllib.classification import SVMWithSGD
+from pyspark.mllib.linalg import Vectors as MLLibVectors
+from pyspark.mllib.regression import LabeledPoint
+import app.service.ml.LocalPredictService as LocalPredictService
+
+
+@pytest.fixture(scope='module')
+def spark_session():
+    spark_session = SparkSession.builder.master('local[1]').appName('test_local_predict').getOrCreate()
+    yield spark_session
+    spark_session.stop()
+
+
+def training_rows(num_classes):
+    rng = np.random.RandomState(1)
+    features = rng.uniform(-1.0, 1.0, size=(60, 3))
+    labels = np.floor((features[:, 0] + 1.0) / 2.0 * num_classes).clip(0, num_classes - 1)
+    return features, labels
+
+
+def training_df(spark_session, num_classes):
+    features, labels = training_rows(num_classes)
+    return spark_session.createDataFrame(
+        [(float(labels[i]), Vectors.dense(features[i].tolist())) for i in range(len(labels))], ['label', 'features'])
+
+
+def spark_result(model, df):
+    rows = model.transform(df).select('features', 'prediction').collect()
+    features = np.array([row.features.toArray() for row in rows])
+    return features, [row.prediction for row in rows]
+
+
+def test_svm(spark_session, tmp_path):
+    features, labels = training_rows(2)
+    data = spark_session.sparkContext.parallelize(
+        [LabeledPoint(labels[i], MLLibVectors.dense(features[i].tolist())) for i in range(len(labels))])
+    svm_model = SVMWithSGD.train(data, iterations=10)
+    model_url = str(tmp_path / 'svm')
+    svm_model.save(spark_session.sparkContext, model_url)
+
+    local_model = LocalPredictService.load_svm(model_url)
+    expected = [float(svm_model.predict(x.tolist())) for x in features]
+    assert local_model['score'](features)['prediction'] == expected
+
+
+@pytest.mark.parametrize('num_classes, family', [(2, 'binomial'), (3, 'multinomial')])
+def test_lr(spark_session, tmp_path, num_classes, family):
+    lr_model = LogisticRegression(maxIter=10, family=family).fit(training_df(spark_session, num_classes))
+    model_url = str(tmp_path / 'lr')
+    lr_model.write().overwrite().save(model_url)
+
+    features, expected = spark_result(lr_model, training_df(spark_session, num_classes))
+    assert LocalPredictService.load_lr(model_url)['score'](features)['prediction'] == expected
+
+
+def test_mpc(spark_session, tmp_path):
+    mpc_model = MultilayerPerceptronClassifier(layers=[3, 4, 3], maxIter=20, seed=1) \
+        .fit(training_df(spark_session, 3))
+    model_url = str(tmp_path / 'mpc')
+    mpc_model.write().overwrite().save(model_url)
+
+    features, expected = spark_result(mpc_model, training_df(spark_session, 3))
+    assert LocalPredictService.load_mpc(model_url)['score'](features)['prediction'] == expected
+
+
+def test_gbdt(spark_session, tmp_path):
+    gbdt_model = GBTClassifier(maxIter=5, maxDepth=3, seed=1).fit(training_df(spark_session, 2))
+    model_url = str(tmp_path / 'gbdt')
+    gbdt_model.write().overwrite().save(model_url)
+
+    features, expected = spark_result(gbdt_model, training_df(spark_session, 2))
+    assert LocalPredictService.load_gbdt(model_url)['score'](features)['prediction'] == expected
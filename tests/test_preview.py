@@ -0,0 +1,53 @@
+# -*- coding: UTF-8 -*-
+"""
+分页预览（PreviewService.get_page）与原来整体读取后切片的结果一致
+"""
+import pytest
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+pytest.importorskip('pyarrow')
+pytest.importorskip('pyspark')
+pytest.importorskip('flask_sqlalchemy')
+
+from app.ConstFile import const
+import app.service.PreviewService as PreviewService
+
+
+@pytest.fixture
+def small_index_step(monkeypatch):
+    # const 不允许重新赋值，直接替换属性字典中的值；索引间隔小于页大小，跨多个索引块
+    monkeypatch.setitem(const.__dict__, 'PREVIEW_INDEX_STEP', 7)
+
+
+def sample_df():
+    rng = np.random.RandomState(5)
+    text = ['行' + str(i) for i in range(103)]
+    # 引号内的换行、逗号
+    text[10] = '第一行\n第二行'
+    text[50] = 'a, "b"\n\nc'
+    return pd.DataFrame({'id': np.arange(103), 'value': rng.normal(size=103), 'text': text})
+
+
+@pytest.mark.parametrize('start, end', [(0, 10), (5, 25), (48, 60), (100, 120), (103, 110), (0, 200)])
+def test_csv_page(tmp_path, small_index_step, start, end):
+    file_url = str(tmp_path / 'data.csv')
+    sample_df().to_csv(file_url, index=False)
+
+    length, data = PreviewService.get_page(file_url, start, end)
+    expected = pd.read_csv(file_url)
+    assert length == len(expected)
+    # 超出范围的空页没有列类型
+    pd.testing.assert_frame_equal(data, expected[start:end], check_index_type=False, check_dtype=(start < length))
+
+
+@pytest.mark.parametrize('start, end', [(0, 10), (30, 70), (95, 103)])
+def test_parquet_page(tmp_path, start, end):
+    file_url = str(tmp_path / 'data.parquet')
+    # 每个 row group 20 行，页跨多个 row group
+    sample_df().to_parquet(file_url, index=False, row_group_size=20)
+
+    length, data = PreviewService.get_page(file_url, start, end)
+    expected = pd.read_parquet(file_url)
+    assert length == len(expected)
+    pd.testing.assert_frame_equal(data, expected[start:end], check_index_type=False)
@@ -0,0 +1,58 @@
+# -*- coding: UTF-8 -*-
+"""
+散点图数据：分块抽样、二维分箱与整体读取后计算的结果一致
+"""
+import pytest
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+pytest.importorskip('pyspark')
+pytest.importorskip('flask_sqlalchemy')
+
+import app.service.ExplorationService as ExplorationService
+
+
+def sample_df():
+    rng = np.random.RandomState(6)
+    df = pd.DataFrame({'x': rng.normal(size=1000), 'y': rng.uniform(size=1000), 's': ['a'] * 1000})
+    df.loc[[5, 500], 'x'] = np.nan
+    return df
+
+
+def chunks(df, size):
+    return [df.iloc[i:i + size] for i in range(0, len(df), size)]
+
+
+def test_sample():
+    df = sample_df()
+    result = ExplorationService.scatter_plot_sample(chunks(df[['x', 'y']], 128), ['x', 'y'], 50)
+    assert result['keys'] == ['x', 'y']
+    assert len(result['values']) == 50
+    # 与原来的 dropna 后 sample 一样：抽到的点都是两列都不为空的原始行，且不重复
+    rows = set(map(tuple, df[['x', 'y']].dropna().to_numpy().tolist()))
+    points = list(map(tuple, result['values']))
+    assert set(points) <= rows
+    assert len(set(points)) == 50
+
+
+def test_sample_fewer_rows():
+    df = sample_df()[:20]
+    result = ExplorationService.scatter_plot_sample(chunks(df[['x', 'y']], 8), ['x', 'y'], 50)
+    assert sorted(map(tuple, result['values'])) == sorted(map(tuple, df[['x', 'y']].dropna().to_numpy().tolist()))
+
+
+def test_bins(tmp_path):
+    df = sample_df()
+    file_url = str(tmp_path / 'data.csv')
+    df.to_csv(file_url, index=False)
+    result = ExplorationService.scatter_plot_data(file_url, {'columnNames': ['x', 'y'], 'bins': 8})
+    values = pd.read_csv(file_url)[['x', 'y']].dropna().to_numpy()
+    expected, x_edges, y_edges = np.histogram2d(values[:, 0], values[:, 1], bins=8)
+    assert np.allclose(result['xEdges'], x_edges)
+    assert np.allclose(result['yEdges'], y_edges)
+    assert np.array_equal(np.array(result['counts']), expected.astype('int64'))
+
+
+def test_not_number_column():
+    df = sample_df()
+    assert isinstance(ExplorationService.scatter_plot_sample([df[['x', 's']]], ['x', 's'], 50), str)